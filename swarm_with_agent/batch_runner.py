@@ -0,0 +1,136 @@
+# batch_runner.py - 批量问题运行器
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 问题 id 的命名空间：未显式给出 id 的问题按内容生成 uuid5
+QUESTION_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "swarm_with_agent/batch_runner")
+
+
+def question_id(question: str, occurrence: int = 1) -> str:
+    """按问题内容生成稳定 id，问题文件增删行、重排后 id 不变；重复出现的同一问题加序号区分"""
+    qid = uuid.uuid5(QUESTION_NAMESPACE, question.strip()).hex[:12]
+    return qid if occurrence == 1 else f"{qid}-{occurrence}"
+
+
+def load_questions(path: str) -> List[Dict]:
+    """读取问题文件：.jsonl 每行 {"id": ..., "question": ...}，其他格式每行一个问题
+
+    未给出 id 的问题使用 question_id 生成的内容 id，而不是行号。
+    """
+    questions = []
+    seen: Dict[str, int] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            item = json.loads(line) if path.endswith('.jsonl') else {"question": line}
+            question = item["question"]
+            if item.get("id") is not None:
+                qid = str(item["id"])
+            else:
+                seen[question] = seen.get(question, 0) + 1
+                qid = question_id(question, seen[question])
+            questions.append({"id": qid, "question": question})
+    return questions
+
+
+def load_checkpoint(output_path: str) -> Dict[str, Optional[str]]:
+    """输出文件本身就是断点：返回已成功完成的 {问题 id: 问题文本}，续跑时跳过"""
+    done: Dict[str, Optional[str]] = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 崩溃时可能留下半行
+            if record.get("status") == "success":
+                done[str(record["id"])] = record.get("question")
+    return done
+
+
+async def run_batch(questions_path: str,
+                    output_path: str,
+                    system_factory: Callable[[str], Any],
+                    concurrency: int = 4,
+                    resume: bool = True) -> Dict:
+    """并发运行一批问题，每个问题使用独立的 FinancialAnalysisSystem，结果逐条追加写入 JSONL"""
+    questions = load_questions(questions_path)
+    done = load_checkpoint(output_path) if resume else {}
+    # id 相同但问题文本已改变的记录不算完成
+    todo = [q for q in questions if q["id"] not in done or done[q["id"]] not in (None, q["question"])]
+    print(f"📦 批量运行: 共 {len(questions)} 个问题，已完成 {len(questions) - len(todo)} 个，本次运行 {len(todo)} 个 (并发 {concurrency})")
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    write_lock = asyncio.Lock()
+    summary = {"total": len(questions), "skipped": len(questions) - len(todo), "success": 0, "error": 0}
+
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out:
+
+        pending: List[str] = []
+
+        def append_lines(lines: List[str]):
+            out.write("".join(lines))
+            out.flush()
+            os.fsync(out.fileno())
+
+        async def write_record(record: Dict):
+            """组提交：等待写锁期间到达的记录合并为一次写入，flush/fsync 在线程中执行，不阻塞事件循环
+
+            返回时该记录已落盘（可能是由前一批写入的）。
+            """
+            pending.append(json.dumps(record, ensure_ascii=False) + "\n")
+            async with write_lock:
+                if not pending:
+                    return
+                lines = pending[:]
+                pending.clear()
+                await asyncio.to_thread(append_lines, lines)
+
+        async def run_one(item: Dict):
+            async with semaphore:
+                record = {
+                    "id": item["id"],
+                    "question": item["question"],
+                    "started_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                start = time.perf_counter()
+                try:
+                    system = system_factory(f"batch-{item['id']}")
+                    answer = await system.run_turn(item["question"])
+                    usage = getattr(system, "last_turn_usage", {}) or {}
+                    record.update({
+                        "status": "success",
+                        "answer": answer,
+                        # token 数包含工具内嵌智能体（financial_agent / text_agent）的用量，nested_* 为其中的内嵌部分
+                        "prompt_tokens": usage.get("prompt_tokens", 0),
+                        "completion_tokens": usage.get("completion_tokens", 0),
+                        "nested_prompt_tokens": usage.get("nested_prompt_tokens", 0),
+                        "nested_completion_tokens": usage.get("nested_completion_tokens", 0),
+                        "messages": usage.get("messages", 0),
+                    })
+                    summary["success"] += 1
+                except Exception as e:
+                    logger.error(f"批量问题 {item['id']} 运行失败: {e}")
+                    record.update({"status": "error", "error": str(e)})
+                    summary["error"] += 1
+                record["elapsed"] = round(time.perf_counter() - start, 3)
+                await write_record(record)
+                print(f"   {'✅' if record['status'] == 'success' else '❌'} [{item['id']}] {record['elapsed']}s")
+
+        await asyncio.gather(*[run_one(item) for item in todo])
+
+    print(f"📦 批量运行结束: 成功 {summary['success']}，失败 {summary['error']}，跳过 {summary['skipped']}")
+    return summary
@@ -0,0 +1,69 @@
+# bench_import_time.py - 启动导入耗时基准：确认导入模块时不会拉起 matplotlib/seaborn/pandas/numpy
+# 用法: python bench_import_time.py [-n 5] [--max-ms 300] [模块名 ...]（默认检查 DEFAULT_BUDGETS 中的模块）
+# 超过阈值或加载了重量级依赖时以非零状态退出，可放在 CI 中防止启动变慢
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["matplotlib", "seaborn", "pandas", "numpy"]
+
+# 各模块的导入耗时上限（毫秒）。web_search_agent 导入时会加载 aiohttp/requests/bs4
+# 并创建全局搜索实例，网络栈本身约 250-350ms，因此单独放宽；它同样不允许拉起绘图依赖
+DEFAULT_BUDGETS = {"visualization_agent": 300.0, "web_search_agent": 600.0}
+
+# 在全新的解释器中导入目标模块，报告耗时以及哪些重量级依赖被加载
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{
+    "ms": elapsed,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+    "charts_dir_created": os.path.isdir("charts"),
+}}))
+"""
+
+
+def measure(module: str, workdir: str) -> dict:
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模块导入耗时基准")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS))
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="导入耗时中位数上限（毫秒），默认按 DEFAULT_BUDGETS，未列出的模块为 300")
+    parser.add_argument("--workdir", default=None, help="在该目录下运行（默认临时目录，用于检查是否创建 charts 目录）")
+    args = parser.parse_args()
+
+    import tempfile
+    workdir = args.workdir or tempfile.mkdtemp(prefix="import_bench_")
+    failed = False
+    for module in args.modules:
+        runs = [measure(module, workdir) for _ in range(args.runs)]
+        median = statistics.median(r["ms"] for r in runs)
+        max_ms = args.max_ms if args.max_ms is not None else DEFAULT_BUDGETS.get(module, 300.0)
+        heavy = sorted({m for r in runs for m in r["heavy"]})
+        charts_dir = any(r["charts_dir_created"] for r in runs)
+        ok = median <= max_ms and not heavy and not charts_dir
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} import {module}: 中位数 {median:.1f}ms "
+              f"(最小 {min(r['ms'] for r in runs):.1f}ms, {args.runs} 次, 上限 {max_ms:.0f}ms)")
+        if heavy:
+            print(f"   ⚠️ 导入时加载了重量级依赖: {', '.join(heavy)}")
+        if charts_dir:
+            print("   ⚠️ 导入时创建了 charts 目录")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
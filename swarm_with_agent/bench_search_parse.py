@@ -0,0 +1,78 @@
+# bench_search_parse.py - 搜索结果页解析性能对比（BeautifulSoup vs lxml 单遍解析）
+# 用法: python bench_search_parse.py [页面目录或html文件...] [-n 迭代次数]
+import argparse
+import glob
+import os
+import statistics
+import time
+
+from web_search_agent import BaiduSearchAgent, HAS_LXML
+
+DEFAULT_PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_data", "search_pages")
+
+
+def collect_pages(paths):
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            pages.extend(sorted(glob.glob(os.path.join(path, "*.html"))))
+        elif os.path.exists(path):
+            pages.append(path)
+    return pages
+
+
+def time_parse(agent: BaiduSearchAgent, html: str, iterations: int):
+    """返回 (中位耗时毫秒, 解析结果)"""
+    timings = []
+    results = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        results = agent._parse_html(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比搜索结果页的解析耗时")
+    parser.add_argument("paths", nargs="*", default=[DEFAULT_PAGES_DIR], help="保存的搜索结果页（目录或文件）")
+    parser.add_argument("-n", "--iterations", type=int, default=50, help="每个页面每种解析器的迭代次数")
+    args = parser.parse_args()
+
+    pages = collect_pages(args.paths)
+    if not pages:
+        print(f"❌ 没有找到搜索结果页: {args.paths}")
+        return
+    if not HAS_LXML:
+        print("⚠️ 未安装 lxml，只能测试 BeautifulSoup 解析 (pip install lxml)")
+
+    backends = ["bs4", "lxml"] if HAS_LXML else ["bs4"]
+    agents = {name: BaiduSearchAgent(parser_backend=name) for name in backends}
+
+    print(f"📊 解析 {len(pages)} 个页面，每个 {args.iterations} 次，取中位数")
+    print(f"{'页面':<32}{'大小':>8}" + "".join(f"{name + '(ms)':>12}{'结果数':>8}" for name in backends) + f"{'加速比':>8}")
+    totals = {name: 0.0 for name in backends}
+    for page in pages:
+        with open(page, "r", encoding="utf-8") as f:
+            html = f.read()
+        row = f"{os.path.basename(page)[:30]:<32}{len(html) // 1024:>6}KB"
+        timings = {}
+        titles = {}
+        for name in backends:
+            elapsed, results = time_parse(agents[name], html, args.iterations)
+            timings[name] = elapsed
+            titles[name] = [r["title"] for r in results]
+            totals[name] += elapsed
+            row += f"{elapsed:>12.2f}{len(results):>8}"
+        if HAS_LXML:
+            row += f"{timings['bs4'] / timings['lxml']:>7.1f}x"
+            if titles["bs4"] != titles["lxml"]:
+                row += "  ⚠️ 结果不一致"
+        print(row)
+
+    if HAS_LXML:
+        print(f"✅ 合计: bs4 {totals['bs4']:.2f}ms, lxml {totals['lxml']:.2f}ms, "
+              f"加速 {totals['bs4'] / totals['lxml']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
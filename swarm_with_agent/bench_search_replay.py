@@ -0,0 +1,79 @@
+# bench_search_replay.py - 基于离线回放服务的搜索链路基准（抓取 + 限流 + 重试 + 解析 + 缓存）
+# 用法: python bench_search_replay.py -n 200 -c 16 --latency 0.02 0.1 --error-rate 0.05 --seed 1
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from search_fixture_server import FixtureConfig, start_fixture_server
+from web_search_agent import BaiduSearchAgent, SearchRecorder, SearchResultCache
+
+DEFAULT_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_data", "search_pages")
+
+
+async def run_bench(args):
+    recorder = SearchRecorder(args.fixture_dir)
+    queries = [entry["query"] for entry in recorder.index.values()]
+    if not queries:
+        print(f"❌ {args.fixture_dir} 中没有录制的查询，请先以 SEARCH_MODE=record 运行一次")
+        return
+
+    config = FixtureConfig(latency=tuple(args.latency), error_rate=args.error_rate,
+                           throttle_rate=args.throttle_rate, retry_after=0.2, seed=args.seed)
+    runner, url = await start_fixture_server(args.fixture_dir, port=args.port, config=config)
+    cache = SearchResultCache(db_path=os.path.join(args.workdir, "bench_search_cache.db")) if args.cache else None
+    agent = BaiduSearchAgent(base_url=url, cache=cache, rate_limit=args.rate_limit, burst=args.concurrency,
+                             backoff_base=0.05, backoff_max=1.0)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    fallbacks = 0
+
+    async def one(i: int):
+        nonlocal fallbacks
+        async with semaphore:
+            start = time.perf_counter()
+            results = await agent.search_results(queries[i % len(queries)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            if results and results[0]["source"] == "系统提示":
+                fallbacks += 1
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[one(i) for i in range(args.requests)])
+    finally:
+        elapsed = time.perf_counter() - start
+        await agent.aclose()
+        await runner.cleanup()
+
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"📊 {args.requests} 次搜索 / 并发 {args.concurrency} / {len(queries)} 个录制查询")
+    print(f"   总耗时 {elapsed:.2f}s，吞吐 {args.requests / elapsed:.1f} 次/秒")
+    print(f"   延迟 p50 {statistics.median(latencies):.1f}ms，p95 {p95:.1f}ms，最大 {latencies[-1]:.1f}ms")
+    print(f"   备用结果 {fallbacks} 次")
+    print(f"   agent: {agent.stats}")
+    print(f"   server: {runner.app['stats']}")
+    if cache is not None:
+        print(f"   cache: {cache.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线搜索链路基准")
+    parser.add_argument("--fixture-dir", default=DEFAULT_FIXTURE_DIR)
+    parser.add_argument("--workdir", default="./local_data")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-n", "--requests", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit", type=float, default=1000.0, help="每秒请求数上限（默认基本不限流）")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.0, 0.0], metavar=("MIN", "MAX"))
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="启用搜索结果缓存")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run_bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
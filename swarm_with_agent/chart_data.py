@@ -0,0 +1,280 @@
+# chart_data.py - 图表的结构化数据来源：数据库指标、SQL 结果和数据库句柄
+import json
+import logging
+import os
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 图表可直接读取的数据库（相对当前工作目录），可用 CHART_DB_PATHS 覆盖（os.pathsep 分隔）
+DEFAULT_DB_PATHS = ["./local_data/financial.db", "./local_data/financial_data.db"]
+
+# 指标目录: 图表名称 → (annual_reports 列名, financial_records 科目名匹配规则(按优先级), 是否为金额)
+# annual_reports 金额单位为亿元；financial_records 为元，读取时统一换算为亿元
+METRICS = {
+    "Revenue": ("total_revenue", [r"^(一、)?营业总收入$", r"^(其中：)?营业收入$"], True),
+    "Net Profit": ("net_profit", [r"^(五、)?净利润"], True),
+    "Total Assets": ("total_assets", [r"^资产总计$"], True),
+    "Total Liabilities": ("total_liabilities", [r"^负债合计$"], True),
+    "R&D Expenses": ("rd_expenses", [r"^研发费用$"], True),
+    "Employees": ("employees", [], False),
+}
+
+# 未指定指标时只取金额类指标，员工人数与亿元不在同一量级
+DEFAULT_METRICS = [metric for metric, (_, _, is_amount) in METRICS.items() if is_amount]
+
+# 中文别名，便于 LLM 或用户用中文指定指标
+METRIC_ALIASES = {
+    "营业收入": "Revenue", "营收": "Revenue", "收入": "Revenue",
+    "净利润": "Net Profit", "利润": "Net Profit",
+    "总资产": "Total Assets", "总负债": "Total Liabilities",
+    "研发费用": "R&D Expenses", "研发投入": "R&D Expenses",
+    "员工人数": "Employees", "员工": "Employees",
+}
+
+YUAN_PER_YI = 1e8
+
+
+def db_paths() -> List[str]:
+    paths = os.environ.get("CHART_DB_PATHS")
+    return paths.split(os.pathsep) if paths else DEFAULT_DB_PATHS
+
+
+def normalize_metric(name: str) -> Optional[str]:
+    name = name.strip()
+    if name in METRICS:
+        return name
+    if name in METRIC_ALIASES:
+        return METRIC_ALIASES[name]
+    lowered = name.lower()
+    for metric, (column, _, _) in METRICS.items():
+        if lowered in (metric.lower(), column):
+            return metric
+    return None
+
+
+def _connect_readonly(path: str):
+    return sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+
+
+def _tables(conn) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+
+def _pick_record_item(metric: str, items: Iterable[str]) -> Optional[str]:
+    """按优先级规则从 financial_records 的科目名中挑出代表该指标的一项"""
+    items = list(items)
+    for pattern in METRICS[metric][1]:
+        for item in items:
+            if re.search(pattern, item.strip()):
+                return item
+    return None
+
+
+def load_metric_rows(companies: List[str], metrics: Optional[List[str]] = None,
+                     years: Optional[List[str]] = None) -> List[Tuple[str, str, str, float]]:
+    """一次查询取出若干公司、若干年份的指标，返回 (公司, 年份, 指标, 数值) 列表
+
+    每个数据库的每张表只执行一条带 IN 条件的查询；annual_reports 优先，
+    financial_records 只补充 annual_reports 中没有的 (公司, 年份, 指标)。
+    同一 公司/年份 有多条记录（或同一科目出现多次）时，以最后写入（rowid 最大）的一条为准。
+    metrics 为 None 时取 DEFAULT_METRICS；包含未知指标时抛出 ValueError。
+    """
+    metrics = DEFAULT_METRICS if metrics is None else list(metrics)
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError(f"未知指标: {', '.join(map(str, unknown))}；可用指标: {', '.join(METRICS)}")
+    if not companies or not metrics:
+        return []
+    years = [str(y) for y in years] if years else None
+    company_marks = ", ".join("?" * len(companies))
+    year_clause = f" AND CAST(year AS TEXT) IN ({', '.join('?' * len(years))})" if years else ""
+
+    values: Dict[Tuple[str, str, str], float] = {}
+    for path in db_paths():
+        if not os.path.exists(path):
+            continue
+        conn = _connect_readonly(path)
+        try:
+            tables = _tables(conn)
+            if "annual_reports" in tables:
+                columns = [METRICS[m][0] for m in metrics]
+                rows = conn.execute(
+                    f"SELECT company_name, CAST(year AS TEXT), {', '.join(columns)} FROM annual_reports "
+                    f"WHERE company_name IN ({company_marks}){year_clause} ORDER BY rowid DESC",
+                    [*companies, *(years or [])]).fetchall()
+                for company, year, *numbers in rows:
+                    for metric, number in zip(metrics, numbers):
+                        if number is not None:
+                            values.setdefault((company, year, metric), float(number))
+
+            record_metrics = [m for m in metrics if METRICS[m][1]]
+            if "financial_records" in tables and record_metrics:
+                rows = conn.execute(
+                    f"SELECT company_name, CAST(year AS TEXT), item_name, amount FROM financial_records "
+                    f"WHERE company_name IN ({company_marks}){year_clause} AND amount IS NOT NULL "
+                    f"ORDER BY rowid DESC",
+                    [*companies, *(years or [])]).fetchall()
+                by_period: Dict[Tuple[str, str], Dict[str, float]] = {}
+                for company, year, item, amount in rows:
+                    # 按 rowid 倒序读取，setdefault 保留的是该科目最后写入的数值
+                    by_period.setdefault((company, year), {}).setdefault(item, amount)
+                for (company, year), items in by_period.items():
+                    for metric in record_metrics:
+                        item = _pick_record_item(metric, items)
+                        if item is not None:
+                            amount = items[item] / YUAN_PER_YI if METRICS[metric][2] else items[item]
+                            values.setdefault((company, year, metric), round(amount, 4))
+        except sqlite3.Error as e:
+            logger.error(f"读取图表数据失败 {path}: {e}")
+        finally:
+            conn.close()
+
+    return [(company, year, metric, value) for (company, year, metric), value in values.items()]
+
+
+def load_metrics(company: str, year, metrics: Optional[List[str]] = None) -> Dict[str, float]:
+    """读取单个 公司/年份 的指标，按 METRICS 的顺序返回 {指标: 数值(亿元)}"""
+    found = {metric: value for _, _, metric, value in load_metric_rows([company], metrics, [str(year)])}
+    return {metric: found[metric] for metric in METRICS if metric in found}
+
+
+def load_metric_series(companies: List[str], metric: str,
+                       years: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """读取多家公司某指标的多年序列，返回 {公司: {年份: 数值}}（年份升序，公司按传入顺序）
+
+    所有公司和年份在同一次 load_metric_rows 中取出，不逐年逐公司查询。
+    """
+    series: Dict[str, Dict[str, float]] = {company: {} for company in companies}
+    for company, year, _, value in load_metric_rows(companies, [metric], years):
+        series[company][year] = value
+    return {company: dict(sorted(values.items())) for company, values in series.items() if values}
+
+
+def yoy_growth(values: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """按年份计算同比增长率(%)，首年、年份不连续或上年为 0 时为 None"""
+    growth: Dict[str, Optional[float]] = {}
+    previous_year, previous = None, None
+    for year, value in sorted(values.items()):
+        consecutive = previous_year is not None and year.isdigit() and int(year) == int(previous_year) + 1
+        growth[year] = (value - previous) / abs(previous) * 100 if consecutive and previous else None
+        previous_year, previous = year, value
+    return growth
+
+
+def parse_years(text: str) -> Optional[List[str]]:
+    """把 "2020-2024"、"2021,2023" 之类的年份描述展开成年份列表，为空表示不限年份"""
+    text = (text or "").strip()
+    span = re.fullmatch(r'((?:19|20)\d{2})\s*[-~至到]\s*((?:19|20)\d{2})', text)
+    if span:
+        start, end = sorted(int(y) for y in span.groups())
+        return [str(y) for y in range(start, end + 1)]
+    return re.findall(r'(?:19|20)\d{2}', text) or None
+
+
+def known_companies() -> List[str]:
+    companies = set()
+    for path in db_paths():
+        if not os.path.exists(path):
+            continue
+        conn = _connect_readonly(path)
+        try:
+            for table in _tables(conn) & {"annual_reports", "financial_records"}:
+                companies.update(row[0] for row in conn.execute(f"SELECT DISTINCT company_name FROM {table}"))
+        finally:
+            conn.close()
+    return sorted(companies)
+
+
+def run_select(sql: str) -> Dict[str, float]:
+    """以只读方式执行 SELECT，把结果转成 {标签: 数值}
+
+    两列结果按 (标签, 数值) 读取；单行多列结果按 列名 → 数值 读取。
+    """
+    if not re.match(r'^\s*(SELECT|WITH)\b', sql, re.IGNORECASE) or ";" in sql.strip().rstrip(";"):
+        raise ValueError("只允许单条 SELECT 查询")
+    last_error = None
+    for path in db_paths():
+        if not os.path.exists(path):
+            continue
+        conn = _connect_readonly(path)
+        try:
+            cursor = conn.execute(sql)
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchmany(50)
+        except sqlite3.Error as e:
+            last_error = e  # 表可能在另一个数据库中
+            continue
+        finally:
+            conn.close()
+        if len(columns) == 2 and rows:
+            return {str(label): float(value) for label, value in rows if isinstance(value, (int, float))}
+        if len(rows) == 1:
+            return {col: float(val) for col, val in zip(columns, rows[0]) if isinstance(val, (int, float))}
+        return {}
+    raise ValueError(f"SQL 执行失败: {last_error}")
+
+
+# ==================== 数据库句柄 ====================
+
+def db_handle(company: str, year) -> str:
+    """指向数据库中某 公司/年份 指标的句柄，智能体之间只传递句柄而不是数字文本"""
+    return f"db:{company}:{year}"
+
+
+def resolve_handle(handle: str) -> Optional[Dict]:
+    handle = handle.strip()
+    if handle.startswith("db:"):
+        parts = handle.split(":")
+        if len(parts) == 3:
+            return {"metrics": load_metrics(parts[1], parts[2]), "company": parts[1], "year": parts[2],
+                    "source": "database"}
+    return None
+
+
+def resolve_chart_input(data: str) -> Optional[Dict]:
+    """解析 generate_chart 的结构化输入；不是结构化输入时返回 None（退回文本解析）
+
+    支持:
+    - 句柄: "db:比亚迪:2023"
+    - JSON: {"metrics": {"Revenue": 6023, ...}, "company": ..., "year": ...}
+            {"handle": "..."}
+            {"company": "比亚迪", "year": 2023, "metrics": ["Revenue", "净利润"]}（从数据库读取）
+            {"sql": "SELECT item, value FROM ..."}
+    返回 {"metrics": {...}, "company": ..., "year": ..., "source": ...}
+    """
+    text = data.strip()
+    if re.match(r'^db:\S+$', text):
+        return resolve_handle(text)
+    if not text.startswith("{"):
+        return None
+    try:
+        spec = json.loads(text)
+    except ValueError:
+        return None
+
+    if spec.get("handle"):
+        return resolve_handle(spec["handle"])
+    company, year = spec.get("company", ""), str(spec.get("year", ""))
+    if spec.get("sql"):
+        return {"metrics": run_select(spec["sql"]), "company": company, "year": year, "source": "sql"}
+
+    metrics = spec.get("metrics")
+    if isinstance(metrics, dict):
+        values = {str(k): float(v) for k, v in metrics.items() if isinstance(v, (int, float))}
+        return {"metrics": values, "company": company, "year": year, "source": spec.get("source", "json")}
+    if company and year:
+        names = None
+        if isinstance(metrics, list) and metrics:
+            names = [normalize_metric(str(m)) for m in metrics]
+            unknown = [str(m) for m, name in zip(metrics, names) if name is None]
+            names = [name for name in names if name]
+            if not names:
+                raise ValueError(f"未知指标: {', '.join(unknown)}；可用指标: {', '.join(METRICS)}")
+            if unknown:
+                logger.warning(f"忽略未知指标: {', '.join(unknown)}")
+        return {"metrics": load_metrics(company, year, names), "company": company, "year": year,
+                "source": "database"}
+    return None
@@ -0,0 +1,108 @@
+# data_collection.py - 年报数据批量采集：登记表检查 → 用户上传 → 网络爬取 → 保存
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from data_registry import DataRegistry
+
+logger = logging.getLogger(__name__)
+
+# 单项采集结果的状态；"模拟数据" 表示已保存但不是真实数据，未登记为可用
+STATUS_READY = "已就绪"
+STATUS_SUCCESS = "成功"
+STATUS_SIMULATED = "模拟数据"
+STATUS_FAILED = "失败"
+
+
+def parse_collection_targets(targets: str) -> List[Tuple[str, str]]:
+    """解析 '华为:2023, 腾讯:2022-2024, 美团:2023/2024' 形式的采集目标，返回去重后的 (公司, 年份) 列表"""
+    pairs = []
+    for item in re.split(r'[,，;；\n]+', targets):
+        if not item.strip():
+            continue
+        company, _, years_part = item.partition(':') if ':' in item else item.partition('：')
+        company = company.strip()
+        years = []
+        for token in re.split(r'[/、\s]+', years_part.strip()):
+            span = re.fullmatch(r'(\d{4})\s*[-~至到]\s*(\d{4})', token)
+            if span:
+                start, end = sorted((int(span.group(1)), int(span.group(2))))
+                years.extend(str(y) for y in range(start, end + 1))
+            elif re.fullmatch(r'\d{4}', token):
+                years.append(token)
+        for year in years:
+            if company and (company, year) not in pairs:
+                pairs.append((company, year))
+    return pairs
+
+
+class DataCollector:
+    """按 公司/年份 补齐数据：已登记的直接跳过，其次使用用户上传的PDF，最后爬取并保存
+
+    各步骤以回调注入（与 UploadWatcher 的入库回调相同），便于在测试中替换爬取函数。
+    """
+
+    def __init__(self,
+                 registry: DataRegistry,
+                 check_upload: Callable[[str, str], Awaitable[Dict]],
+                 ingest_upload: Callable[[str], Awaitable[Dict]],
+                 scrape: Callable[[str, str], Awaitable[Dict]],
+                 save: Callable[[Dict], Awaitable[str]]):
+        self.registry = registry
+        self.check_upload = check_upload
+        self.ingest_upload = ingest_upload
+        self.scrape = scrape
+        self.save = save
+
+    async def collect_one(self, company: str, year: str, semaphore: asyncio.Semaphore) -> Dict:
+        """单个 公司/年份 的完整采集流程"""
+        if self.registry.has_data(company, year):
+            return {"company": company, "year": year, "status": STATUS_READY, "source": "本地已有",
+                    "detail": "无需重新采集"}
+
+        async with semaphore:
+            try:
+                upload = await self.check_upload(company, year)
+                if upload["has_pdf"]:
+                    local_path = upload.get("local_path")
+                    if not local_path:
+                        ingested = await self.ingest_upload(upload["file_path"])
+                        local_path = ingested.get("local_path")
+                    return {"company": company, "year": year, "status": STATUS_SUCCESS, "source": "用户上传",
+                            "detail": local_path}
+
+                data = await self.scrape(company, year)
+                if data.get("status") != "success":
+                    return {"company": company, "year": year, "status": STATUS_FAILED, "source": "网络爬取",
+                            "detail": "爬取未返回有效数据"}
+                saved = await self.save(data)
+                if self.registry.has_data(company, year):
+                    status = STATUS_SUCCESS
+                else:
+                    status = STATUS_SIMULATED if data.get("simulated") else STATUS_FAILED
+                return {"company": company, "year": year, "status": status, "source": "网络爬取", "detail": saved}
+            except Exception as e:
+                logger.error(f"批量采集 {company} {year} 失败: {e}")
+                return {"company": company, "year": year, "status": STATUS_FAILED, "source": "-", "detail": str(e)}
+
+    async def collect_batch(self, pairs: List[Tuple[str, str]], max_concurrency: int = 4) -> List[Dict]:
+        """并发采集多个 公司/年份，结果顺序与 pairs 一致"""
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        return list(await asyncio.gather(*[self.collect_one(company, year, semaphore) for company, year in pairs]))
+
+
+def format_collection_report(results: List[Dict]) -> str:
+    """把批量采集结果整理成 Markdown 汇总表"""
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in (STATUS_SUCCESS, STATUS_READY, STATUS_SIMULATED, STATUS_FAILED)}
+    summary = (f"批量数据采集完成：共 {len(results)} 项，成功/已就绪 {counts[STATUS_SUCCESS] + counts[STATUS_READY]} 项，"
+               f"失败 {counts[STATUS_FAILED]} 项。")
+    if counts[STATUS_SIMULATED]:
+        summary += f"另有 {counts[STATUS_SIMULATED]} 项只有模拟数据，不可用于分析，需上传年报PDF或导入数据库。"
+    lines = [summary,
+             "| 公司 | 年份 | 状态 | 来源 | 说明 |",
+             "| --- | --- | --- | --- | --- |"]
+    for r in results:
+        lines.append(f"| {r['company']} | {r['year']} | {r['status']} | {r['source']} | {r['detail']} |")
+    return "\n".join(lines)
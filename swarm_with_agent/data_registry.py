@@ -0,0 +1,225 @@
+# data_registry.py - 数据可用性登记表
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+YEAR_PATTERN = re.compile(r'(?:19|20)\d{2}')
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS data_availability (
+    company TEXT NOT NULL,          -- 公司名称
+    year TEXT NOT NULL,             -- 年份
+    db_rows INTEGER DEFAULT 0,      -- 数据库中的记录行数
+    processed_json TEXT,            -- 处理后的JSON路径
+    raw_pdf TEXT,                   -- 原始PDF路径
+    db_updated_at REAL,             -- 数据库记录登记时间
+    json_updated_at REAL,           -- JSON文件修改时间
+    pdf_updated_at REAL,            -- PDF文件修改时间
+    updated_at REAL,                -- 本条登记最后更新时间
+    PRIMARY KEY (company, year)
+);
+"""
+
+FIELDS = ["db_rows", "processed_json", "raw_pdf",
+          "db_updated_at", "json_updated_at", "pdf_updated_at", "updated_at"]
+
+
+class DataRegistry:
+    """记录每个 公司/年份 已有哪些数据：数据库行、处理后的JSON、原始PDF及更新时间
+
+    登记表持久化在独立的 SQLite 文件中（不放进财务数据库，避免 SQL 智能体把它当成业务表查询），
+    启动时整体加载到内存字典，构建 Prompt 时 O(1) 查询。
+    source_db_path 是财务数据库，scan_sources 只从中读取行数。
+    """
+
+    def __init__(self, db_path: str, source_db_path: Optional[str] = None):
+        self.db_path = db_path
+        self.source_db_path = source_db_path
+        self._records: Dict[Tuple[str, str], Dict] = {}
+        self._companies: set = set()
+        self._ensure_table()
+        self._load()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _ensure_table(self):
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute(CREATE_TABLE_SQL)
+        conn.commit()
+        conn.close()
+
+    def _load(self):
+        conn = self._connect()
+        rows = conn.execute(f"SELECT company, year, {', '.join(FIELDS)} FROM data_availability").fetchall()
+        conn.close()
+        for row in rows:
+            self._records[(row[0], row[1])] = dict(zip(FIELDS, row[2:]))
+            self._companies.add(row[0])
+        logger.info(f"数据登记表加载完成: {len(self._records)} 条记录")
+
+    # ---------- 写入 ----------
+    def record(self, company: str, year, **fields) -> Dict:
+        """登记/更新一条数据可用性记录，未给出的字段保持原值"""
+        key = (company, str(year))
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"未知的登记字段: {unknown}")
+
+        entry = dict(self._records.get(key) or {field: None for field in FIELDS})
+        entry.update(fields)
+        entry["db_rows"] = entry.get("db_rows") or 0
+        entry["updated_at"] = time.time()
+
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO data_availability (company, year, {', '.join(FIELDS)}) "
+            f"VALUES (?, ?, {', '.join('?' * len(FIELDS))})",
+            (key[0], key[1], *[entry[field] for field in FIELDS])
+        )
+        conn.commit()
+        conn.close()
+
+        self._records[key] = entry
+        self._companies.add(company)
+        return entry
+
+    def record_json(self, company: str, year, path: str) -> bool:
+        """登记处理后的JSON；模拟数据（"simulated": true）不登记，返回是否已登记"""
+        if _is_simulated(path):
+            return False
+        self.record(company, year, processed_json=path, json_updated_at=_mtime(path))
+        return True
+
+    def record_pdf(self, company: str, year, path: str):
+        self.record(company, year, raw_pdf=path, pdf_updated_at=_mtime(path))
+
+    def record_db_rows(self, company: str, year, rows: int):
+        self.record(company, year, db_rows=rows, db_updated_at=time.time())
+
+    # ---------- 扫描已有数据源 ----------
+    def scan_sources(self, local_data_dir: str = "./local_data", upload_dir: str = "./user_uploads",
+                     tables: Iterable[str] = ("annual_reports", "financial_records")):
+        """扫描数据库、processed.json 和上传的PDF，补齐登记表（启动时调用一次）
+
+        模拟数据（"simulated": true）的 JSON 不登记，避免阻止真实采集。
+        """
+        db_counts: Dict[Tuple[str, str], int] = {}
+        if self.source_db_path and os.path.exists(self.source_db_path):
+            # 财务数据库只读打开，登记表不会对它执行任何写入或 DDL
+            conn = sqlite3.connect(f"file:{os.path.abspath(self.source_db_path)}?mode=ro", uri=True,
+                                   check_same_thread=False)
+            try:
+                existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                for table in tables:
+                    if table not in existing:
+                        continue
+                    for company, year, count in conn.execute(
+                            f"SELECT company_name, year, COUNT(*) FROM {table} GROUP BY company_name, year"):
+                        key = (company, str(year))
+                        db_counts[key] = db_counts.get(key, 0) + count
+            finally:
+                conn.close()
+
+        for (company, year), count in db_counts.items():
+            current = self.get(company, year)
+            if not current or current.get("db_rows") != count:
+                self.record_db_rows(company, year, count)
+
+        for path in glob.glob(os.path.join(local_data_dir, "*_processed.json")):
+            company, year = parse_company_year(os.path.basename(path))
+            if company and (self.get(company, year) or {}).get("json_updated_at") != _mtime(path):
+                self.record_json(company, year, path)
+
+        for path in glob.glob(os.path.join(upload_dir, "*.pdf")):
+            company, year = parse_company_year(os.path.basename(path))
+            if company and (self.get(company, year) or {}).get("pdf_updated_at") != _mtime(path):
+                self.record_pdf(company, year, path)
+
+    # ---------- 查询 ----------
+    def get(self, company: str, year) -> Optional[Dict]:
+        return self._records.get((company, str(year)))
+
+    def has_data(self, company: str, year) -> bool:
+        entry = self.get(company, year)
+        return bool(entry and (entry["db_rows"] or entry["processed_json"]))
+
+    def has_db_rows(self, company: str, year) -> bool:
+        """数据库中有该 公司/年份 的财务记录"""
+        entry = self.get(company, year)
+        return bool(entry and entry["db_rows"])
+
+    def has_text(self, company: str, year) -> bool:
+        """有处理后的年报文本JSON"""
+        entry = self.get(company, year)
+        return bool(entry and entry["processed_json"])
+
+    def companies(self) -> set:
+        return self._companies
+
+    def years_of(self, company: str) -> List[str]:
+        return sorted(year for (name, year) in self._records if name == company)
+
+    def find_entities(self, text: str) -> Tuple[List[str], List[str]]:
+        """从文本中找出已登记的公司名和年份"""
+        companies = [company for company in self._companies if company and company in text]
+        years = sorted(set(YEAR_PATTERN.findall(text)))
+        return companies, years
+
+    def format_status(self, text: str) -> str:
+        """为当前问题涉及的 公司/年份 生成数据可用性说明，供 planner 决定是否需要采集"""
+        companies, years = self.find_entities(text)
+        lines = ["【数据可用性登记】:"]
+        if not companies:
+            lines.append("- 当前问题未涉及已登记的公司，如涉及新公司需先进行数据采集")
+            known = ", ".join(sorted(f"{c}{y}" for (c, y) in self._records if self.has_data(c, y)))
+            if known:
+                lines.append(f"- 已有数据: {known}")
+            return "\n".join(lines)
+
+        for company in companies:
+            for year in (years or self.years_of(company)):
+                entry = self.get(company, year)
+                if not entry:
+                    lines.append(f"- {company} {year}: 未登记，需要数据采集")
+                    continue
+                db_part = f"数据库✅({entry['db_rows']}行)" if entry["db_rows"] else "数据库❌"
+                json_part = "文本JSON✅" if entry["processed_json"] else "文本JSON❌"
+                pdf_part = "原始PDF✅" if entry["raw_pdf"] else "原始PDF❌"
+                updated = datetime.fromtimestamp(entry["updated_at"]).strftime("%Y-%m-%d %H:%M")
+                verdict = "已就绪，无需重新采集" if self.has_data(company, year) else "需要数据采集"
+                lines.append(f"- {company} {year}: {db_part} | {json_part} | {pdf_part} | 更新于 {updated} → {verdict}")
+        return "\n".join(lines)
+
+
+def parse_company_year(filename: str) -> Tuple[Optional[str], Optional[str]]:
+    """从 {公司}_{年份}_xxx 形式的文件名中解析公司和年份"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    match = re.match(r'^(.+?)[_\-\s]*((?:19|20)\d{2})', name)
+    if not match:
+        return None, None
+    return match.group(1).strip("_- "), match.group(2)
+
+
+def _is_simulated(path: str) -> bool:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return bool(json.load(f).get("simulated"))
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
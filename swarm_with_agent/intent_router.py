@@ -0,0 +1,48 @@
+# intent_router.py - 确定性意图路由
+# 公司、年份和需求类型都明确、且本地数据已就绪的简单问题，直接调用数据工具和writer，
+# 跳过 planner 的多轮规划和 handoff；其余问题仍交给完整的 Swarm
+import re
+from typing import Optional
+
+from data_registry import DataRegistry
+
+VISUALIZATION_KEYWORDS = ["图", "可视化", "画", "chart"]
+SEARCH_KEYWORDS = ["最新", "新闻", "搜索", "动态", "市场", "竞争", "行业", "股价"]
+COMPARISON_KEYWORDS = ["对比", "比较", "相比", "比起", "vs", "pk", "versus"]
+# 紧挨公司名的并列连词（"华为和小米"）说明还涉及别的公司，即使那家公司尚未登记；
+# "营收和利润" 这类指标之间的并列不受影响
+CONJUNCTIONS = "和与跟及、/&"
+
+
+def _joined_with_other_entity(text: str, company: str) -> bool:
+    name = re.escape(company)
+    return re.search(rf'{name}\s*[{CONJUNCTIONS}]|[{CONJUNCTIONS}]\s*{name}', text) is not None
+
+
+def route_intent(user_input: str, has_finance_need: bool, has_text_need: bool,
+                 registry: DataRegistry) -> Optional[dict]:
+    """基于关键词分类和实体识别的规则路由，只有完全无歧义时才返回直达路由
+
+    财务需求要求数据库中有该 公司/年份 的记录，文本需求要求有处理后的JSON，
+    任一所需数据缺失都交给 planner 调度采集。
+    """
+    if not (has_finance_need or has_text_need):
+        return None
+    text = user_input.lower()
+    if any(k in text for k in VISUALIZATION_KEYWORDS + SEARCH_KEYWORDS + COMPARISON_KEYWORDS):
+        return None
+
+    # 多公司或多年份（对比类问题）交给 planner；登记表只认识已登记的公司，
+    # 与未登记公司并列的问题（"华为和小米"）同样交给 planner，避免悄悄丢掉另一家
+    companies, years = registry.find_entities(user_input)
+    if len(companies) != 1 or len(years) != 1:
+        return None
+    company, year = companies[0], years[0]
+    if _joined_with_other_entity(user_input, company):
+        return None
+    if has_finance_need and not registry.has_db_rows(company, year):
+        return None
+    if has_text_need and not registry.has_text(company, year):
+        return None
+
+    return {"company": company, "year": year, "finance": has_finance_need, "text": has_text_need}
@@ -0,0 +1,261 @@
+# list_memory.py - 对话历史记忆：有界环形缓冲、滚动摘要、相关历史挑选和会话持久化
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+from autogen_agentchat.messages import TextMessage
+
+from session_store import SessionStore
+from text_utils import char_bigrams, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ListMemory:
+    """有界的列表记忆系统 - 用于存储对话历史
+    
+    消息保存在环形缓冲区中，超出条数/字符/token 预算时淘汰最早的消息；
+    每条消息只在写入时渲染一次，get_context 直接返回缓存的上下文字符串。
+    
+    传入 summarizer 时启用压缩模式：被淘汰的消息不会直接丢弃，而是由后台任务
+    合并进滚动摘要，不阻塞下一轮对话；摘要生成前这些消息仍以原文出现在上下文中。
+    
+    get_relevant_context 按实体（公司/年份）重合度和词法相似度只挑选与当前问题相关的历史。
+    
+    传入 store 和 session_id 时，每条消息和摘要都会写入会话存储，restore() 可在重启后恢复。
+    """
+    def __init__(self, max_messages: int = 40, max_chars: int = 8000, max_tokens: Optional[int] = None,
+                 summarizer: Optional[Callable[[str, str], Awaitable[str]]] = None,
+                 max_summary_chars: int = 1200,
+                 entity_extractor: Optional[Callable[[str], Tuple[List[str], List[str]]]] = None,
+                 store: Optional[SessionStore] = None,
+                 session_id: Optional[str] = None):
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.max_summary_chars = max_summary_chars
+        self.entity_extractor = entity_extractor
+        self.store = store
+        self.session_id = session_id
+        self.summary = ""                     # 早期对话的滚动摘要
+        self._pending_lines: List[str] = []   # 已淘汰、等待并入摘要的消息
+        self._pending_seqs: List[int] = []    # 与 _pending_lines 一一对应的消息序号
+        self._compaction_task: Optional[asyncio.Task] = None
+        self.messages: Deque[TextMessage] = deque()
+        self._lines: Deque[str] = deque()     # 与 messages 一一对应的渲染结果
+        self._line_tokens: Deque[int] = deque()
+        self._features: Deque[Tuple[set, set]] = deque()  # (实体集合, 字符二元组)，写入时计算一次
+        self._total_chars = 0
+        self._total_tokens = 0
+        self._context_cache: Optional[str] = None
+        self._seqs: Deque[int] = deque()      # 与 messages 一一对应的会话内序号，用于记录摘要覆盖范围
+        self._next_seq = 0
+        self.termination_phrases = [
+            "TASK_DONE"
+        ]
+        logger.info("ListMemory初始化")
+    
+    def add(self, content: str, source: str):
+        """添加消息到记忆，自动过滤终止相关的内容"""
+        if self._contains_termination(content):
+            logger.info(f"检测到终止内容，跳过存储: {content[:30]}...")
+            return
+        
+        seq = self._append(content, source)
+        if self.store is not None:
+            self.store.append_message(self.session_id, source, content, seq)
+        logger.info(f"添加消息到记忆: {content[:20]}...")
+    
+    def _append(self, content: str, source: str, seq: Optional[int] = None) -> int:
+        seq = self._next_seq if seq is None else seq
+        self._next_seq = max(self._next_seq, seq + 1)
+        message = TextMessage(content=content, source=source)
+        line = f"- {source}: {content}\n"
+        tokens = estimate_tokens(line)
+        self.messages.append(message)
+        self._seqs.append(seq)
+        self._lines.append(line)
+        self._line_tokens.append(tokens)
+        self._features.append((self._entities(content), char_bigrams(content)))
+        self._total_chars += len(line)
+        self._total_tokens += tokens
+        self._evict_overflow()
+        self._context_cache = None
+        return seq
+    
+    async def restore(self):
+        """从会话存储恢复摘要和最近的消息（只读取预算内需要的部分）
+        
+        已并入摘要的消息不再读取，摘要按原样恢复，避免每次重启重复摘要。
+        先等待写队列落盘（会话被回收后立即重建时，上一实例的消息可能仍在排队），
+        SQLite 读取放到线程中，不阻塞事件循环。
+        """
+        if self.store is None:
+            return
+        await self.store.flush()
+        self.summary, self._next_seq, rows = await asyncio.to_thread(self._load_from_store)
+        for seq, source, content in rows:
+            self._append(content, source, seq)
+        self._context_cache = None
+        logger.info(f"会话 {self.session_id} 已恢复 {len(self.messages)} 条消息")
+    
+    def _load_from_store(self) -> Tuple[str, int, List[Tuple[int, str, str]]]:
+        summary, summarized_upto = self.store.load_summary(self.session_id)
+        next_seq, rows = self.store.load_recent_messages(self.session_id, self.max_messages,
+                                                         min_seq=summarized_upto)
+        return summary, next_seq, rows
+    
+    def _over_budget(self) -> bool:
+        if self.max_messages and len(self.messages) > self.max_messages:
+            return True
+        if self.max_chars and self._total_chars > self.max_chars:
+            return True
+        if self.max_tokens and self._total_tokens > self.max_tokens:
+            return True
+        return False
+    
+    def _evict_overflow(self):
+        """淘汰最早的消息直到满足预算（至少保留最新的一条）"""
+        while len(self.messages) > 1 and self._over_budget():
+            message = self.messages.popleft()
+            seq = self._seqs.popleft()
+            line = self._lines.popleft()
+            self._total_chars -= len(line)
+            self._total_tokens -= self._line_tokens.popleft()
+            self._features.popleft()
+            self._on_evict(message, line, seq)
+    
+    def _on_evict(self, message: TextMessage, line: str, seq: int):
+        """消息被淘汰时的回调：压缩模式下转入待摘要队列"""
+        if self.summarizer is None:
+            logger.info(f"记忆超出预算，淘汰最早的消息: {message.content[:20]}...")
+            return
+        self._pending_lines.append(line)
+        self._pending_seqs.append(seq)
+        # 摘要长期失败时也要保证上下文有界，超出预算的待摘要消息直接丢弃
+        while self.max_chars and len(self._pending_lines) > 1 and \
+                sum(len(l) for l in self._pending_lines) > self.max_chars:
+            dropped = self._pending_lines.pop(0)
+            self._pending_seqs.pop(0)
+            logger.warning(f"待摘要消息积压，丢弃: {dropped[:30]}...")
+        self._schedule_compaction()
+    
+    def _schedule_compaction(self):
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 没有运行中的事件循环，等下一次写入时再调度
+        self._compaction_task = loop.create_task(self._compact())
+    
+    async def _compact(self):
+        """后台把待摘要消息并入滚动摘要"""
+        while self._pending_lines:
+            batch = list(self._pending_lines)
+            try:
+                new_summary = await self.summarizer(self.summary, "".join(batch))
+            except Exception as e:
+                logger.error(f"历史摘要生成失败，保留原文: {e}")
+                return
+            # 摘要期间队列可能有增删，只移除仍在队首、且已处理过的消息
+            for line in batch:
+                if self._pending_lines and self._pending_lines[0] is line:
+                    self._pending_lines.pop(0)
+                    self._pending_seqs.pop(0)
+            self.summary = (new_summary or self.summary).strip()[:self.max_summary_chars]
+            self._context_cache = None
+            if self.store is not None:
+                # 早于仍在待摘要队列（或窗口）中第一条的消息都已覆盖（或已丢弃）
+                self.store.save_summary(self.session_id, self.summary, self._summarized_upto())
+            logger.info(f"已将 {len(batch)} 条早期消息并入摘要")
+    
+    def _summarized_upto(self) -> int:
+        if self._pending_seqs:
+            return self._pending_seqs[0]
+        return self._seqs[0] if self._seqs else self._next_seq
+    
+    async def wait_compaction(self):
+        """等待后台摘要任务完成（用于退出前或测试）"""
+        if self._compaction_task is not None:
+            await asyncio.gather(self._compaction_task, return_exceptions=True)
+    
+    def _contains_termination(self, content: str) -> bool:
+        """检查内容是否包含终止短语"""
+        content_lower = content.lower()
+        for phrase in self.termination_phrases:
+            if phrase.lower() in content_lower:
+                return True
+        return False
+    
+    def get_context(self) -> str:
+        """核心功能：将历史记录格式化为字符串，用于注入 Prompt（每次写入后最多重建一次）"""
+        if not self.messages and not self.summary and not self._pending_lines:
+            return "无历史对话记录。"
+        
+        if self._context_cache is None:
+            parts = []
+            if self.summary:
+                parts.append(f"【早期对话摘要】:\n{self.summary}\n")
+            parts.append("【历史对话上下文】:\n")
+            parts.extend(self._pending_lines)
+            parts.extend(self._lines)
+            parts.append("【历史结束】\n")
+            self._context_cache = "".join(parts)
+        return self._context_cache
+    
+    def _entities(self, text: str) -> set:
+        if self.entity_extractor is None:
+            return set(re.findall(r'(?:19|20)\d{2}', text))
+        companies, years = self.entity_extractor(text)
+        return set(companies) | set(years)
+    
+    def get_relevant_context(self, query: str, top_k: int = 6, keep_recent: int = 2) -> str:
+        """只注入与当前问题相关的历史：按实体重合度 + 词法相似度打分取 top_k，并保留最近几条以便追问"""
+        if len(self.messages) <= top_k + keep_recent:
+            return self.get_context()
+        
+        query_entities = self._entities(query)
+        query_bigrams = char_bigrams(query)
+        n = len(self.messages)
+        
+        scored = []
+        for i, (entities, bigrams) in enumerate(self._features):
+            if i >= n - keep_recent:
+                continue
+            entity_score = len(entities & query_entities) / len(query_entities) if query_entities else 0.0
+            union = len(bigrams | query_bigrams)
+            lexical_score = len(bigrams & query_bigrams) / union if union else 0.0
+            score = 2.0 * entity_score + lexical_score
+            if score > 0.05:
+                scored.append((score, i))
+        
+        selected = {i for _, i in sorted(scored, reverse=True)[:top_k]}
+        selected.update(range(max(0, n - keep_recent), n))
+        
+        parts = []
+        if self.summary:
+            parts.append(f"【早期对话摘要】:\n{self.summary}\n")
+        parts.append("【相关历史对话】:\n")
+        parts.extend(self._pending_lines)
+        parts.extend(line for i, line in enumerate(self._lines) if i in selected)
+        parts.append("【历史结束】\n")
+        return "".join(parts)
+    
+    def clear(self):
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+        self.summary = ""
+        self._pending_lines = []
+        self._pending_seqs = []
+        self.messages.clear()
+        self._seqs.clear()
+        self._lines.clear()
+        self._line_tokens.clear()
+        self._features.clear()
+        self._total_chars = 0
+        self._total_tokens = 0
+        self._context_cache = None
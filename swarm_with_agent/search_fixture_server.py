@@ -0,0 +1,147 @@
+# search_fixture_server.py - 离线搜索回放服务：用录制的结果页代替百度，支持延迟和错误注入
+# pip install aiohttp
+# 用法: python search_fixture_server.py --latency 0.05 0.3 --error-rate 0.1 --throttle-rate 0.05
+#       然后以 SEARCH_MODE=replay 运行主程序（或 BaiduSearchAgent(base_url="http://127.0.0.1:8765/s")）
+import argparse
+import asyncio
+import logging
+import os
+import random
+from typing import Optional, Tuple
+
+from aiohttp import web
+
+from web_search_agent import SearchRecorder
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = web.AppKey("stats", dict)
+
+
+class FixtureConfig:
+    """回放服务的故障注入参数，运行中可通过 POST /_config 修改"""
+
+    def __init__(self,
+                 latency: Tuple[float, float] = (0.0, 0.0),
+                 error_rate: float = 0.0,
+                 error_status: int = 503,
+                 throttle_rate: float = 0.0,
+                 retry_after: Optional[float] = 1.0,
+                 default_page: Optional[str] = None,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.default_page = default_page  # 未录制的查询返回该页面，为空则返回 404
+        self.random = random.Random(seed)  # 固定种子时注入序列可复现
+
+    def update(self, values: dict):
+        for name in ("error_rate", "error_status", "throttle_rate", "retry_after"):
+            if name in values:
+                setattr(self, name, values[name])
+        if "latency" in values:
+            low, high = values["latency"]
+            self.latency = (float(low), float(high))
+
+
+CONFIG_KEY = web.AppKey("config", FixtureConfig)
+
+
+def create_fixture_app(fixture_dir: str = "./local_data/search_pages",
+                       config: Optional[FixtureConfig] = None) -> web.Application:
+    recorder = SearchRecorder(fixture_dir)
+    config = config or FixtureConfig()
+    default_html = None
+    if config.default_page:
+        with open(config.default_page, "r", encoding="utf-8") as f:
+            default_html = f.read()
+    stats = {"requests": 0, "served": 0, "missing": 0, "errors": 0, "throttled": 0}
+    routes = web.RouteTableDef()
+
+    @routes.get("/s")
+    async def search(request):
+        stats["requests"] += 1
+        low, high = config.latency
+        if high > 0:
+            await asyncio.sleep(config.random.uniform(low, high))
+
+        roll = config.random.random()
+        if roll < config.throttle_rate:
+            stats["throttled"] += 1
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+            return web.Response(status=429, text="Too Many Requests", headers=headers)
+        if roll < config.throttle_rate + config.error_rate:
+            stats["errors"] += 1
+            return web.Response(status=config.error_status, text="Injected error")
+
+        html = recorder.load(request.query.get("wd", "")) or default_html
+        if html is None:
+            stats["missing"] += 1
+            return web.Response(status=404, text="No recorded page for this query")
+        stats["served"] += 1
+        return web.Response(text=html, content_type="text/html", charset="utf-8")
+
+    @routes.get("/_stats")
+    async def get_stats(request):
+        return web.json_response({**stats, "recorded_queries": len(recorder.index)})
+
+    @routes.post("/_config")
+    async def set_config(request):
+        config.update(await request.json())
+        return web.json_response({"latency": config.latency, "error_rate": config.error_rate,
+                                  "throttle_rate": config.throttle_rate})
+
+    app = web.Application()
+    app.add_routes(routes)
+    app[STATS_KEY] = stats
+    app[CONFIG_KEY] = config
+    return app
+
+
+async def start_fixture_server(fixture_dir: str = "./local_data/search_pages",
+                               host: str = "127.0.0.1", port: int = 8765,
+                               config: Optional[FixtureConfig] = None) -> Tuple[web.AppRunner, str]:
+    """在当前事件循环中启动回放服务，返回 (runner, 搜索地址)；用完调用 runner.cleanup()"""
+    runner = web.AppRunner(create_fixture_app(fixture_dir, config))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, f"http://{host}:{port}/s"
+
+
+async def _serve_forever(args):
+    config = FixtureConfig(latency=tuple(args.latency), error_rate=args.error_rate,
+                           error_status=args.error_status, throttle_rate=args.throttle_rate,
+                           default_page=args.default_page, seed=args.seed)
+    runner, url = await start_fixture_server(args.fixture_dir, args.host, args.port, config)
+    recorded = len(SearchRecorder(args.fixture_dir).index)
+    print(f"🧪 搜索回放服务已启动: {url}  (已录制 {recorded} 个查询，目录 {os.path.abspath(args.fixture_dir)})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线搜索回放服务")
+    parser.add_argument("--fixture-dir", default=os.environ.get("SEARCH_FIXTURE_DIR", "./local_data/search_pages"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.0, 0.0], metavar=("MIN", "MAX"),
+                        help="每个请求注入的随机延迟区间（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回服务端错误的概率")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--default-page", help="未录制的查询返回的页面")
+    parser.add_argument("--seed", type=int, help="随机种子，固定后注入结果可复现")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
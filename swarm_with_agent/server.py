@@ -0,0 +1,286 @@
+# server.py - 多会话 HTTP/WebSocket 服务入口
+# pip install aiohttp
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import WSMsgType, web
+
+logger = logging.getLogger(__name__)
+
+REAPER_KEY = web.AppKey("reaper", asyncio.Task)
+
+
+class AdmissionError(Exception):
+    """会话数或并发对话数已达上限"""
+
+
+class SessionBusyError(Exception):
+    """单个会话排队的对话超过上限"""
+
+
+class _Session:
+    def __init__(self, session_id: str, system: Any):
+        self.session_id = session_id
+        self.system = system
+        self.lock = asyncio.Lock()      # 同一会话的对话串行执行（Swarm 不能并发运行）
+        self.pending = 0                # 正在运行 + 排队中的对话数
+        self.last_active = time.monotonic()
+        self.turns = 0
+        self.connections = 0            # 打开中的 WebSocket 连接数，有连接的会话不会被回收
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0 or self.connections > 0
+
+
+class SessionManager:
+    """管理所有会话：每个会话独立的记忆和团队状态，并做准入控制
+
+    - max_sessions: 同时保持的会话数上限，满了先回收空闲会话，仍然满则拒绝
+    - max_concurrent_turns: 整个进程同时运行的对话数上限，超出的请求最多等待 admission_timeout 秒
+    - max_pending_per_session: 单个会话允许排队的对话数，超出直接拒绝
+    """
+
+    def __init__(self,
+                 system_factory: Callable[[Optional[str]], Any],
+                 max_sessions: int = 64,
+                 max_concurrent_turns: int = 16,
+                 max_pending_per_session: int = 2,
+                 idle_timeout: float = 1800.0,
+                 admission_timeout: float = 30.0):
+        self.system_factory = system_factory
+        self.max_sessions = max_sessions
+        self.max_pending_per_session = max_pending_per_session
+        self.idle_timeout = idle_timeout
+        self.admission_timeout = admission_timeout
+        self.sessions: Dict[str, _Session] = {}
+        self._turn_slots = asyncio.Semaphore(max_concurrent_turns)
+        self.max_concurrent_turns = max_concurrent_turns
+        self.stats = {"turns": 0, "rejected_sessions": 0, "rejected_turns": 0, "evicted_sessions": 0}
+
+    def get_or_create(self, session_id: Optional[str] = None) -> _Session:
+        if session_id and session_id in self.sessions:
+            return self.sessions[session_id]
+
+        if len(self.sessions) >= self.max_sessions:
+            self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            self.stats["rejected_sessions"] += 1
+            raise AdmissionError(f"会话数已达上限 {self.max_sessions}")
+
+        session_id = session_id or uuid.uuid4().hex[:12]
+        session = _Session(session_id, self.system_factory(session_id))
+        self.sessions[session_id] = session
+        logger.info(f"创建会话 {session_id}，当前会话数 {len(self.sessions)}")
+        return session
+
+    def evict_idle(self, max_idle: Optional[float] = None) -> int:
+        """回收空闲会话（会话数据已持久化，之后可按 session_id 恢复）"""
+        now = time.monotonic()
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        idle = [sid for sid, s in self.sessions.items() if not s.busy and now - s.last_active >= max_idle]
+        if not idle and len(self.sessions) >= self.max_sessions:
+            # 会话满时，即使未超时也回收最久未活跃的空闲会话
+            candidates = sorted((s.last_active, sid) for sid, s in self.sessions.items() if not s.busy)
+            idle = [sid for _, sid in candidates[:1]]
+        for sid in idle:
+            self.sessions.pop(sid, None)
+        self.stats["evicted_sessions"] += len(idle)
+        return len(idle)
+
+    def close_session(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None or session.busy:
+            return False
+        del self.sessions[session_id]
+        return True
+
+    async def run_turn(self, session: _Session, user_input: str, on_message=None) -> str:
+        if session.pending >= self.max_pending_per_session:
+            self.stats["rejected_turns"] += 1
+            raise SessionBusyError(f"会话 {session.session_id} 已有 {session.pending} 个对话在处理")
+
+        session.pending += 1
+        try:
+            async with session.lock:
+                try:
+                    await asyncio.wait_for(self._turn_slots.acquire(), timeout=self.admission_timeout)
+                except asyncio.TimeoutError:
+                    self.stats["rejected_turns"] += 1
+                    raise AdmissionError("系统繁忙，请稍后重试")
+                try:
+                    self.stats["turns"] += 1
+                    session.turns += 1
+                    return await session.system.run_turn(user_input, on_message=on_message)
+                finally:
+                    self._turn_slots.release()
+        finally:
+            session.pending -= 1
+            session.last_active = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        running = sum(1 for s in self.sessions.values() if s.lock.locked())
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "running_turns": running,
+            "max_concurrent_turns": self.max_concurrent_turns,
+            **self.stats,
+        }
+
+    async def reap_forever(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_idle()
+            if evicted:
+                logger.info(f"回收空闲会话 {evicted} 个")
+
+
+# ==================== HTTP / WebSocket 接口 ====================
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"status": "error", "message": message}, status=status)
+
+
+async def _read_object(request) -> Dict:
+    """读取 JSON 对象请求体，缺失时为空对象；不是合法 JSON 对象时抛出 ValueError"""
+    if not request.can_read_body:
+        return {}
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("请求体必须是 JSON 对象")
+    return body
+
+
+def _parse_ws_input(data: str) -> str:
+    """WebSocket 文本帧：{"input": "..."} 或纯文本问题；JSON 但不是对象时抛出 ValueError"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return data.strip()
+    if isinstance(payload, str):
+        return payload.strip()
+    if not isinstance(payload, dict):
+        raise ValueError('消息格式应为 {"input": "..."} 或纯文本')
+    user_input = payload.get("input") or ""
+    if not isinstance(user_input, str):
+        raise ValueError("input 必须是字符串")
+    return user_input.strip()
+
+
+def create_app(manager: SessionManager) -> web.Application:
+    routes = web.RouteTableDef()
+
+    @routes.get("/health")
+    async def health(request):
+        return web.json_response({"status": "ok", **manager.snapshot()})
+
+    @routes.post("/sessions")
+    async def create_session(request):
+        try:
+            body = await _read_object(request)
+        except ValueError as e:
+            return _error(400, str(e))
+        try:
+            session = manager.get_or_create(body.get("session_id"))
+        except AdmissionError as e:
+            return _error(503, str(e))
+        return web.json_response({"session_id": session.session_id})
+
+    @routes.delete("/sessions/{session_id}")
+    async def delete_session(request):
+        if manager.close_session(request.match_info["session_id"]):
+            return web.json_response({"status": "closed"})
+        return _error(409, "会话不存在或仍有对话在处理")
+
+    @routes.post("/sessions/{session_id}/turns")
+    async def post_turn(request):
+        try:
+            body = await _read_object(request)
+        except ValueError as e:
+            return _error(400, str(e))
+        user_input = body.get("input") or ""
+        if not isinstance(user_input, str) or not user_input.strip():
+            return _error(400, "缺少 input")
+        try:
+            session = manager.get_or_create(request.match_info["session_id"])
+            start = time.perf_counter()
+            answer = await manager.run_turn(session, user_input.strip())
+        except SessionBusyError as e:
+            return _error(429, str(e))
+        except AdmissionError as e:
+            return _error(503, str(e))
+        return web.json_response({
+            "session_id": session.session_id,
+            "answer": answer,
+            "elapsed": round(time.perf_counter() - start, 3),
+        })
+
+    @routes.get("/sessions/{session_id}/ws")
+    async def websocket(request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        try:
+            session = manager.get_or_create(request.match_info["session_id"])
+        except AdmissionError as e:
+            await ws.send_json({"type": "error", "message": str(e)})
+            await ws.close()
+            return ws
+
+        async def push(msg):
+            await ws.send_json({"type": "message", "source": msg.source, "content": msg.content})
+
+        session.connections += 1
+        try:
+            async for frame in ws:
+                if frame.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    user_input = _parse_ws_input(frame.data)
+                    if not user_input:
+                        continue
+                    answer = await manager.run_turn(session, user_input, on_message=push)
+                    await ws.send_json({"type": "done", "answer": answer})
+                except (ValueError, SessionBusyError, AdmissionError) as e:
+                    await ws.send_json({"type": "error", "message": str(e)})
+                except Exception as e:
+                    # 单条消息出错只回复错误，不断开连接
+                    logger.error(f"会话 {session.session_id} 处理消息失败: {e}")
+                    if not ws.closed:
+                        await ws.send_json({"type": "error", "message": f"处理失败: {e}"})
+        finally:
+            session.connections -= 1
+            session.last_active = time.monotonic()
+        return ws
+
+    app = web.Application()
+    app.add_routes(routes)
+
+    async def start_reaper(app):
+        app[REAPER_KEY] = asyncio.create_task(manager.reap_forever())
+
+    async def stop_reaper(app):
+        app[REAPER_KEY].cancel()
+
+    app.on_startup.append(start_reaper)
+    app.on_cleanup.append(stop_reaper)
+    return app
+
+
+async def run_server(system_factory: Callable[[Optional[str]], Any],
+                     host: str = "127.0.0.1", port: int = 8080, **limits):
+    """启动本地服务并一直运行，直到任务被取消"""
+    manager = SessionManager(system_factory, **limits)
+    runner = web.AppRunner(create_app(manager))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"🌐 多会话服务已启动: http://{host}:{port}  (WebSocket: /sessions/{{id}}/ws)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
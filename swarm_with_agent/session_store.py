@@ -0,0 +1,179 @@
+# session_store.py - 基于 SQLite 的会话持久化
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS session_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    seq INTEGER NOT NULL            -- 会话内单调递增的消息序号，删除或压缩旧消息后也不变
+);
+CREATE INDEX IF NOT EXISTS idx_session_messages ON session_messages (session_id, seq);
+CREATE TABLE IF NOT EXISTS session_summary (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    summarized_upto INTEGER NOT NULL DEFAULT 0  -- 摘要已覆盖 seq 小于该值的消息
+);
+CREATE TABLE IF NOT EXISTS session_team_state (
+    session_id TEXT PRIMARY KEY,
+    state_json TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SessionStore:
+    """会话存储：记忆消息、滚动摘要和 team.save_state() 快照写入 SQLite
+
+    写操作只是入队，由单独的写线程批量合并成一个事务提交，不占用事件循环；
+    同一会话的摘要和团队状态只保留最新一次写入。
+    """
+
+    def __init__(self, db_path: str = "./local_data/sessions.db", batch_interval: float = 0.2):
+        self.db_path = db_path
+        self.batch_interval = batch_interval
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.executescript(CREATE_TABLES_SQL)
+        conn.commit()
+        conn.close()
+
+        self._ops: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="session-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    # ---------- 写入（非阻塞） ----------
+    def append_message(self, session_id: str, source: str, content: str, seq: int):
+        """seq 由调用方按会话递增分配（见 load_recent_messages 返回的下一个序号）"""
+        self._ops.put(("message", session_id, (source, content, time.time(), seq)))
+
+    def save_summary(self, session_id: str, summary: str, summarized_upto: int = 0):
+        """保存滚动摘要，summarized_upto 表示 seq 小于该值的消息都已并入摘要"""
+        self._ops.put(("summary", session_id, (summary, time.time(), summarized_upto)))
+
+    def save_team_state(self, session_id: str, state: Dict):
+        self._ops.put(("team_state", session_id, (json.dumps(state, ensure_ascii=False, default=str), time.time())))
+
+    async def flush(self):
+        """等待此前入队的写操作全部落盘"""
+        done = threading.Event()
+        self._ops.put(("flush", None, done))
+        await asyncio.to_thread(done.wait)
+
+    async def close(self):
+        if self._closed:
+            return
+        await self.flush()
+        self._closed = True
+        self._ops.put(None)
+        await asyncio.to_thread(self._writer.join)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            op = self._ops.get()
+            if op is None:
+                break
+            batch = [op]
+            # 攒一小段时间内的写操作，合并成一个事务；flush 请求不再等待
+            deadline = time.monotonic() + (0 if op[0] == "flush" else self.batch_interval)
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self._ops.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._ops.put(None)
+                    break
+                batch.append(nxt)
+                if nxt[0] == "flush":
+                    break
+            try:
+                self._write_batch(conn, batch)
+            except sqlite3.Error as e:
+                logger.error(f"会话数据写入失败: {e}")
+            for kind, _, payload in batch:
+                if kind == "flush":
+                    payload.set()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        messages = []
+        summaries: Dict[str, Tuple] = {}
+        states: Dict[str, Tuple] = {}
+        for kind, session_id, payload in batch:
+            if kind == "message":
+                messages.append((session_id, *payload))
+            elif kind == "summary":
+                summaries[session_id] = payload
+            elif kind == "team_state":
+                states[session_id] = payload
+
+        with conn:
+            if messages:
+                conn.executemany(
+                    "INSERT INTO session_messages (session_id, source, content, created_at, seq) VALUES (?, ?, ?, ?, ?)",
+                    messages)
+            for session_id, (summary, ts, summarized_upto) in summaries.items():
+                conn.execute("INSERT OR REPLACE INTO session_summary (session_id, summary, updated_at, summarized_upto) "
+                             "VALUES (?, ?, ?, ?)", (session_id, summary, ts, summarized_upto))
+            for session_id, (state_json, ts) in states.items():
+                conn.execute("INSERT OR REPLACE INTO session_team_state VALUES (?, ?, ?)", (session_id, state_json, ts))
+
+    # ---------- 读取（按需） ----------
+    def load_recent_messages(self, session_id: str, limit: int,
+                             min_seq: int = 0) -> Tuple[int, List[Tuple[int, str, str]]]:
+        """读取 seq >= min_seq 的最近 limit 条消息
+
+        返回 (该会话下一条消息应使用的 seq, [(seq, source, content), ...])，消息按时间正序。
+        """
+        conn = self._connect()
+        last_seq = conn.execute("SELECT MAX(seq) FROM session_messages WHERE session_id = ?",
+                                (session_id,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT seq, source, content FROM session_messages WHERE session_id = ? AND seq >= ? "
+            "ORDER BY seq DESC LIMIT ?", (session_id, min_seq, limit)).fetchall()
+        conn.close()
+        return (last_seq + 1 if last_seq is not None else 0), list(reversed(rows))
+
+    def load_summary(self, session_id: str) -> Tuple[str, int]:
+        """返回 (摘要, 摘要已覆盖的消息条数)"""
+        conn = self._connect()
+        row = conn.execute("SELECT summary, summarized_upto FROM session_summary WHERE session_id = ?",
+                           (session_id,)).fetchone()
+        conn.close()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def load_team_state(self, session_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        row = conn.execute("SELECT state_json FROM session_team_state WHERE session_id = ?", (session_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+    def list_sessions(self) -> List[Tuple[str, float]]:
+        """列出所有会话及最后活跃时间，最近的在前"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT session_id, MAX(created_at) FROM session_messages GROUP BY session_id ORDER BY 2 DESC").fetchall()
+        conn.close()
+        return rows
@@ -1,20 +1,32 @@
 import asyncio
 import logging
-from typing import List
+from typing import List, Deque, Optional, Callable, Awaitable, Tuple
+from collections import deque
 import os
 import sqlite3
 from typing import Annotated
 import json
 import time
+import uuid
 from datetime import datetime
-from web_search_agent import search_market_info
-from visualization_agent import generate_chart
+import re
+from web_search_agent import baidu_agent, search_market_info, search_market_info_many, search_market_info_deep
+from visualization_agent import generate_chart, generate_trend_chart, chart_renderer
+from chart_data import load_metrics, db_handle
+from upload_watcher import UploadWatcher
+from session_store import SessionStore
+from list_memory import ListMemory
+from turn_budget import TurnBudgetTermination, start_turn_usage, add_usage, add_nested_usage
+from data_registry import DataRegistry, parse_company_year
+from intent_router import route_intent
+from data_collection import DataCollector, parse_collection_targets, format_collection_report
 
 # 注意：请确保安装了 autogen-agentchat 和 autogen-ext
 # pip install autogen-agentchat autogen-ext openai
+# server 模式与异步搜索连接池还需要: pip install aiohttp
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.conditions import TextMentionTermination
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.messages import TextMessage, ToolCallRequestEvent, ToolCallSummaryMessage
 from autogen_agentchat.teams import Swarm
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_core.models import UserMessage 
@@ -49,48 +61,19 @@ async def test_llm():
         print(f"❌ LLM 连接失败: {e}")
         return False
 
-# ==================== ListMemory类 ====================
-class ListMemory:
-    """简单的列表记忆系统 - 用于存储对话历史"""
-    def __init__(self):
-        self.messages: List[TextMessage] = []
-        self.termination_phrases = [
-            "TASK_DONE"
-        ]
-        logger.info("ListMemory初始化")
-    
-    def add(self, content: str, source: str):
-        """添加消息到记忆，自动过滤终止相关的内容"""
-        if self._contains_termination(content):
-            logger.info(f"检测到终止内容，跳过存储: {content[:30]}...")
-            return
-        
-        message = TextMessage(content=content, source=source)
-        self.messages.append(message)
-        logger.info(f"添加消息到记忆: {content[:20]}...")
-    
-    def _contains_termination(self, content: str) -> bool:
-        """检查内容是否包含终止短语"""
-        content_lower = content.lower()
-        for phrase in self.termination_phrases:
-            if phrase.lower() in content_lower:
-                return True
-        return False
-    
-    def get_context(self) -> str:
-        """核心功能：将历史记录格式化为字符串，用于注入 Prompt"""
-        if not self.messages:
-            return "无历史对话记录。"
-        
-        context_str = "【历史对话上下文】:\n"
-        for msg in self.messages:
-            if not self._contains_termination(msg.content):
-                context_str += f"- {msg.source}: {msg.content}\n"
-        context_str += "【历史结束】\n"
-        return context_str
-    
-    def clear(self):
-        self.messages = []
+async def summarize_history(previous_summary: str, new_lines: str) -> str:
+    """把早期对话合并进滚动摘要，供 ListMemory 的压缩模式调用"""
+    prompt = f"""你负责压缩金融分析对话的历史记录。请把【新增对话】合并进【已有摘要】，输出一段新的摘要。
+必须保留：已分析过的公司和年份、已采集/已提取的数据、关键财务数字、已生成的报告和结论。
+不要编造信息，不超过400字，只输出摘要正文。
+
+【已有摘要】:
+{previous_summary or "无"}
+
+【新增对话】:
+{new_lines}"""
+    response = await model_client.create([UserMessage(content=prompt, source="user")])
+    return response.content if isinstance(response.content, str) else previous_summary
 
 logging.basicConfig(
     filename='system_run.log',
@@ -111,6 +94,11 @@ def get_db_connection():
     """建立数据库连接 (私有辅助函数)"""
     return sqlite3.connect(DB_PATH, check_same_thread=False)
 
+# 数据可用性登记表：单独存放，启动时扫描已有数据，之后由各入库路径实时更新
+REGISTRY_DB_PATH = "./local_data/data_registry.db"
+data_registry = DataRegistry(REGISTRY_DB_PATH, source_db_path=DB_PATH)
+data_registry.scan_sources()
+
 # ==================== 新增：保存报告的工具函数 ====================
 async def save_report_to_file(report_content: str, company: str = "未知公司", year: str = "未知年份") -> str:
     """
@@ -231,10 +219,14 @@ async def get_financial_data(company: str, year: str) -> str:
         response = ""
         
         async for msg in financial_agent.run_stream(task=query):
+            add_nested_usage(msg)
             if isinstance(msg, TextMessage):
                 response = msg.content
                 break
         
+        # 数据库中有该公司/年份的指标时附上句柄，画图时直接传句柄，数字不必在文本中转述
+        if await asyncio.to_thread(load_metrics, company, year):
+            response += f"\n📎 图表数据句柄: {db_handle(company, year)}"
         return response
         
     except Exception as e:
@@ -331,6 +323,7 @@ async def get_text_data(company: str, year: str) -> str:
         response = ""
         
         async for msg in text_agent.run_stream(task=query):
+            add_nested_usage(msg)
             if isinstance(msg, TextMessage):
                 response = msg.content
                 break
@@ -340,6 +333,55 @@ async def get_text_data(company: str, year: str) -> str:
     except Exception as e:
         return f"❌ 文本数据提取失败: {str(e)}"
 
+# ==================== 上传文件入库 ====================
+UPLOAD_DIR = "./user_uploads/"
+
+# pypdf 为可选依赖 (pip install pypdf)，未安装时只登记文件不提取文本
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+def _extract_pdf_text(file_path: str) -> str:
+    if PdfReader is None:
+        return ""
+    reader = PdfReader(file_path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+async def ingest_uploaded_pdf(file_path: str) -> dict:
+    """上传目录监听器的入库回调：提取PDF文本并写入 local_data 的 processed.json"""
+    company, year = parse_company_year(file_path)
+    if not company:
+        logger.warning(f"无法从文件名解析公司和年份，跳过: {file_path}")
+        return {"status": "skipped", "message": "文件名需形如 公司_年份_report.pdf"}
+    
+    extracted_text = await asyncio.to_thread(_extract_pdf_text, file_path)
+    local_path = f"./local_data/{company}_{year}_processed.json"
+    processed = {
+        "company": company,
+        "year": year,
+        "report_type": "Annual",
+        "status": "success",
+        "generated_time": datetime.now().isoformat(timespec="seconds"),
+        "pdf_url": f"upload://{os.path.basename(file_path)}",
+        "extracted_text": extracted_text,
+        "tables": [],
+        "key_metrics": {}
+    }
+    
+    def _write():
+        os.makedirs("./local_data", exist_ok=True)
+        with open(local_path, 'w', encoding='utf-8') as f:
+            json.dump(processed, f, ensure_ascii=False, indent=2)
+    
+    await asyncio.to_thread(_write)
+    data_registry.record_pdf(company, year, file_path)
+    data_registry.record_json(company, year, local_path)
+    logger.info(f"上传PDF已入库: {file_path} -> {local_path}")
+    return {"status": "success", "company": company, "year": year, "local_path": local_path}
+
+upload_watcher = UploadWatcher(UPLOAD_DIR, ingest_uploaded_pdf)
+
 # ==================== 其他工具函数 ====================
 
 async def check_user_uploaded_pdf(company: str, year: str) -> dict:
@@ -347,21 +389,25 @@ async def check_user_uploaded_pdf(company: str, year: str) -> dict:
     logger.info(f"[Tool] 检查 {company} {year} 的PDF上传情况...")
     print(f"\n   📄 [数据本地化] 检查 {company} {year} 年报PDF上传情况...")
     
-    upload_dir = "./user_uploads/"
-    
-    if not os.path.exists(upload_dir):
-        return {
-            "has_pdf": False,
-            "message": f"用户尚未上传{company} {year}年年报PDF"
-        }
-    
-    if "华为" in company and "2023" in year:
+    # 后台监听器已入库的上传文件可直接使用，无需再次处理
+    record = upload_watcher.lookup(company, year)
+    if record:
         return {
             "has_pdf": True,
-            "message": f"检测到用户已上传{company} {year}年年报PDF",
-            "file_path": f"./user_uploads/{company}_{year}_report.pdf"
+            "message": f"检测到用户已上传{company} {year}年年报PDF，已自动入库",
+            "file_path": record["file_path"],
+            "local_path": record.get("local_path")
         }
     
+    if os.path.exists(UPLOAD_DIR):
+        for name in os.listdir(UPLOAD_DIR):
+            if name.lower().endswith(".pdf") and parse_company_year(name) == (company, year):
+                return {
+                    "has_pdf": True,
+                    "message": f"检测到用户已上传{company} {year}年年报PDF（尚未入库）",
+                    "file_path": os.path.join(UPLOAD_DIR, name)
+                }
+    
     return {
         "has_pdf": False,
         "message": f"用户尚未上传{company} {year}年年报PDF"
@@ -403,6 +449,7 @@ async def scrape_annual_report(company: str, year: str) -> dict:
             "debt_ratio": "46%"
         },
         "status": "success",
+        "simulated": True,  # 模拟数据，可以保存到本地，但登记表不会把它登记为可用数据
         "local_path": f"./local_data/{company}_{year}_processed.json"
     }
     
@@ -413,9 +460,42 @@ async def save_data_to_local(data: dict, format_type: str = "json") -> str:
     logger.info(f"[Tool] 保存数据到本地: {data.get('company', 'Unknown')}")
     print(f"\n   💾 [数据本地化] 正在保存数据到本地...")
     
-    local_path = f"./local_data/{data['company']}_{data['year']}_report.{format_type}"
+    local_path = data.get("local_path") or f"./local_data/{data['company']}_{data['year']}_processed.{format_type}"
+    existed = os.path.exists(local_path)
+    if not existed:
+        try:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            return f"❌ 数据保存失败: {str(e)}"
+    
+    # 模拟爬取的数据照常保存，但登记表不会把它登记为可用数据
+    if not data_registry.record_json(data['company'], data['year'], local_path):
+        return (f"⚠️ {data['company']}{data['year']}年数据已保存到本地: {local_path}，但为模拟数据，"
+                f"数据状态: 不可用（未登记）。如需真实分析，请上传年报PDF或导入数据库。")
+    if existed:
+        return f"本地已存在{data['company']}{data['year']}年数据: {local_path}，未覆盖。"
     return f"数据已成功保存到本地: {local_path}。包含文本摘要、{len(data.get('tables', []))}个数据表和关键财务指标。"
 
+data_collector = DataCollector(data_registry, check_user_uploaded_pdf, ingest_uploaded_pdf,
+                               scrape_annual_report, save_data_to_local)
+
+async def collect_company_data_batch(
+    targets: Annotated[str, "需要采集的公司和年份，格式如 '华为:2023, 腾讯:2022-2024, 美团:2023/2024'"],
+    max_concurrency: Annotated[int, "同时进行采集的最大数量"] = 4
+) -> str:
+    """批量并发采集多个公司/年份的年报数据，返回一份汇总报告"""
+    pairs = parse_collection_targets(targets)
+    if not pairs:
+        return "❌ 未能解析采集目标，请使用 '公司:年份' 格式，多个目标用逗号分隔，例如 '华为:2023, 腾讯:2022-2024'"
+    
+    logger.info(f"[Tool] 批量采集 {len(pairs)} 个目标: {pairs}")
+    print(f"\n   🚀 [数据本地化] 批量并发采集 {len(pairs)} 个公司/年份 (并发上限 {max_concurrency})...")
+    
+    results = await data_collector.collect_batch(pairs, max_concurrency)
+    return format_collection_report(results)
+
 
 async def list_tables() -> str:
     """列出数据库中所有的表名"""
@@ -495,14 +575,13 @@ async def execute_sql_query(query: Annotated[str, "标准的 SQLite SELECT 查
 
 # ==================== 智能体定义 ====================
 
-data_collector = AssistantAgent(
-    "data_collector",
-    model_client=model_client,
-    handoffs=["planner"],
-    tools=[check_user_uploaded_pdf, scrape_annual_report, save_data_to_local],
-    system_message="""你是数据本地化专家，负责获取和准备分析所需的一手数据。
+DATA_COLLECTOR_SYSTEM_MESSAGE = """你是数据本地化专家，负责获取和准备分析所需的一手数据。
     
-    【工作流程】：
+    【批量采集】：
+    如果任务涉及多个公司或多个年份，直接调用一次collect_company_data_batch（例如 targets="华为:2023, 腾讯:2022-2024"），
+    它会并发完成检查上传、爬取和保存，并返回汇总结果，不要再逐个执行下面的单项流程
+    
+    【工作流程】（单个公司/年份）：
     1. 收到任务后，立即开始执行数据采集，首先检查用户是否已上传PDF（调用check_user_uploaded_pdf）
     2. 如果没有上传，自动从网络爬取年报（调用scrape_annual_report）
     3. 提取并结构化数据后，保存到本地（调用save_data_to_local）
@@ -530,15 +609,9 @@ data_collector = AssistantAgent(
     - 保持汇报清晰、结构化
     - 永远不能回复"TASK_DONE" 给用户
     """
-)
 
 # ==================== 更新后的数据协调者 ====================
-data_agent = AssistantAgent(
-    "data_agent",
-    model_client=model_client,
-    handoffs=["planner"],
-    tools=[get_financial_data, get_text_data],  # 直接调用工具，不通过handoff
-    system_message="""你负责根据planner需求调用不同的数据提取工具，并立即将结果报告给planner。
+DATA_AGENT_SYSTEM_MESSAGE = """你负责根据planner需求调用不同的数据提取工具，并立即将结果报告给planner。
 
     【核心职责】:
     1. 解析planner的指令，提取关键信息：公司名和年份
@@ -613,18 +686,14 @@ data_agent = AssistantAgent(
     - 完成任务后立即调用handoff工具转给planner，不要添加任何过渡语句
     - 汇报完成后，立即调用handoff工具，不要等待或添加额外文本
     """
-)
 
-web_search_agent = AssistantAgent(
-    "web_search_agent",
-    model_client=model_client,
-    handoffs=["planner"],
-    tools=[search_market_info],
-    system_message="""你是实时财务信息搜索专家，专门负责搜索最新市场信息。
+WEB_SEARCH_AGENT_SYSTEM_MESSAGE = """你是实时财务信息搜索专家，专门负责搜索最新市场信息。
     
     【重要规则】:
     1. 请解析了planner要求中的{公司}、{年份}和{搜索需求}的信息，并完全根据要求搜索
-    2. 当planner要求搜索时，立即调用search_market_info工具
+    2. 当planner要求搜索时，立即调用search_market_info工具；需要多个角度（公司、竞争对手、行业）时，
+       调用一次search_market_info_many并用分号分隔各个查询，它会并发搜索并合并去重；
+       摘要不足以回答具体问题（需要具体数字、原文表述）时，改用search_market_info_deep获取网页正文片段
     3. 搜索完成后，只向planner返回搜索结果的状态摘要
     4. 禁止冒充其他角色（如visualization_agent、writer等）
     5. 搜索完成后必须立即转回planner
@@ -642,20 +711,21 @@ web_search_agent = AssistantAgent(
     你: [调用工具] → "搜索完成。关键词:华为最新财务动态，摘要内容：{摘要}"
     → 然后立即转回planner
     """
-)
 
-visualization_agent = AssistantAgent(
-    "visualization_agent",
-    model_client=model_client,
-    handoffs=["planner"],
-    tools=[generate_chart],
-    system_message="""你是专业的财务信息可视化专家，负责根据planner提供的数据生成图表。
+VISUALIZATION_AGENT_SYSTEM_MESSAGE = """你是专业的财务信息可视化专家，负责根据planner提供的数据生成图表。
 
     【严格数据格式要求】：
     接收planner指令时，必须确保包含以下信息：
     1. 具体的财务数据（必须是结构化的数字信息）
     2. 明确的图表类型（bar/line/pie/dashboard）
 
+    【优先使用结构化数据】：
+    - planner 或 data_agent 给出了"图表数据句柄"（如 db:比亚迪:2023）时，直接把句柄作为 data_summary
+    - 数据库中已有的公司/年份，可传 JSON: {"company": "比亚迪", "year": 2023}，工具会直接读取数据库中的准确数值
+    - 已有具体数字时，可传 JSON: {"company": "比亚迪", "year": 2023, "metrics": {"Revenue": 6023, "Net Profit": 300}}
+    - 多年趋势或多公司对比，调用generate_trend_chart（如 companies="比亚迪,宁德时代", metric="营业收入", years="2020-2024", chart_type="line"/"bar"），
+      数值直接取自数据库并标注同比增长，不要把年度数字手工抄进data_summary
+
     【正确数据格式示例】：
     "请生成柱状图，数据：营业收入8900亿元，净利润800亿元，毛利率45%"
     "基于以下数据生成折线图：Q1营收100亿，Q2营收120亿，Q3营收150亿"
@@ -679,15 +749,9 @@ visualization_agent = AssistantAgent(
     2. 如果planner指令不明确，立即要求补充信息
     3. 确保传递给工具的数据是结构化的财务数字
     """
-)
 
 # ==================== 更新后的writer ====================
-writer = AssistantAgent(
-    "writer",
-    model_client=model_client,
-    handoffs=["planner"],
-    tools=[save_report_to_file],  # 添加保存报告的工具
-    system_message="""你是报告撰写人。汇总所有专家的信息，特别注意：
+WRITER_SYSTEM_MESSAGE = """你是报告撰写人。汇总所有专家的信息，特别注意：
     
     【报告要求】
     1. 注明数据来源（本地PDF分析/数据库/网络搜索）
@@ -756,14 +820,9 @@ writer = AssistantAgent(
     
     然后立即通知planner任务完成。
     """
-)
 
 # ==================== 更新后的planner ====================
-planner = AssistantAgent(
-    "planner",
-    model_client=model_client,
-    handoffs=["data_collector", "data_agent", "web_search_agent", "visualization_agent", "writer"],
-    system_message="""你是财务报表分析系统的总规划师，负责指挥整个分析流程。
+PLANNER_SYSTEM_MESSAGE = """你是财务报表分析系统的总规划师，负责指挥整个分析流程。
 
     【核心职责】：
     1. 智能需求识别：分析用户问题需要什么类型的数据
@@ -794,7 +853,8 @@ planner = AssistantAgent(
 
     【标准工作流程 - 严格按此顺序】：
     步骤1: 数据准备判断
-    - 根据上下文判断是否需要数据采集，只要用户的提问中涉及新的公司都必须进行数据采集 → 如果需要，handoff_to_data_collector
+    - 查看【数据可用性登记】：标记为"已就绪"的公司/年份直接到步骤2，不要重复采集
+    - 登记表中没有数据的新公司/年份必须进行数据采集 → handoff_to_data_collector
     - 如果已有数据或不需要采集 → 直接到步骤2
     
     步骤2: 本地数据分析
@@ -840,23 +900,110 @@ planner = AssistantAgent(
     - 请控制和智能体之间对话发生的次数，一旦当前任务完成，请立即结束任务，说"TASK_DONE"
     - 必须等待writer完成报告保存和展示后再结束任务
     """
-)
+
+# ==================== 智能体工厂 ====================
+# 智能体带有各自的对话上下文，每个会话都需要独立的实例；
+# 模型客户端、数据库、登记表等无状态资源在所有会话间共享
+
+def create_data_collector() -> AssistantAgent:
+    return AssistantAgent(
+        "data_collector",
+        model_client=model_client,
+        handoffs=["planner"],
+        tools=[check_user_uploaded_pdf, scrape_annual_report, save_data_to_local, collect_company_data_batch],
+        system_message=DATA_COLLECTOR_SYSTEM_MESSAGE
+    )
+
+def create_data_agent() -> AssistantAgent:
+    return AssistantAgent(
+        "data_agent",
+        model_client=model_client,
+        handoffs=["planner"],
+        tools=[get_financial_data, get_text_data],  # 直接调用工具，不通过handoff
+        system_message=DATA_AGENT_SYSTEM_MESSAGE
+    )
+
+def create_web_search_agent() -> AssistantAgent:
+    return AssistantAgent(
+        "web_search_agent",
+        model_client=model_client,
+        handoffs=["planner"],
+        tools=[search_market_info, search_market_info_many, search_market_info_deep],
+        system_message=WEB_SEARCH_AGENT_SYSTEM_MESSAGE
+    )
+
+def create_visualization_agent() -> AssistantAgent:
+    return AssistantAgent(
+        "visualization_agent",
+        model_client=model_client,
+        handoffs=["planner"],
+        tools=[generate_chart, generate_trend_chart],
+        system_message=VISUALIZATION_AGENT_SYSTEM_MESSAGE
+    )
+
+def create_writer(handoffs: Optional[list] = None, reflect_on_tool_use: bool = False) -> AssistantAgent:
+    return AssistantAgent(
+        "writer",
+        model_client=model_client,
+        handoffs=["planner"] if handoffs is None else handoffs,
+        tools=[save_report_to_file],  # 添加保存报告的工具
+        reflect_on_tool_use=reflect_on_tool_use,
+        system_message=WRITER_SYSTEM_MESSAGE
+    )
+
+def create_planner() -> AssistantAgent:
+    return AssistantAgent(
+        "planner",
+        model_client=model_client,
+        handoffs=["data_collector", "data_agent", "web_search_agent", "visualization_agent", "writer"],
+        system_message=PLANNER_SYSTEM_MESSAGE
+    )
+
+def create_team_participants() -> list:
+    """为一个会话创建完整的 Swarm 参与者列表"""
+    return [
+        create_planner(),
+        create_data_collector(),  # 新增的数据采集器
+        create_data_agent(),
+        create_web_search_agent(),
+        create_visualization_agent(),
+        create_writer()
+    ]
+
+def _saved_report_content(event: ToolCallRequestEvent) -> str:
+    """从 writer 的工具调用请求中取出 save_report_to_file 的报告正文"""
+    for call in event.content:
+        if call.name != "save_report_to_file":
+            continue
+        try:
+            return json.loads(call.arguments).get("report_content", "")
+        except (ValueError, AttributeError):
+            return ""
+    return ""
 
 # ==================== 主逻辑 ====================
+# 会话存储：记忆和团队状态在每轮对话后写入 SQLite，重启后可按 session_id 恢复
+session_store = SessionStore("./local_data/sessions.db")
+
 class FinancialAnalysisSystem:
-    def __init__(self):
-        self.memory = ListMemory()
-        self.data_collection_status = {}  # 记录各公司的数据采集状态
-        self.termination = TextMentionTermination("TASK_DONE") 
+    def __init__(self, session_id: Optional[str] = None, store: Optional[SessionStore] = session_store,
+                 max_hops: int = 12, max_tokens: Optional[int] = 60000, max_cycle_repeats: int = 3):
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.store = store
+        self.memory = ListMemory(summarizer=summarize_history, entity_extractor=data_registry.find_entities,
+                                 store=store, session_id=self.session_id)
+        # 记忆和团队状态都推迟到第一轮对话时异步加载，构造函数（server 的 system_factory）不读 SQLite
+        self._memory_restored = store is None
+        self._team_state_loaded = store is None
+        self.last_turn_usage = {"prompt_tokens": 0, "completion_tokens": 0, "messages": 0}
+        self.registry = data_registry  # 持久化的数据可用性登记表，替代原先按回复文本匹配的采集状态
+        # 除 TASK_DONE 外，再加上单轮 handoff 次数 / token 预算和循环检测，防止智能体互相踢皮球
+        self.turn_budget = TurnBudgetTermination(max_hops=max_hops, max_tokens=max_tokens,
+                                                 max_cycle_repeats=max_cycle_repeats)
+        self.termination = TextMentionTermination("TASK_DONE") | self.turn_budget
+        self.turn_stats = dict(self.turn_budget.last_counters)  # 最近一轮的 hop/token 计数，便于调参
         self.team = Swarm(
-            participants=[
-                planner, 
-                data_collector,  # 新增的数据采集器
-                data_agent, 
-                web_search_agent, 
-                visualization_agent, 
-                writer
-            ],
+            participants=create_team_participants(),
             termination_condition=self.termination
         )
         
@@ -865,16 +1012,40 @@ class FinancialAnalysisSystem:
         os.makedirs("./local_data", exist_ok=True)
         os.makedirs("./reports", exist_ok=True)  # 创建报告目录
 
-    async def run_turn(self, user_input: str):
-        # 1. 构建包含上下文的提示
-        history = self.memory.get_context()
+    async def _ensure_memory(self):
+        if self._memory_restored:
+            return
+        self._memory_restored = True
+        await self.memory.restore()
+    
+    async def _ensure_team_state(self):
+        if self._team_state_loaded:
+            return
+        self._team_state_loaded = True
+        state = await asyncio.to_thread(self.store.load_team_state, self.session_id)
+        if state:
+            await self.team.load_state(state)
+            logger.info(f"会话 {self.session_id} 的团队状态已恢复")
+    
+    async def _persist_team_state(self):
+        if self.store is None:
+            return
+        try:
+            self.store.save_team_state(self.session_id, await self.team.save_state())
+        except Exception as e:
+            logger.error(f"保存团队状态失败: {e}")
+    
+    async def run_turn(self, user_input: str,
+                       on_message: Optional[Callable[[TextMessage], Awaitable[None]]] = None) -> str:
+        """运行一轮对话，返回最终回答；on_message 用于把中间消息实时推送给调用方（如 WebSocket）"""
+        await self._ensure_memory()
+        await self._ensure_team_state()
         
-        # 2. 添加数据采集状态信息
-        collection_status_str = "【各公司数据采集状态】:\n"
-        for key, status in self.data_collection_status.items():
-            collection_status_str += f"- {key}: {'已采集' if status else '未采集'}\n"
-        if not self.data_collection_status:
-            collection_status_str += "尚无数据采集记录\n"
+        # 1. 构建包含上下文的提示（只注入与当前问题相关的历史）
+        history = self.memory.get_relevant_context(user_input)
+        
+        # 2. 查询数据可用性登记表，已有数据的公司/年份无需再次采集
+        collection_status_str = self.registry.format_status(user_input)
         
         # 3. 分析用户需求类型
         user_input_lower = user_input.lower()
@@ -910,7 +1081,7 @@ class FinancialAnalysisSystem:
         【特别提醒】:
         1. 首先判断用户需要什么类型的数据（财务数据/文本分析/两者都需要）
         2. 根据需求类型给data_agent明确的指令
-        3. 如果用户询问具体公司的财务分析，请先判断是否需要调用数据采集器
+        3. 如果用户询问具体公司的财务分析，请先查看【数据可用性登记】，标记为"已就绪"的公司/年份不要再调用数据采集器
         4. 按照标准流程指挥：数据准备 → 数据提取 → 市场信息 → 可视化 → 报告生成
         5. 必须确保writer生成报告并保存到本地文件
         """
@@ -918,43 +1089,126 @@ class FinancialAnalysisSystem:
         # 存储用户输入
         self.memory.add(user_input, "User")
         
+        # 简单问题走直达路由，省去 planner 的 LLM 规划和 handoff
+        route = route_intent(user_input, has_finance_need, has_text_need, self.registry)
+        if route is not None:
+            return await self._run_direct(route, user_input, history, on_message)
+        
         last_response = ""
         last_planner_message = ""
+        last_writer_message = ""
+        last_expert_message = ""
         
         # 3. 运行对话流
         print(f"\n{'='*10} 系统开始思考 {'='*10}")
         print(f"📋 需求分析: {need_analysis}")
         
+        # 工具内嵌智能体的用量也会累加到 usage（见 turn_budget.add_nested_usage）
+        usage = start_turn_usage()
+        self.last_turn_usage = usage
+        
         async for msg in self.team.run_stream(task=full_prompt):
+            add_usage(usage, msg)
             if isinstance(msg, TextMessage):
+                usage["messages"] += 1
                 print(f"\n🗣️  [{msg.source}]: {msg.content}")
                 last_response = msg.content
                 
-                # 智能检测数据采集完成并更新状态
-                if msg.source == "data_collector":
-                    content = msg.content.lower()
-                    if "华为" in content and "2023" in content and "完成" in content:
-                        key = "华为_2023"
-                        self.data_collection_status[key] = True
-                        print(f"✅ 系统自动记录: {key} 数据采集完成")
-                    elif "腾讯" in content and "完成" in content:
-                        for year in ["2024", "2023", "2022"]:
-                            if year in content:
-                                key = f"腾讯_{year}"
-                                self.data_collection_status[key] = True
-                                print(f"✅ 系统自动记录: {key} 数据采集完成")
-                
                 if msg.source == "planner":
                     last_planner_message = msg.content
+                elif msg.source == "writer":
+                    last_writer_message = msg.content
+                else:
+                    last_expert_message = msg.content
+                
+                if on_message is not None:
+                    await on_message(msg)
         
         print(f"\n{'='*10} 本轮结束 {'='*10}")
         
+        self.turn_stats = dict(self.turn_budget.last_counters)
+        stop_reason = self.turn_stats.get("stop_reason")
+        if stop_reason:
+            # 预算耗尽或检测到循环：返回目前最好的结果，并重置团队以便下一轮从 planner 重新开始
+            print(f"⚠️ 本轮提前结束: {stop_reason} (hops={self.turn_stats['hops']}, "
+                  f"tokens={self.turn_stats['prompt_tokens'] + self.turn_stats['completion_tokens']})")
+            best = last_writer_message or last_expert_message or self._extract_useful_content(last_response)
+            answer = f"{best}\n\n⚠️ 本轮因{stop_reason}提前结束，以上为目前获得的最佳结果。" if best else \
+                f"⚠️ 本轮因{stop_reason}提前结束，尚未获得有效结果。"
+            self.memory.add(answer, "System")
+            await self.team.reset()
+            await self._persist_team_state()
+            return answer
+        
         # 4. 存储非终止的系统回复
         if last_response and not self.memory._contains_termination(last_response):
             useful_content = self._extract_useful_content(last_response)
             if useful_content:
                 self.memory.add(useful_content, "System")
                 print(f"📝 已将系统回复存入记忆")
+        
+        await self._persist_team_state()
+        return last_writer_message or self._extract_useful_content(last_response)
+
+    async def _run_direct(self, route: dict, user_input: str, history: str,
+                          on_message: Optional[Callable[[TextMessage], Awaitable[None]]] = None) -> str:
+        """直达路由：并发调用数据工具，再直接交给 writer 生成报告"""
+        company, year = route["company"], route["year"]
+        print(f"\n{'='*10} 直达路由: {company} {year}（跳过planner）{'='*10}")
+        
+        jobs = {}
+        if route["finance"]:
+            jobs["财务数据"] = get_financial_data(company, year)
+        if route["text"]:
+            jobs["文本分析"] = get_text_data(company, year)
+        results = dict(zip(jobs, await asyncio.gather(*jobs.values(), return_exceptions=True)))
+        
+        data_sections = "\n".join(
+            f"{name}：{result if not isinstance(result, Exception) else f'❌ 提取失败: {result}'}"
+            for name, result in results.items()
+        )
+        task = f"""{history}
+        
+        【当前用户指令】: {user_input}
+        
+        writer，请基于以下数据生成{company}{year}年的分析报告：
+        {data_sections}
+        市场信息：无
+        图表信息：无
+        
+        请生成完整的报告并保存到本地文件。"""
+        
+        # 工具内嵌智能体的用量也会累加到 usage（见 turn_budget.add_nested_usage）
+        usage = start_turn_usage()
+        self.last_turn_usage = usage
+        answer = ""
+        saved_report = ""
+        tool_summary = ""
+        # 没有 handoff 时工具调用会直接结束运行，需要 reflect 才能得到 writer 的最终回复
+        async for msg in create_writer(handoffs=[], reflect_on_tool_use=True).run_stream(task=task):
+            add_usage(usage, msg)
+            if isinstance(msg, ToolCallRequestEvent):
+                saved_report = _saved_report_content(msg) or saved_report
+            elif isinstance(msg, ToolCallSummaryMessage) and msg.source == "writer":
+                tool_summary = msg.content
+            elif isinstance(msg, TextMessage) and msg.source == "writer":
+                usage["messages"] += 1
+                answer = msg.content
+                print(f"\n🗣️  [{msg.source}]: {msg.content}")
+                if on_message is not None:
+                    await on_message(msg)
+        
+        # 模型未给出文字回复时，以保存的报告正文（其次是工具结果）作为本轮回答
+        if not answer.strip():
+            answer = saved_report or tool_summary
+            if answer and on_message is not None:
+                await on_message(TextMessage(content=answer, source="writer"))
+        
+        print(f"\n{'='*10} 本轮结束 {'='*10}")
+        useful_content = self._extract_useful_content(answer)
+        if useful_content:
+            self.memory.add(useful_content, "System")
+        return useful_content
 
     def _extract_useful_content(self, content: str) -> str:
         """从可能包含终止标记的消息中提取有用内容"""
@@ -976,26 +1230,16 @@ class FinancialAnalysisSystem:
 
 # ==================== 启动入口 ====================
 
-async def main():
-    print("\n💰 金融多智能体分析系统 v6.0（报告保存功能）已启动")
-    print("=" * 50)
-    print("🎯 新功能特性:")
-    print("   - 保留writer智能体，优化其功能")
-    print("   - 新增报告保存到本地文件功能")
-    print("   - 支持TXT和JSON双格式保存")
-    print("   - 自动创建reports目录存储历史报告")
-    print("=" * 50)
-    
-    # 测试LLM连接
-    if not await test_llm():
-        print("❌ LLM连接失败，请检查配置")
-        return
-    
-    system = FinancialAnalysisSystem()
+async def run_cli():
+    """单用户命令行交互"""
+    # 设置环境变量 FIN_AGENT_SESSION_ID 可恢复之前的会话
+    system = FinancialAnalysisSystem(session_id=os.environ.get("FIN_AGENT_SESSION_ID"))
+    print(f"🗂️  会话ID: {system.session_id}")
 
     while True:
         try:
-            user_input = input("\n👤 请输入指令: ").strip()
+            # input() 放到线程中执行，避免阻塞事件循环上的后台任务
+            user_input = (await asyncio.to_thread(input, "\n👤 请输入指令: ")).strip()
             if not user_input: 
                 continue
             if user_input.lower() in ["exit", "quit", "退出"]: 
@@ -1011,4 +1255,64 @@ async def main():
             import traceback
             traceback.print_exc()
 
+async def run_service():
+    """多会话服务模式：每个会话独立的记忆和团队，共享模型客户端、数据库和登记表"""
+    from server import run_server
+    await run_server(
+        lambda session_id: FinancialAnalysisSystem(session_id=session_id),
+        host=os.environ.get("FIN_AGENT_HOST", "127.0.0.1"),
+        port=int(os.environ.get("FIN_AGENT_PORT", "8080")),
+        max_sessions=int(os.environ.get("FIN_AGENT_MAX_SESSIONS", "64")),
+        max_concurrent_turns=int(os.environ.get("FIN_AGENT_MAX_TURNS", "16"))
+    )
+
+async def run_batch_mode():
+    """批量模式：从文件读取问题，并发运行并把结果、耗时和 token 数写入 JSONL，支持断点续跑"""
+    from batch_runner import run_batch
+    await run_batch(
+        os.environ.get("FIN_AGENT_BATCH_INPUT", "./batch_questions.txt"),
+        os.environ.get("FIN_AGENT_BATCH_OUTPUT", "./reports/batch_results.jsonl"),
+        # 每个问题使用独立的系统实例，不写入会话存储
+        lambda session_id: FinancialAnalysisSystem(session_id=session_id, store=None),
+        concurrency=int(os.environ.get("FIN_AGENT_BATCH_CONCURRENCY", "4")),
+        resume=os.environ.get("FIN_AGENT_BATCH_RESUME", "1") != "0"
+    )
+
+async def main():
+    print("\n💰 金融多智能体分析系统 v6.0（报告保存功能）已启动")
+    print("=" * 50)
+    print("🎯 新功能特性:")
+    print("   - 保留writer智能体，优化其功能")
+    print("   - 新增报告保存到本地文件功能")
+    print("   - 支持TXT和JSON双格式保存")
+    print("   - 自动创建reports目录存储历史报告")
+    print("=" * 50)
+    
+    # 测试LLM连接
+    if not await test_llm():
+        print("❌ LLM连接失败，请检查配置")
+        return
+    
+    # 后台监听上传目录，数据在用户提问前就已准备好
+    await upload_watcher.start()
+    # 图表渲染进程池默认在第一次画图时才启动；CHART_RENDER_WARMUP=1 时提前预热，
+    # 第一次画图无需等待 matplotlib 导入，代价是启动时即创建全部工作进程
+    if os.environ.get("CHART_RENDER_WARMUP") == "1":
+        chart_renderer.start()
+    
+    # 运行模式: cli（默认，命令行交互）/ server（多会话 HTTP/WebSocket 服务）/ batch（批量问题）
+    run_mode = os.environ.get("FIN_AGENT_MODE", "cli")
+    try:
+        if run_mode == "server":
+            await run_service()
+        elif run_mode == "batch":
+            await run_batch_mode()
+        else:
+            await run_cli()
+    finally:
+        await upload_watcher.stop()
+        chart_renderer.shutdown()
+        await baidu_agent.aclose()
+        await session_store.close()
+
 await main()
\ No newline at end of file
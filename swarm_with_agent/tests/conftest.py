@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# 测试直接导入 swarm_with_agent 下的扁平模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 临时的财务数据库，通过 CHART_DB_PATHS 供 chart_data 读取
+@pytest.fixture
+def financial_db(tmp_path, monkeypatch):
+    path = tmp_path / "financial_data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE financial_records (id INTEGER PRIMARY KEY AUTOINCREMENT, company_name TEXT, "
+                 "year TEXT, item_name TEXT, amount REAL)")
+    conn.executemany("INSERT INTO financial_records (company_name, year, item_name, amount) VALUES (?, ?, ?, ?)", [
+        ("比亚迪", "2023", "营业总收入", 500e8),
+        ("比亚迪", "2023", "净利润", 30e8),
+        ("比亚迪", "2023", "营业总收入", 602.3e8),    # 后写入的更正值
+        ("比亚迪", "2022", "营业总收入", 424e8),
+        ("宁德时代", "2023", "营业总收入", 4009e8),
+    ])
+    conn.commit()
+    conn.close()
+    monkeypatch.setenv("CHART_DB_PATHS", str(path))
+    return path
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import threading
+
+import batch_runner
+from batch_runner import load_questions, question_id, run_batch
+
+
+class _FakeSystem:
+    def __init__(self, session_id, calls):
+        self.session_id = session_id
+        self.calls = calls
+
+    async def run_turn(self, question):
+        self.calls.append((self.session_id, question))
+        return f"answer: {question}"
+
+
+def _run(questions_path, output_path, calls):
+    return asyncio.run(run_batch(str(questions_path), str(output_path),
+                                 lambda session_id: _FakeSystem(session_id, calls), concurrency=2))
+
+
+def test_ids_survive_inserted_lines(tmp_path):
+    path = tmp_path / "questions.txt"
+    path.write_text("华为2023营收\n比亚迪2023净利润\n", encoding="utf-8")
+    before = {q["question"]: q["id"] for q in load_questions(str(path))}
+    path.write_text("# 新增注释\n腾讯2022营收\n华为2023营收\n比亚迪2023净利润\n", encoding="utf-8")
+    after = {q["question"]: q["id"] for q in load_questions(str(path))}
+    assert before["华为2023营收"] == after["华为2023营收"]
+    assert before["比亚迪2023净利润"] == after["比亚迪2023净利润"]
+
+
+def test_duplicate_questions_get_distinct_ids(tmp_path):
+    path = tmp_path / "questions.txt"
+    path.write_text("同一个问题\n同一个问题\n", encoding="utf-8")
+    ids = [q["id"] for q in load_questions(str(path))]
+    assert ids == [question_id("同一个问题"), question_id("同一个问题", 2)]
+
+
+def test_resume_after_questions_file_is_rewritten(tmp_path):
+    questions = tmp_path / "questions.txt"
+    output = tmp_path / "out.jsonl"
+    calls = []
+    questions.write_text("问题A\n问题B\n", encoding="utf-8")
+    _run(questions, output, calls)
+    assert len(calls) == 2
+
+    calls.clear()
+    questions.write_text("问题C\n问题B\n问题A\n", encoding="utf-8")
+    summary = _run(questions, output, calls)
+    assert [q for _, q in calls] == ["问题C"]
+    assert summary["skipped"] == 2
+
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert {r["question"]: r["answer"] for r in records}["问题A"] == "answer: 问题A"
+
+
+def test_changed_question_with_explicit_id_is_rerun(tmp_path):
+    questions = tmp_path / "questions.jsonl"
+    output = tmp_path / "out.jsonl"
+    calls = []
+    questions.write_text(json.dumps({"id": "q1", "question": "旧问题"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    _run(questions, output, calls)
+    questions.write_text(json.dumps({"id": "q1", "question": "新问题"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    _run(questions, output, calls)
+    assert [q for _, q in calls] == ["旧问题", "新问题"]
+
+
+def test_fsync_runs_off_the_event_loop_and_batches_records(tmp_path, monkeypatch):
+    questions = tmp_path / "questions.txt"
+    output = tmp_path / "out.jsonl"
+    questions.write_text("".join(f"问题{i}\n" for i in range(8)), encoding="utf-8")
+    fsync_threads = []
+    real_fsync = batch_runner.os.fsync
+
+    def fsync(fd):
+        fsync_threads.append(threading.get_ident())
+        real_fsync(fd)
+
+    monkeypatch.setattr(batch_runner.os, "fsync", fsync)
+    calls = []
+    asyncio.run(run_batch(str(questions), str(output),
+                          lambda session_id: _FakeSystem(session_id, calls), concurrency=8))
+
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 8
+    assert threading.get_ident() not in fsync_threads
+    # 同时完成的记录合并写入，fsync 次数少于记录数
+    assert 1 <= len(fsync_threads) < 8
@@ -0,0 +1,72 @@
+import json
+
+from visualization_agent import ChartCache
+
+
+def _put(cache: ChartCache, name: str, size: int = 100):
+    path = cache.directory + "/" + name
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG" + b"\0" * (size - 4))
+    cache.put(name, {"status": "success", "size_bytes": size, "filepath": path, "chart_type": "bar"})
+
+
+def _index(cache: ChartCache) -> dict:
+    with open(cache.index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_hit_miss_and_outputs(tmp_path):
+    cache = ChartCache(str(tmp_path), max_bytes=10_000)
+    assert cache.get("bar_x.png", ("file",)) is None
+    _put(cache, "bar_x.png")
+    hit = cache.get("bar_x.png", ("file", "base64", "png"))
+    assert hit["cached"] and hit["chart_type"] == "bar"
+    assert hit["png_bytes"].startswith(b"\x89PNG") and hit["image_base64"]
+    assert cache.stats == {"hits": 1, "misses": 1, "evicted": 0}
+
+    (tmp_path / "bar_x.png").unlink()                        # 文件被删除后视为未命中
+    assert cache.get("bar_x.png", ("file",)) is None
+
+
+def test_hits_update_recency_in_memory_until_flush(tmp_path):
+    cache = ChartCache(str(tmp_path), max_bytes=10_000)
+    _put(cache, "bar_a.png")
+    written = _index(cache)["bar_a.png"]["last_used"]
+
+    writes = []
+    save_index = cache._save_index
+    cache._save_index = lambda: (writes.append(1), save_index())
+    for _ in range(5):
+        cache.get("bar_a.png", ("file",))
+    assert writes == []
+    assert _index(cache)["bar_a.png"]["last_used"] == written
+
+    cache.flush()
+    cache.flush()                                            # 没有新的命中时不再写入
+    assert writes == [1]
+    reloaded = ChartCache(str(tmp_path))
+    reloaded._load()
+    assert reloaded._entries["bar_a.png"]["last_used"] == cache._entries["bar_a.png"]["last_used"] > written
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ChartCache(str(tmp_path), max_bytes=250)
+    _put(cache, "bar_a.png")
+    _put(cache, "bar_b.png")
+    cache._entries["bar_a.png"]["last_used"] -= 10
+    cache._entries["bar_b.png"]["last_used"] -= 5
+    cache.get("bar_a.png", ("file",))                        # a 最近被使用，b 成为最久未用
+    _put(cache, "bar_c.png")
+
+    assert sorted(cache._entries) == ["bar_a.png", "bar_c.png"]
+    assert not (tmp_path / "bar_b.png").exists()
+    assert sorted(_index(cache)) == ["bar_a.png", "bar_c.png"]
+
+
+def test_key_depends_on_category_order_not_keyword_order():
+    first = ChartCache.key("generate_bar_chart", ({"Revenue": 1.0, "Net Profit": 2.0},), {"title": "A", "style": "x"})
+    reordered = ChartCache.key("generate_bar_chart", ({"Net Profit": 2.0, "Revenue": 1.0},), {"title": "A", "style": "x"})
+    kwargs_swapped = ChartCache.key("generate_bar_chart", ({"Revenue": 1.0, "Net Profit": 2.0},),
+                                    {"style": "x", "title": "A", "outputs": ("file",)})
+    assert first != reordered
+    assert first == kwargs_swapped
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+import chart_data
+
+
+def test_latest_record_wins_for_duplicate_items(financial_db):
+    assert chart_data.load_metrics("比亚迪", 2023) == {"Revenue": 602.3, "Net Profit": 30.0}
+
+
+def test_unknown_metric_names_are_rejected(financial_db):
+    with pytest.raises(ValueError, match="未知指标"):
+        chart_data.resolve_chart_input(json.dumps({"company": "比亚迪", "year": 2023, "metrics": ["毛利率", "ROE"]}))
+    with pytest.raises(ValueError, match="未知指标"):
+        chart_data.load_metric_rows(["比亚迪"], ["Gross Margin"])
+
+    partial = chart_data.resolve_chart_input(
+        json.dumps({"company": "比亚迪", "year": 2023, "metrics": ["营收", "毛利率"]}))
+    assert partial["metrics"] == {"Revenue": 602.3}
+
+
+def test_yoy_growth_handles_zero_and_missing_prior_years():
+    growth = chart_data.yoy_growth({"2023": 120.0, "2020": 0.0, "2021": 50.0, "2022": 100.0, "2024": -60.0})
+    assert list(growth) == ["2020", "2021", "2022", "2023", "2024"]
+    assert growth["2020"] is None                 # 首年
+    assert growth["2021"] is None                 # 上年为 0
+    assert growth["2022"] == pytest.approx(100.0)
+    assert growth["2024"] == pytest.approx(-150.0)
+    # 年份不连续时不计算同比
+    assert chart_data.yoy_growth({"2020": 10.0, "2022": 20.0}) == {"2020": None, "2022": None}
+    assert chart_data.yoy_growth({}) == {}
+
+
+def test_load_metric_series(financial_db):
+    series = chart_data.load_metric_series(["宁德时代", "比亚迪", "华为"], "Revenue")
+    assert list(series) == ["宁德时代", "比亚迪"]              # 按传入顺序，没有数据的公司不出现
+    assert series["比亚迪"] == {"2022": 424.0, "2023": 602.3}  # 年份升序，重复项取最新
+    assert chart_data.load_metric_series(["比亚迪"], "Revenue", ["2023"]) == {"比亚迪": {"2023": 602.3}}
+    assert chart_data.load_metric_series(["比亚迪"], "R&D Expenses") == {}
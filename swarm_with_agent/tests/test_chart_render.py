@@ -0,0 +1,64 @@
+import asyncio
+import sys
+
+import visualization_agent
+from visualization_agent import ChartRenderService
+
+
+def _fake_main(monkeypatch, tmp_path, source: str):
+    script = tmp_path / "entry.py"
+    script.write_text(source, encoding="utf-8")
+    monkeypatch.setattr(sys.modules["__main__"], "__file__", str(script), raising=False)
+
+
+def test_unguarded_entry_point_renders_in_thread_with_agg(monkeypatch, tmp_path):
+    _fake_main(monkeypatch, tmp_path, "import asyncio\nawait main()\n")
+    monkeypatch.chdir(tmp_path)
+    service = ChartRenderService(max_workers=2)
+    service.start()
+    assert service._pool is None and service.max_workers == 0
+
+    result = asyncio.run(service.render("generate_bar_chart", {"Revenue": 10.0, "Net Profit": 2.0}, "Test"))
+    assert result["status"] == "success"
+    import matplotlib
+    assert matplotlib.get_backend().lower() == "agg"
+
+
+def test_guarded_entry_point_is_spawn_safe(monkeypatch, tmp_path):
+    _fake_main(monkeypatch, tmp_path, "def main():\n    pass\n\nif __name__ == '__main__':\n    main()\n")
+    assert visualization_agent._spawn_safe_entry_point()
+    monkeypatch.delattr(sys.modules["__main__"], "__file__")
+    assert visualization_agent._spawn_safe_entry_point()   # 交互式会话没有入口文件
+
+
+def _record_renders(monkeypatch):
+    calls = []
+
+    async def render(method, *args, **kwargs):
+        calls.append((method, args))
+        return {"status": "success", "chart_type": method, "title": "t", "filepath": "chart.png"}
+
+    monkeypatch.setattr(visualization_agent.chart_renderer, "render", render)
+    return calls
+
+
+def test_line_chart_uses_multi_year_series(financial_db, monkeypatch):
+    calls = _record_renders(monkeypatch)
+    asyncio.run(visualization_agent._generate_specific_chart({"Revenue": 602.3}, "line", "", "比亚迪", "2023"))
+    [(method, args)] = calls
+    assert method == "generate_trend_chart"
+    assert args[0] == {"比亚迪": {"2022": 424.0, "2023": 602.3}}
+
+
+def test_line_chart_with_single_year_falls_back_to_bar(financial_db, monkeypatch):
+    calls = _record_renders(monkeypatch)
+    asyncio.run(visualization_agent._generate_specific_chart({"Revenue": 4009.0}, "line", "", "宁德时代", "2023"))
+    assert [method for method, _ in calls] == ["generate_bar_chart"]
+
+    # 趋势图工具不画单年数据，直接提示
+    message = asyncio.run(visualization_agent.generate_trend_chart("宁德时代", "营业收入"))
+    assert message.startswith("❌") and "fewer than two years" in message
+    # 多家公司时只画有两年以上数据的公司
+    calls.clear()
+    asyncio.run(visualization_agent.generate_trend_chart("比亚迪,宁德时代", "Revenue"))
+    assert list(calls[0][1][0]) == ["比亚迪"]
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+from data_collection import (STATUS_FAILED, STATUS_READY, STATUS_SIMULATED, STATUS_SUCCESS, DataCollector,
+                             format_collection_report, parse_collection_targets)
+from data_registry import DataRegistry
+
+
+def _make_collector(tmp_path, registry: DataRegistry, scraped: list):
+    uploads = {("华为", "2023"): str(tmp_path / "华为_2023_report.pdf")}
+
+    async def check_upload(company, year):
+        path = uploads.get((company, year))
+        return {"has_pdf": bool(path), "file_path": path}
+
+    async def ingest_upload(path):
+        return {"status": "success", "local_path": path.replace(".pdf", "_processed.json")}
+
+    async def scrape(company, year):
+        scraped.append((company, year))
+        await asyncio.sleep(0)
+        if company == "小米":
+            raise ConnectionError("连接被重置")
+        if company == "蔚来":
+            return {"status": "error"}
+        return {"company": company, "year": year, "status": "success", "simulated": company == "美团",
+                "local_path": str(tmp_path / f"{company}_{year}_processed.json")}
+
+    async def save(data):
+        with open(data["local_path"], "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        registry.record_json(data["company"], data["year"], data["local_path"])
+        return f"已保存 {data['local_path']}"
+
+    return DataCollector(registry, check_upload, ingest_upload, scrape, save)
+
+
+def test_batch_reports_per_item_status(tmp_path):
+    registry = DataRegistry(str(tmp_path / "registry.db"))
+    registry.record_db_rows("比亚迪", "2023", 120)
+    scraped = []
+    collector = _make_collector(tmp_path, registry, scraped)
+    pairs = parse_collection_targets("比亚迪:2023, 华为:2023, 腾讯:2023, 美团:2024, 小米:2023, 蔚来:2023")
+
+    results = asyncio.run(collector.collect_batch(pairs, max_concurrency=2))
+    statuses = {(r["company"], r["year"]): r["status"] for r in results}
+
+    assert [(r["company"], r["year"]) for r in results] == pairs
+    assert statuses == {
+        ("比亚迪", "2023"): STATUS_READY,        # 登记表已有数据，不爬取
+        ("华为", "2023"): STATUS_SUCCESS,        # 使用用户上传的PDF
+        ("腾讯", "2023"): STATUS_SUCCESS,        # 爬取并登记
+        ("美团", "2024"): STATUS_SIMULATED,      # 已保存但只是模拟数据
+        ("小米", "2023"): STATUS_FAILED,         # 爬取异常
+        ("蔚来", "2023"): STATUS_FAILED,         # 爬取无有效数据
+    }
+    assert sorted(scraped) == sorted([("腾讯", "2023"), ("美团", "2024"), ("小米", "2023"), ("蔚来", "2023")])
+    assert registry.has_data("腾讯", "2023") and not registry.has_data("美团", "2024")
+    assert os.path.exists(tmp_path / "美团_2024_processed.json")
+
+    report = format_collection_report(results)
+    assert "成功/已就绪 3 项，失败 2 项" in report and "1 项只有模拟数据" in report
+
+
+def test_parse_collection_targets():
+    assert parse_collection_targets("华为:2023, 腾讯：2022-2024, 美团:2023/2024, 华为:2023") == [
+        ("华为", "2023"), ("腾讯", "2022"), ("腾讯", "2023"), ("腾讯", "2024"), ("美团", "2023"), ("美团", "2024")]
+    assert parse_collection_targets("没有年份") == []
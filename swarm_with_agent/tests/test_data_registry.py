@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+
+from data_registry import DataRegistry, parse_company_year
+
+
+def _make_source_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE annual_reports (company_name TEXT, year INTEGER, total_revenue REAL)")
+    conn.executemany("INSERT INTO annual_reports VALUES (?, ?, ?)",
+                     [("华为", 2023, 7042), ("华为", 2022, 6423), ("比亚迪", 2023, 6023)])
+    conn.commit()
+    conn.close()
+
+
+def _tables(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    finally:
+        conn.close()
+
+
+def _write_json(path, payload):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+
+def test_registry_lives_outside_the_financial_db(tmp_path):
+    source = str(tmp_path / "financial.db")
+    _make_source_db(source)
+    registry = DataRegistry(str(tmp_path / "registry.db"), source_db_path=source)
+    registry.scan_sources(local_data_dir=str(tmp_path), upload_dir=str(tmp_path / "uploads"))
+
+    assert "data_availability" not in _tables(source)
+    assert registry.get("华为", 2023)["db_rows"] == 1
+    assert registry.has_data("比亚迪", "2023")
+    assert not registry.has_data("腾讯", "2023")
+
+    reloaded = DataRegistry(str(tmp_path / "registry.db"), source_db_path=source)
+    assert reloaded.years_of("华为") == ["2022", "2023"]
+
+
+def test_financial_db_is_only_read(tmp_path):
+    source = tmp_path / "financial.db"
+    _make_source_db(str(source))
+    before = source.read_bytes()
+    DataRegistry(str(tmp_path / "registry.db"), source_db_path=str(source)).scan_sources(
+        local_data_dir=str(tmp_path), upload_dir=str(tmp_path / "uploads"))
+    assert source.read_bytes() == before
+    assert _tables(str(source)) == {"annual_reports"}
+
+
+def test_simulated_json_is_not_registered(tmp_path):
+    _write_json(tmp_path / "美团_2024_processed.json", {"company": "美团", "year": "2024", "simulated": True})
+    _write_json(tmp_path / "阿里巴巴_2024_processed.json", {"company": "阿里巴巴", "year": "2024"})
+    registry = DataRegistry(str(tmp_path / "registry.db"))
+    registry.scan_sources(local_data_dir=str(tmp_path), upload_dir=str(tmp_path / "uploads"))
+
+    assert not registry.has_data("美团", "2024")
+    assert registry.get("阿里巴巴", "2024")["processed_json"].endswith("阿里巴巴_2024_processed.json")
+
+
+def test_parse_company_year():
+    assert parse_company_year("比亚迪_2024_report.pdf") == ("比亚迪", "2024")
+    assert parse_company_year("/x/腾讯控股-2023.pdf") == ("腾讯控股", "2023")
+    assert parse_company_year("notes.pdf") == (None, None)
+
+
+def test_record_json_skips_simulated_files(tmp_path):
+    simulated, real = tmp_path / "美团_2024_processed.json", tmp_path / "美团_2023_processed.json"
+    _write_json(simulated, {"company": "美团", "year": "2024", "simulated": True})
+    _write_json(real, {"company": "美团", "year": "2023"})
+    registry = DataRegistry(str(tmp_path / "registry.db"))
+
+    assert registry.record_json("美团", "2024", str(simulated)) is False
+    assert registry.record_json("美团", "2023", str(real)) is True
+    assert registry.years_of("美团") == ["2023"]
@@ -0,0 +1,54 @@
+import pytest
+
+from data_registry import DataRegistry
+from intent_router import route_intent
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = DataRegistry(str(tmp_path / "registry.db"))
+    registry.record_db_rows("华为", 2023, 12)                      # 只有数据库记录
+    registry.record_json("美团", 2024, str(tmp_path / "美团.json"))  # 只有文本JSON
+    registry.record_db_rows("比亚迪", 2023, 8)                      # 两者都有
+    registry.record_json("比亚迪", 2023, str(tmp_path / "比亚迪.json"))
+    return registry
+
+
+def test_finance_question_with_db_rows_goes_direct(registry):
+    route = route_intent("华为2023年营收和利润怎么样", True, False, registry)
+    assert route == {"company": "华为", "year": "2023", "finance": True, "text": False}
+    # 指标之间的 "和"/"与" 不是多公司并列
+    assert route_intent("华为2023年营收与净利润", True, False, registry) is not None
+
+
+def test_finance_question_with_only_json_goes_to_planner(registry):
+    assert route_intent("美团2024年营收", True, False, registry) is None
+
+
+def test_text_question_needs_processed_json(registry):
+    assert route_intent("华为2023年管理层观点", False, True, registry) is None
+    assert route_intent("美团2024年管理层观点", False, True, registry)["company"] == "美团"
+
+
+def test_combined_question_needs_both_sources(registry):
+    assert route_intent("华为2023年利润和管理层观点", True, True, registry) is None
+    assert route_intent("比亚迪2023年利润和管理层观点", True, True, registry) is not None
+
+
+@pytest.mark.parametrize("question", [
+    "华为2023年营收画个图",          # 可视化
+    "华为2023年营收和最新股价",      # 需要搜索
+    "华为和比亚迪2023年营收对比",    # 多公司
+    "华为2022和2023年营收",          # 多年份
+    "腾讯2023年营收",                # 未登记的公司
+    "比较华为和小米2023年营收",      # 对比词，小米未登记
+    "华为和小米2023年营收",          # 与未登记的公司并列
+    "小米与华为2023年净利润",
+    "华为 vs 小米 2023 营收",
+])
+def test_ambiguous_or_unready_questions_go_to_planner(registry, question):
+    assert route_intent(question, True, False, registry) is None
+
+
+def test_no_detected_need_goes_to_planner(registry):
+    assert route_intent("华为2023", False, False, registry) is None
@@ -0,0 +1,115 @@
+import asyncio
+import sqlite3
+
+from list_memory import ListMemory
+from session_store import SessionStore
+
+
+def test_restore_does_not_resummarize_folded_messages(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    seen_batches = []
+
+    async def summarizer(previous, new_lines):
+        seen_batches.append(new_lines)
+        return (previous + " | " if previous else "") + f"{new_lines.count(chr(10))}条"
+
+    async def first_run():
+        store = SessionStore(db_path, batch_interval=0)
+        memory = ListMemory(max_messages=5, max_chars=25, summarizer=summarizer, store=store, session_id="s1")
+        for i in range(6):
+            memory.add(f"消息{i}", "user")
+            await memory.wait_compaction()
+        await store.close()
+        return memory.summary
+
+    summary = asyncio.run(first_run())
+    # 字符预算只容纳两条消息，前四条已并入摘要
+    assert sum(batch.count("\n") for batch in seen_batches) == 4
+    seen_batches.clear()
+
+    async def second_run():
+        store = SessionStore(db_path, batch_interval=0)
+        memory = ListMemory(max_messages=5, max_chars=25, summarizer=summarizer, store=store, session_id="s1")
+        await memory.restore()
+        await memory.wait_compaction()
+        await store.close()
+        return memory
+
+    memory = asyncio.run(second_run())
+    assert seen_batches == []
+    assert memory.summary == summary
+    assert [m.content for m in memory.messages] == ["消息4", "消息5"]
+
+
+def test_restore_without_summary_loads_recent_window(tmp_path):
+    async def scenario():
+        store = SessionStore(str(tmp_path / "sessions.db"), batch_interval=0)
+        memory = ListMemory(max_messages=10, store=store, session_id="s2")
+        for i in range(5):
+            memory.add(f"问题{i}", "user")
+        await store.flush()
+        restored = ListMemory(max_messages=2, store=store, session_id="s2")
+        await restored.restore()
+        await store.close()
+        return restored
+
+    restored = asyncio.run(scenario())
+    assert [m.content for m in restored.messages] == ["问题3", "问题4"]
+
+
+def test_budget_eviction_keeps_context_bounded():
+    memory = ListMemory(max_messages=100, max_chars=60)
+    for i in range(20):
+        memory.add(f"第{i}条消息内容", "user")
+    assert memory._total_chars <= 60
+    assert "第19条" in memory.get_context() and "第0条" not in memory.get_context()
+
+
+def test_restore_after_store_compaction_and_new_messages(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+
+    async def summarizer(previous, new_lines):
+        return "摘要"
+
+    async def scenario():
+        store = SessionStore(db_path, batch_interval=0)
+        memory = ListMemory(max_messages=3, summarizer=summarizer, store=store, session_id="s3")
+        for i in range(6):
+            memory.add(f"消息{i}", "user")
+            await memory.wait_compaction()
+        await store.flush()
+
+        # 压缩存储：删除已并入摘要的旧消息
+        conn = sqlite3.connect(db_path)
+        conn.execute("DELETE FROM session_messages WHERE seq < 3")
+        conn.commit()
+        conn.close()
+
+        restored = ListMemory(max_messages=3, summarizer=summarizer, store=store, session_id="s3")
+        await restored.restore()
+        restored.add("消息6", "user")
+        await restored.wait_compaction()
+        await store.flush()
+        again = ListMemory(max_messages=3, summarizer=summarizer, store=store, session_id="s3")
+        await again.restore()
+        await store.close()
+        return restored, again
+
+    restored, again = asyncio.run(scenario())
+    assert [m.content for m in restored.messages] == ["消息4", "消息5", "消息6"]
+    assert [m.content for m in again.messages] == ["消息4", "消息5", "消息6"]
+
+
+def test_restore_waits_for_queued_writes(tmp_path):
+    async def scenario():
+        store = SessionStore(str(tmp_path / "sessions.db"), batch_interval=5)  # 写线程攒批，消息仍在队列中
+        memory = ListMemory(max_messages=10, store=store, session_id="s4")
+        memory.add("回收前的最后一条消息", "user")
+        recreated = ListMemory(max_messages=10, store=store, session_id="s4")
+        await recreated.restore()
+        await store.close()
+        return recreated
+
+    recreated = asyncio.run(scenario())
+    assert [m.content for m in recreated.messages] == ["回收前的最后一条消息"]
+    assert recreated._next_seq == 1
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import web_search_agent
+from web_search_agent import BaiduSearchAgent
+
+PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages", "byd_2024_results_article.html")
+
+
+@pytest.fixture(params=["lxml", "bs4"])
+def page_text(request, monkeypatch):
+    if request.param == "lxml" and not web_search_agent.HAS_LXML:
+        pytest.skip("lxml 未安装")
+    monkeypatch.setattr(web_search_agent, "HAS_LXML", request.param == "lxml")
+    with open(PAGE, encoding="utf-8") as f:
+        return BaiduSearchAgent()._extract_main_text(f.read())
+
+
+def test_main_text_keeps_article_and_drops_noise(page_text):
+    paragraphs = page_text.split("\n")
+    assert paragraphs[0].startswith("比亚迪发布2024年年度报告")
+    assert any("营业收入7771.02亿元" in p for p in paragraphs)
+    assert any("每10股派发现金红利39.74元" in p for p in paragraphs)
+    assert "广告位脚本" not in page_text          # script
+    assert "首页" not in page_text                # nav
+    assert "版权所有" not in page_text            # footer
+    assert "宁德时代" not in page_text            # aside
+    assert "短讯" not in paragraphs               # 过短的段落
+    assert "比亚迪股价创历史新高" not in page_text  # 链接文字为主的段落
+
+
+def test_main_text_falls_back_to_page_lines_without_paragraphs():
+    lines = ["比亚迪2024年实现营业收入7771亿元，同比增长29%。",
+             "归属于上市公司股东的净利润402.54亿元，同比增长34%。",
+             "研发投入542亿元，研发人员超过11万人。",
+             "短行"]
+    html = "<html><body>\n" + "\n".join(f"<div>{line}</div>" for line in lines) + "\n</body></html>"
+    assert BaiduSearchAgent()._extract_main_text(html).split("\n") == lines[:3]
+
+
+def test_chunks_split_on_sentences_within_paragraphs():
+    text = "第一句。第二句！第三句？\n另一段第一句；另一段第二句"
+    assert BaiduSearchAgent._chunk_text(text, chunk_size=8) == ["第一句。第二句！", "第三句？", "另一段第一句；", "另一段第二句"]
+    # 超长句子截断到 chunk_size
+    assert BaiduSearchAgent._chunk_text("很" * 20 + "长。", chunk_size=10) == ["很" * 10]
+    assert BaiduSearchAgent._chunk_text("", chunk_size=10) == []
+
+
+def test_relevant_chunks_from_saved_page(page_text):
+    chunks = BaiduSearchAgent().select_relevant_chunks(page_text, "比亚迪 2024 研发投入", top_k=1)
+    assert len(chunks) == 1 and "研发投入542亿元" in chunks[0]
+
+    chunks = BaiduSearchAgent().select_relevant_chunks(page_text, "比亚迪 营业收入 净利润", top_k=2)
+    assert [c for c in chunks if "7771.02亿元" in c]
+    # 片段保持原文顺序
+    assert chunks == sorted(chunks, key=page_text.index)
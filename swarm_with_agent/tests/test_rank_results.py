@@ -0,0 +1,34 @@
+from web_search_agent import BaiduSearchAgent
+
+
+def _result(title: str, abstract: str, source: str = "百度") -> dict:
+    return {"title": title, "link": f"https://example.com/{abs(hash(title))}", "abstract": abstract, "source": source}
+
+
+def test_ranks_by_company_and_year_and_drops_noise():
+    agent = BaiduSearchAgent()
+    results = [
+        _result("宁德时代2023年年度报告", "宁德时代发布2023年报，营收增长"),
+        _result("今日天气预报", "多云转晴"),
+        _result("比亚迪2022年年度报告", "比亚迪2022年营业收入4240亿元"),
+        _result("比亚迪2023年年度报告", "比亚迪2023年营业收入6023亿元，净利润300亿元"),
+        _result("搜索失败", "请稍后再试", source="系统提示"),
+    ]
+    ranked = agent.rank_results(results, "比亚迪 2023 营业收入", company="比亚迪", year="2023")
+
+    assert ranked[0]["title"] == "比亚迪2023年年度报告"
+    titles = [r["title"] for r in ranked]
+    assert "今日天气预报" not in titles and "搜索失败" not in titles
+    assert all("relevance" in r for r in ranked)
+    assert ranked == sorted(ranked, key=lambda r: -r["relevance"])
+
+
+def test_near_duplicates_are_removed():
+    agent = BaiduSearchAgent()
+    original = _result("比亚迪2023年营业收入6023亿元 同比增长42%", "比亚迪发布2023年年度报告，全年营业收入6023亿元")
+    mirror = {**original, "link": "https://mirror.example.com/a"}
+    other = _result("比亚迪2023年研发投入395亿元", "研发人员超过10万人")
+    ranked = agent.rank_results([original, mirror, other], "比亚迪 2023")
+
+    links = [r["link"] for r in ranked]
+    assert len(ranked) == 2 and (original["link"] in links) != (mirror["link"] in links)
@@ -0,0 +1,50 @@
+import time
+
+import web_search_agent
+from web_search_agent import TokenBucket, get_rate_limiter
+
+
+def test_burst_then_queued_waits():
+    bucket = TokenBucket(rate=10.0, capacity=2.0)
+    waits = [bucket._reserve() for _ in range(4)]
+    assert waits[0] == waits[1] == 0.0                       # 突发容量内不等待
+    assert 0 < waits[2] <= 0.1 < waits[3] <= 0.2              # 超出部分按排队顺序均匀摊开
+
+
+def test_throttle_pauses_and_halves_rate_then_recovers():
+    bucket = TokenBucket(rate=4.0, capacity=4.0, min_rate=1.0)
+    bucket.on_throttle(pause=0.5)
+    assert bucket.rate == 2.0
+    assert 0.5 <= bucket._reserve() <= 1.0                   # 暂停期内的请求要等到暂停结束之后
+
+    for _ in range(3):
+        bucket.on_throttle(pause=0.0)
+    assert bucket.rate == 1.0                                # 不低于 min_rate
+
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 4.0                                # 逐步恢复且不超过初始速率
+
+
+def test_acquire_sleeps_for_reserved_wait():
+    bucket = TokenBucket(rate=20.0, capacity=1.0)
+    bucket.acquire()
+    start = time.monotonic()
+    assert bucket.acquire() > 0
+    assert time.monotonic() - start >= 0.04
+
+
+def test_limiter_shared_per_backend():
+    assert get_rate_limiter("test-backend-a") is get_rate_limiter("test-backend-a")
+    assert get_rate_limiter("test-backend-a") is not get_rate_limiter("test-backend-b")
+
+
+def test_limiters_are_bounded_lru(monkeypatch):
+    monkeypatch.setattr(web_search_agent, "MAX_RATE_LIMITERS", 3)
+    monkeypatch.setattr(web_search_agent, "_rate_limiters", web_search_agent.OrderedDict())
+    first = get_rate_limiter("host-1")
+    get_rate_limiter("host-2")
+    get_rate_limiter("host-3")
+    assert get_rate_limiter("host-1") is first       # 最近使用过，不会被淘汰
+    get_rate_limiter("host-4")
+    assert list(web_search_agent._rate_limiters) == ["host-3", "host-1", "host-4"]
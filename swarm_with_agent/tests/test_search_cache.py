@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from web_search_agent import BaiduSearchAgent, SearchResultCache
+
+RESULTS = [{"title": "比亚迪2024年报", "link": "https://example.com/a", "abstract": "营收", "source": "百度"}]
+
+
+def _age_entry(cache: SearchResultCache, query: str, age: float):
+    key = cache.normalize_query(query)
+    results, _ = cache._memory[key]
+    cache._memory.clear()
+    cache._disk_set(key, results, time.time() - age)
+
+
+def test_fresh_stale_and_expired(tmp_path):
+    cache = SearchResultCache(str(tmp_path / "cache.db"), ttl=10, stale_ttl=100)
+    cache.set("比亚迪 2024", RESULTS)
+    assert cache.get("比亚迪　2024") == (RESULTS, True)       # 全角空格归一化后命中内存
+    assert cache.stats["memory_hits"] == 1
+
+    _age_entry(cache, "比亚迪 2024", age=50)
+    assert cache.get("比亚迪 2024") == (RESULTS, False)       # 过期但在 stale_ttl 内
+    assert cache.stats["disk_hits"] == 1 and cache.stats["stale_hits"] == 1
+
+    _age_entry(cache, "比亚迪 2024", age=500)
+    assert cache.get("比亚迪 2024") == (None, False)
+    assert cache.get("未缓存的查询") == (None, False)
+    assert cache.stats["misses"] == 2
+
+
+def test_async_api_persists_across_instances(tmp_path):
+    async def scenario():
+        cache = SearchResultCache(str(tmp_path / "cache.db"))
+        await cache.aset("宁德时代", RESULTS)
+        return await SearchResultCache(str(tmp_path / "cache.db")).aget("宁德时代")
+
+    assert asyncio.run(scenario()) == (RESULTS, True)
+
+
+def test_memory_tier_is_bounded(tmp_path):
+    cache = SearchResultCache(str(tmp_path / "cache.db"), max_memory_items=2)
+    for query in ("a", "b", "c"):
+        cache.set(query, RESULTS)
+    assert list(cache._memory) == ["b", "c"]
+    assert cache.get("a") == (RESULTS, True)                   # 从磁盘读回
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_stale_hit_refreshes_once_in_background(tmp_path):
+    cache = SearchResultCache(str(tmp_path / "cache.db"), ttl=10, stale_ttl=100)
+    agent = BaiduSearchAgent(cache=cache)
+    fetches = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        fresh = [{**RESULTS[0], "title": "更新后的结果"}]
+
+        async def fake_fetch(query):
+            fetches.append(query)
+            await gate.wait()
+            return fresh
+
+        agent.async_search_baidu = fake_fetch
+        agent.search_baidu = lambda query: fresh
+        cache.set("比亚迪", RESULTS)
+        _age_entry(cache, "比亚迪", age=50)
+
+        first = await agent.search_results("比亚迪")
+        second = await agent.search_results("比亚迪")
+        assert first == second == RESULTS                      # 先返回旧结果
+        assert len(agent._background_tasks) == 1               # 重复的刷新被合并
+        gate.set()
+        await asyncio.gather(*agent._background_tasks)
+        await asyncio.sleep(0)
+        assert not agent._background_tasks and not agent._refreshing
+        result = await agent.search_results("比亚迪")
+        await agent.aclose()
+        return result
+
+    assert asyncio.run(scenario())[0]["title"] == "更新后的结果"
+    assert fetches == ["比亚迪"]
+
+
+def test_failed_background_refresh_is_collected(tmp_path, caplog):
+    cache = SearchResultCache(str(tmp_path / "cache.db"), ttl=10, stale_ttl=100)
+    agent = BaiduSearchAgent(cache=cache)
+
+    async def scenario():
+        async def failing_fetch(query):
+            raise RuntimeError("network down")
+
+        agent.async_search_baidu = failing_fetch
+        agent.search_baidu = failing_fetch
+        cache.set("腾讯", RESULTS)
+        _age_entry(cache, "腾讯", age=50)
+        assert await agent.search_results("腾讯") == RESULTS
+        await asyncio.gather(*agent._background_tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        await agent.aclose()
+
+    asyncio.run(scenario())
+    assert not agent._refreshing
+    assert "network down" in caplog.text
+
+
+def test_database_created_on_first_use(tmp_path):
+    db_path = tmp_path / "sub" / "cache.db"
+    cache = SearchResultCache(str(db_path))
+    assert not db_path.exists()                              # 构造时不落盘
+    cache.set("比亚迪", RESULTS)
+    assert db_path.exists()
+    assert SearchResultCache(str(db_path)).get("比亚迪") == (RESULTS, True)
@@ -0,0 +1,127 @@
+# 异步连接池搜索路径对本地回放服务（search_fixture_server）的端到端测试
+import asyncio
+import os
+import threading
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from search_fixture_server import STATS_KEY, FixtureConfig, create_fixture_app
+from web_search_agent import BaiduSearchAgent
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "local_data", "search_pages")
+QUERY = "比亚迪 2024 财报"
+
+
+async def _start(config: FixtureConfig):
+    app = create_fixture_app(FIXTURE_DIR, config)
+    peers = []
+
+    @web.middleware
+    async def track_peer(request, handler):
+        peers.append(request.transport.get_extra_info("peername"))
+        return await handler(request)
+
+    app.middlewares.append(track_peer)
+    server = TestServer(app)
+    await server.start_server()
+    return server, app[STATS_KEY], peers
+
+
+def _agent(server: TestServer, **kwargs) -> BaiduSearchAgent:
+    options = dict(rate_limit=1000.0, burst=100, backoff_base=0.01, backoff_max=0.05)
+    options.update(kwargs)
+    return BaiduSearchAgent(base_url=str(server.make_url("/s")), **options)
+
+
+def test_searches_reuse_one_pooled_connection():
+    async def scenario():
+        server, stats, peers = await _start(FixtureConfig())
+        agent = _agent(server)
+        try:
+            results = [await agent.async_search_baidu(QUERY) for _ in range(3)]
+        finally:
+            await agent.aclose()
+            await server.close()
+        return results, stats, peers, agent
+
+    results, stats, peers, agent = asyncio.run(scenario())
+    assert all(r and r[0]["source"] != "系统提示" for r in results)
+    assert stats["served"] == 3 and agent.stats["requests"] == 3
+    assert len(set(peers)) == 1                              # keep-alive：三次请求走同一条连接
+    assert agent._http_session is None
+
+
+def test_read_timeout_falls_back_after_retries():
+    async def scenario():
+        server, stats, _ = await _start(FixtureConfig(latency=(0.5, 0.5)))
+        agent = _agent(server, read_timeout=0.05, max_retries=1)
+        try:
+            results = await agent.async_search_baidu(QUERY)
+        finally:
+            await agent.aclose()
+            await server.close()
+        return results, agent
+
+    results, agent = asyncio.run(scenario())
+    assert results[0]["source"] == "系统提示"
+    assert agent.stats["connection_errors"] == 2 and agent.stats["retries"] == 1
+    assert agent.stats["fallbacks"] == 1
+
+
+def test_server_errors_and_throttling_are_retried():
+    async def scenario():
+        config = FixtureConfig(error_rate=1.0, error_status=503)
+        server, stats, _ = await _start(config)
+        agent = _agent(server, max_retries=2)
+        try:
+            failed = await agent.async_search_baidu(QUERY)
+            config.update({"error_rate": 0.0, "throttle_rate": 1.0, "retry_after": 0.01})
+            rate_before = agent.rate_limiter.rate
+            throttled = await agent.async_search_baidu(QUERY)
+            rate_after = agent.rate_limiter.rate
+            config.update({"throttle_rate": 0.0})
+            recovered = await agent.async_search_baidu(QUERY)
+        finally:
+            await agent.aclose()
+            await server.close()
+        return failed, throttled, recovered, stats, agent, rate_before, rate_after
+
+    failed, throttled, recovered, stats, agent, rate_before, rate_after = asyncio.run(scenario())
+    assert failed[0]["source"] == "系统提示" and throttled[0]["source"] == "系统提示"
+    assert recovered[0]["source"] != "系统提示"
+    assert stats["errors"] == 3 and stats["throttled"] == 3 and stats["served"] == 1
+    assert agent.stats["server_errors"] == 3 and agent.stats["throttled"] == 3
+    assert rate_after < rate_before                          # 429 使令牌桶减速
+
+
+def test_session_from_another_loop_is_closed_not_dropped():
+    async def search(agent):
+        return await agent.async_search_baidu(QUERY)
+
+    async def scenario():
+        server, _, _ = await _start(FixtureConfig())
+        agent = _agent(server)
+        return server, agent, await search(agent)
+
+    server_loop = asyncio.new_event_loop()
+    server, agent, first = server_loop.run_until_complete(scenario())
+    stale = agent._http_session
+
+    async def second():
+        try:
+            return await search(agent)
+        finally:
+            await agent.aclose()
+
+    thread = threading.Thread(target=server_loop.run_forever, daemon=True)  # 回放服务继续在原循环中运行
+    thread.start()
+    try:
+        result = asyncio.run(second())
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), server_loop).result(5)
+        server_loop.call_soon_threadsafe(server_loop.stop)
+        thread.join(5)
+        server_loop.close()
+    assert first[0]["source"] != "系统提示" and result[0]["source"] != "系统提示"
+    assert stale.closed
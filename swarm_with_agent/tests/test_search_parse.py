@@ -0,0 +1,36 @@
+import glob
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from web_search_agent import HAS_LXML, BaiduSearchAgent
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "local_data", "search_pages")
+PAGES = sorted(glob.glob(os.path.join(PAGES_DIR, "*.html")))
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.skipif(not HAS_LXML, reason="lxml 未安装")
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_lxml_parser_matches_beautifulsoup(path):
+    html = _read(path)
+    agent = BaiduSearchAgent()
+    fast = agent._parse_baidu_results_fast(html)
+    reference = agent._parse_baidu_results_optimized(BeautifulSoup(html, "html.parser"))
+    assert fast, "lxml 解析没有结果，会退回 BeautifulSoup，对比失去意义"
+    assert fast == reference
+
+
+@pytest.mark.skipif(not HAS_LXML, reason="lxml 未安装")
+def test_parser_backends_agree_on_saved_page():
+    html = _read(os.path.join(PAGES_DIR, "baidu_byd_2024.html"))
+    lxml_results = BaiduSearchAgent(parser_backend="lxml")._parse_html(html)
+    bs4_results = BaiduSearchAgent(parser_backend="bs4")._parse_html(html)
+    assert lxml_results == bs4_results
+    assert lxml_results[0]["title"] == "比亚迪2024年年报：营业收入7771亿元，同比增长29%"
+    assert all(r["title"] and r["link"] for r in lxml_results)
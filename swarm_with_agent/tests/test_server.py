@@ -0,0 +1,84 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from server import SessionManager, create_app
+
+
+class _FakeSystem:
+    created = []
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        _FakeSystem.created.append(session_id)
+
+    async def run_turn(self, user_input, on_message=None):
+        if user_input == "boom":
+            raise RuntimeError("model failed")
+        return f"echo: {user_input}"
+
+
+def _with_client(manager, scenario):
+    async def run():
+        client = TestClient(TestServer(create_app(manager)))
+        await client.start_server()
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_idle_eviction_skips_sessions_with_open_websocket():
+    _FakeSystem.created = []
+    manager = SessionManager(_FakeSystem, max_sessions=1, idle_timeout=0)
+
+    async def scenario(client):
+        ws = await client.ws_connect("/sessions/s1/ws")
+        assert manager.evict_idle() == 0
+        assert not manager.close_session("s1")
+        # 会话数已满且唯一的会话有连接，新会话被拒绝而不是挤掉它
+        resp = await client.post("/sessions", json={"session_id": "s2"})
+        assert resp.status == 503
+        await ws.send_json({"input": "hi"})
+        reply = await ws.receive_json()
+        await ws.close()
+        await asyncio.sleep(0.05)
+        return reply
+
+    reply = _with_client(manager, scenario)
+    assert reply == {"type": "done", "answer": "echo: hi"}
+    assert _FakeSystem.created == ["s1"]
+    assert manager.evict_idle() == 1
+
+
+def test_websocket_replies_with_error_and_stays_open():
+    manager = SessionManager(_FakeSystem)
+
+    async def scenario(client):
+        ws = await client.ws_connect("/sessions/s1/ws")
+        replies = []
+        for payload in ("[]", "42", '{"input": 5}', "boom", '"plain json string"'):
+            await ws.send_str(payload)
+            replies.append(await ws.receive_json())
+        await ws.close()
+        return replies
+
+    replies = _with_client(manager, scenario)
+    assert [r["type"] for r in replies] == ["error", "error", "error", "error", "done"]
+    assert "model failed" in replies[3]["message"]
+    assert replies[4]["answer"] == "echo: plain json string"
+
+
+def test_http_rejects_non_object_bodies():
+    manager = SessionManager(_FakeSystem)
+
+    async def scenario(client):
+        bad_turn = await client.post("/sessions/s1/turns", json=["input"])
+        bad_session = await client.post("/sessions", json="s1")
+        ok = await client.post("/sessions/s1/turns", json={"input": "hello"})
+        return bad_turn.status, bad_session.status, await ok.json()
+
+    bad_turn, bad_session, ok = _with_client(manager, scenario)
+    assert bad_turn == 400 and bad_session == 400
+    assert ok["answer"] == "echo: hello"
@@ -0,0 +1,81 @@
+import asyncio
+
+from autogen_agentchat.base import TerminatedException
+from autogen_agentchat.messages import HandoffMessage, TextMessage
+from autogen_core.models import RequestUsage
+
+from turn_budget import TurnBudgetTermination, add_nested_usage, add_usage, start_turn_usage
+
+
+def _handoff(source: str, target: str) -> HandoffMessage:
+    return HandoffMessage(source=source, target=target, content=f"转交给 {target}")
+
+
+def test_stops_on_hop_limit_and_resets():
+    async def scenario():
+        budget = TurnBudgetTermination(max_hops=3, max_tokens=None, max_cycle_repeats=10)
+        assert await budget([_handoff("planner", "data_agent"), _handoff("data_agent", "writer")]) is None
+        stop = await budget([_handoff("writer", "planner")])
+        assert stop is not None and stop.content.startswith("BUDGET_STOP")
+        assert budget.terminated and budget.counters["hops"] == 3
+        try:
+            await budget([])
+            raise AssertionError("terminated condition must raise")
+        except TerminatedException:
+            pass
+
+        await budget.reset()
+        assert not budget.terminated and budget.counters["hops"] == 0
+        assert budget.last_counters["hops"] == 3 and budget.last_counters["stop_reason"]
+
+    asyncio.run(scenario())
+
+
+def test_stops_on_token_limit():
+    async def scenario():
+        budget = TurnBudgetTermination(max_hops=0, max_tokens=1000)
+        spent = TextMessage(source="writer", content="...",
+                            models_usage=RequestUsage(prompt_tokens=600, completion_tokens=300))
+        assert await budget([spent]) is None
+        stop = await budget([spent])
+        assert stop is not None and "token" in budget.counters["stop_reason"]
+        assert budget.counters["prompt_tokens"] == 1200 and budget.counters["messages"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_detects_repeated_handoff_cycle():
+    async def scenario():
+        budget = TurnBudgetTermination(max_hops=0, max_tokens=None, max_cycle_repeats=3)
+        ping_pong = [_handoff("planner", "data_agent"), _handoff("data_agent", "planner")]
+        assert await budget(ping_pong * 2) is None
+        stop = await budget(ping_pong)
+        assert stop is not None
+        assert budget.counters["cycle"] == "planner→data_agent→planner"
+
+    asyncio.run(scenario())
+
+
+def test_nested_agent_usage_is_added_to_its_own_turn():
+    def message(prompt, completion):
+        return TextMessage(source="financial_agent_embedded", content="ok",
+                           models_usage=RequestUsage(prompt_tokens=prompt, completion_tokens=completion))
+
+    async def tool(prompt):
+        # 工具调用在团队运行时创建的子任务中执行
+        add_nested_usage(message(prompt, 1))
+
+    async def turn(prompt):
+        usage = start_turn_usage()
+        add_usage(usage, message(100, 10))
+        await asyncio.create_task(tool(prompt))
+        return usage
+
+    async def main():
+        return await asyncio.gather(turn(5), turn(7))
+
+    first, second = asyncio.run(main())
+    assert first["prompt_tokens"] == 105 and first["nested_prompt_tokens"] == 5
+    assert second["prompt_tokens"] == 107 and second["completion_tokens"] == 11
+    # 不在任何轮次内时忽略
+    add_nested_usage(message(1, 1))
@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+from upload_watcher import UploadWatcher
+
+
+def _write(path, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+async def _drain(watcher: UploadWatcher):
+    watcher._scan_once()
+    await watcher.wait_idle()
+
+
+def _make_watcher(tmp_path, ingest):
+    return UploadWatcher(str(tmp_path / "uploads"), ingest, index_path=str(tmp_path / "index.json"),
+                         settle_seconds=0, poll_interval=3600)
+
+
+def test_same_content_under_new_name_is_deduped(tmp_path):
+    calls = []
+
+    async def ingest(path):
+        calls.append(path)
+        return {"status": "success", "company": "华为", "year": "2023"}
+
+    async def scenario():
+        watcher = _make_watcher(tmp_path, ingest)
+        await watcher.start()
+        try:
+            _write(os.path.join(watcher.upload_dir, "华为_2023_report.pdf"), b"same bytes")
+            await _drain(watcher)
+            _write(os.path.join(watcher.upload_dir, "copy.pdf"), b"same bytes")
+            await _drain(watcher)
+        finally:
+            await watcher.stop()
+        return watcher
+
+    watcher = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert watcher.stats["ingested"] == 1 and watcher.stats["duplicates"] == 1
+    assert watcher.lookup("华为", "2023")["file_path"].endswith("华为_2023_report.pdf")
+
+
+def test_skipped_and_failed_ingests_are_not_indexed(tmp_path):
+    results = iter([{"status": "skipped", "message": "bad name"},
+                    {"status": "error"},
+                    {"status": "success", "company": "腾讯", "year": "2022"}])
+    calls = []
+
+    async def ingest(path):
+        calls.append(os.path.basename(path))
+        return next(results)
+
+    async def scenario():
+        watcher = _make_watcher(tmp_path, ingest)
+        await watcher.start()
+        try:
+            for name in ("report.pdf", "renamed.pdf", "腾讯_2022_report.pdf"):
+                _write(os.path.join(watcher.upload_dir, name), b"identical content")
+                await _drain(watcher)
+        finally:
+            await watcher.stop()
+        return watcher
+
+    watcher = asyncio.run(scenario())
+    # 前两次未成功，同样的内容换名后仍会再次入库
+    assert calls == ["report.pdf", "renamed.pdf", "腾讯_2022_report.pdf"]
+    assert watcher.stats["skipped"] == 1 and watcher.stats["failed"] == 1 and watcher.stats["ingested"] == 1
+    assert len(watcher.index) == 1
+
+
+def test_index_survives_restart(tmp_path):
+    calls = []
+
+    async def ingest(path):
+        calls.append(path)
+        return {"status": "success"}
+
+    async def run_once():
+        watcher = _make_watcher(tmp_path, ingest)
+        await watcher.start()
+        try:
+            await watcher.wait_idle()
+        finally:
+            await watcher.stop()
+
+    os.makedirs(tmp_path / "uploads")
+    _write(str(tmp_path / "uploads" / "a.pdf"), b"pdf")
+    asyncio.run(run_once())
+    asyncio.run(run_once())
+    assert len(calls) == 1
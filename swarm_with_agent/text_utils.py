@@ -0,0 +1,16 @@
+# text_utils.py - 文本小工具：token 估算与字符二元组，供记忆和搜索模块共用
+import re
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff' or '\u3000' <= ch <= '\u30ff')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def char_bigrams(text: str) -> set:
+    """按空白和标点切开后的字符二元组，中文无需分词即可计算重合度"""
+    grams = set()
+    for token in re.split(r'[\W_]+', text.lower()):
+        grams.update(token[i:i + 2] for i in range(len(token) - 1))
+    return grams
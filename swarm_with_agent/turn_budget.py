@@ -0,0 +1,126 @@
+# turn_budget.py - Swarm 单轮对话的 handoff 次数 / token 预算与循环检测
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+from autogen_agentchat.base import TerminatedException, TerminationCondition
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, HandoffMessage, StopMessage
+
+
+class TurnBudgetTermination(TerminationCondition):
+    """单轮对话的预算终止条件，与 TextMentionTermination 组合使用（`|`）
+
+    以下任一情况都会提前结束本轮：
+    - handoff 次数超过 max_hops
+    - 本轮累计 token 超过 max_tokens
+    - 最近的 handoff 序列中同一个循环（如 planner→data_agent→planner）连续重复 max_cycle_repeats 次
+
+    counters 为本轮实时计数；每轮结束重置前会复制到 last_counters，便于调参。
+    """
+
+    def __init__(self, max_hops: int = 12, max_tokens: Optional[int] = 60000,
+                 max_cycle_repeats: int = 3, max_cycle_length: int = 3):
+        self.max_hops = max_hops
+        self.max_tokens = max_tokens
+        self.max_cycle_repeats = max_cycle_repeats
+        self.max_cycle_length = max_cycle_length
+        self.counters = self._empty_counters()
+        self.last_counters = self._empty_counters()
+        self._hops: List[str] = []
+        self._terminated = False
+
+    @staticmethod
+    def _empty_counters() -> Dict:
+        return {"hops": 0, "messages": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cycle": None, "stop_reason": None}
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    async def __call__(self, messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> StopMessage | None:
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+
+        for message in messages:
+            usage = getattr(message, "models_usage", None)
+            if usage is not None:
+                self.counters["prompt_tokens"] += usage.prompt_tokens
+                self.counters["completion_tokens"] += usage.completion_tokens
+            if isinstance(message, BaseChatMessage):
+                self.counters["messages"] += 1
+            if isinstance(message, HandoffMessage):
+                self.counters["hops"] += 1
+                if not self._hops:
+                    self._hops.append(message.source)
+                self._hops.append(message.target)
+
+        reason = self._check()
+        if reason is None:
+            return None
+        self._terminated = True
+        self.counters["stop_reason"] = reason
+        return StopMessage(content=f"BUDGET_STOP: {reason}", source="TurnBudgetTermination")
+
+    def _check(self) -> Optional[str]:
+        if self.max_hops and self.counters["hops"] >= self.max_hops:
+            return f"handoff 次数达到上限 {self.max_hops}"
+        total_tokens = self.counters["prompt_tokens"] + self.counters["completion_tokens"]
+        if self.max_tokens and total_tokens >= self.max_tokens:
+            return f"token 用量 {total_tokens} 达到上限 {self.max_tokens}"
+        cycle = self._find_cycle()
+        if cycle:
+            self.counters["cycle"] = cycle
+            return f"检测到重复的 handoff 循环 {cycle} ×{self.max_cycle_repeats}"
+        return None
+
+    def _find_cycle(self) -> Optional[str]:
+        """检查 handoff 路径末尾是否由同一段循环连续重复构成"""
+        path = self._hops
+        for length in range(2, self.max_cycle_length + 1):
+            span = length * self.max_cycle_repeats
+            if len(path) < span + 1:
+                continue
+            tail = path[-(span + 1):]
+            pattern = tail[:length]
+            if all(tail[i] == pattern[i % length] for i in range(len(tail))):
+                return "→".join(pattern + [pattern[0]])
+        return None
+
+    async def reset(self) -> None:
+        self.last_counters = dict(self.counters)
+        self.counters = self._empty_counters()
+        self._hops = []
+        self._terminated = False
+
+
+# ==================== 单轮 token 用量 ====================
+# 工具内部运行的内嵌智能体（financial_agent / text_agent）不在团队消息流中，
+# 它们的用量通过上下文变量累加到当前轮次；工具调用所在的任务继承 run_turn 的上下文，并发的多个会话互不干扰
+_turn_usage: ContextVar[Optional[Dict]] = ContextVar("turn_usage", default=None)
+
+
+def start_turn_usage() -> Dict:
+    """为当前轮次创建用量字典并设为当前上下文的累加目标"""
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "nested_prompt_tokens": 0,
+             "nested_completion_tokens": 0, "messages": 0}
+    _turn_usage.set(usage)
+    return usage
+
+
+def add_usage(usage: Dict, message) -> None:
+    """把消息的 models_usage 加到 usage 上"""
+    models_usage = getattr(message, "models_usage", None)
+    if models_usage is not None:
+        usage["prompt_tokens"] += models_usage.prompt_tokens
+        usage["completion_tokens"] += models_usage.completion_tokens
+
+
+def add_nested_usage(message) -> None:
+    """内嵌智能体的消息：用量计入当前轮次（总数和 nested_* 两处）；不在任何轮次内时忽略"""
+    usage = _turn_usage.get()
+    models_usage = getattr(message, "models_usage", None)
+    if usage is None or models_usage is None:
+        return
+    add_usage(usage, message)
+    usage["nested_prompt_tokens"] += models_usage.prompt_tokens
+    usage["nested_completion_tokens"] += models_usage.completion_tokens
@@ -0,0 +1,241 @@
+# upload_watcher.py - 用户上传目录后台监听
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# watchdog 为可选依赖 (pip install watchdog)，未安装时退化为轮询
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+    HAS_WATCHDOG = False
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _UploadEventHandler(FileSystemEventHandler):
+    """把 watchdog 线程里的文件事件转交给事件循环"""
+
+    def __init__(self, watcher: "UploadWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify_threadsafe(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify_threadsafe(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify_threadsafe(event.dest_path)
+
+
+class UploadWatcher:
+    """后台监听上传目录：新增/修改的文件按内容哈希去重后排队入库"""
+
+    def __init__(self,
+                 upload_dir: str,
+                 ingest_func: Callable[[str], Awaitable[Dict]],
+                 index_path: str = "./local_data/upload_index.json",
+                 max_concurrency: int = 2,
+                 poll_interval: float = 2.0,
+                 settle_seconds: float = 1.0,
+                 extensions: Tuple[str, ...] = (".pdf",)):
+        self.upload_dir = upload_dir
+        self.ingest_func = ingest_func
+        self.index_path = index_path
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.extensions = tuple(ext.lower() for ext in extensions)
+
+        # 内容哈希 -> 入库成功的记录，持久化到 index_path，重启后重复上传不再处理
+        # 跳过或失败的文件不进索引，改名或修正后重新上传仍会处理
+        self.index: Dict[str, Dict] = {}
+        # 文件路径 -> (mtime_ns, size)，只有变化的文件才重新计算哈希
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._queued: set = set()
+        self._inflight: set = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks = []
+        self._observer = None
+        self.stats = {"queued": 0, "ingested": 0, "duplicates": 0, "skipped": 0, "failed": 0}
+
+    # ---------- 生命周期 ----------
+    async def start(self):
+        """启动监听：先全量扫描一次，再用 inotify(watchdog) 或轮询跟踪变化"""
+        if self._tasks:
+            return
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self.index = await asyncio.to_thread(self._load_index)
+
+        for i in range(self.max_concurrency):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+
+        self._scan_once()
+
+        if HAS_WATCHDOG:
+            self._observer = Observer()
+            self._observer.schedule(_UploadEventHandler(self), self.upload_dir, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            logger.info(f"上传目录监听已启动 (inotify): {self.upload_dir}")
+        else:
+            self._tasks.append(asyncio.create_task(self._poll_loop()))
+            logger.info(f"上传目录监听已启动 (轮询 {self.poll_interval}s): {self.upload_dir}")
+
+    async def stop(self):
+        """停止监听并取消后台任务"""
+        if self._observer is not None:
+            self._observer.stop()
+            await asyncio.to_thread(self._observer.join)
+            self._observer = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def wait_idle(self):
+        """等待当前队列中的入库任务全部处理完"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    # ---------- 变化检测 ----------
+    def notify_threadsafe(self, path: str):
+        """供 watchdog 线程调用"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._enqueue_if_changed, path)
+
+    def _is_candidate(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return not name.startswith('.') and name.lower().endswith(self.extensions)
+
+    def _enqueue_if_changed(self, path: str):
+        if not self._is_candidate(path):
+            return
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._snapshot.pop(path, None)
+            return
+        signature = (st.st_mtime_ns, st.st_size)
+        if self._snapshot.get(path) == signature or path in self._queued:
+            return
+        self._snapshot[path] = signature
+        self._queued.add(path)
+        self.stats["queued"] += 1
+        self._queue.put_nowait(path)
+
+    def _scan_once(self):
+        try:
+            with os.scandir(self.upload_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self._enqueue_if_changed(entry.path)
+        except FileNotFoundError:
+            pass
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self._scan_once()
+
+    # ---------- 入库 ----------
+    async def _worker(self, worker_id: int):
+        while True:
+            path = await self._queue.get()
+            self._queued.discard(path)
+            try:
+                await self._process(path)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"[UploadWatcher-{worker_id}] 处理 {path} 失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, path: str):
+        # 等待文件写入稳定，避免对上传到一半的文件做哈希
+        before = self._snapshot.get(path)
+        await asyncio.sleep(self.settle_seconds)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._snapshot.pop(path, None)
+            return
+        if (st.st_mtime_ns, st.st_size) != before:
+            self._enqueue_if_changed(path)
+            return
+
+        content_hash = await asyncio.to_thread(hash_file, path)
+        if content_hash in self.index or content_hash in self._inflight:
+            self.stats["duplicates"] += 1
+            logger.info(f"内容已入库，跳过: {path}")
+            return
+
+        print(f"\n   📥 [上传监听] 检测到新文件，开始入库: {path}")
+        self._inflight.add(content_hash)
+        try:
+            result = await self.ingest_func(path) or {}
+        finally:
+            self._inflight.discard(content_hash)
+        status = result.get("status")
+        if status != "success":
+            self.stats["skipped" if status == "skipped" else "failed"] += 1
+            logger.warning(f"上传文件未入库 ({status or '无结果'}): {path} {result.get('message', '')}")
+            return
+        self.index[content_hash] = {
+            **result,
+            "file_path": path,
+            "sha256": content_hash,
+            "ingested_at": time.time(),
+        }
+        await asyncio.to_thread(self._save_index)
+        self.stats["ingested"] += 1
+        logger.info(f"上传文件入库完成: {path}")
+
+    def lookup(self, company: str, year: str) -> Optional[Dict]:
+        """按公司和年份查找已入库的上传文件"""
+        for record in self.index.values():
+            if record.get("company") == company and str(record.get("year")) == str(year):
+                return record
+        return None
+
+    # ---------- 索引持久化 ----------
+    def _load_index(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"上传索引读取失败，重新建立: {e}")
+            return {}
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
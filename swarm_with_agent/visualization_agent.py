@@ -1,258 +1,616 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
-import numpy as np
 from io import BytesIO
 import base64
 import logging
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 import os
 from datetime import datetime
 import json
 import re
+import sys
 import asyncio
+import hashlib
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+
+import chart_data
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _LazyModule:
+    """Placeholder that imports the real module on first attribute access.
+    Importing this file stays cheap; matplotlib is only loaded when a chart is drawn."""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+plt = _LazyModule("matplotlib.pyplot")
+
+CHART_OUTPUT_DIR = "./charts"
+
+# Per-figure rc settings: CJK-capable fonts first so Chinese company names render
+CHART_RC = {
+    'font.sans-serif': ['SimHei', 'Microsoft YaHei', 'PingFang SC', 'Noto Sans CJK SC', 'WenQuanYi Zen Hei', 'DejaVu Sans'],
+    'axes.unicode_minus': False,
+}
+
+CHART_DPI = 300
+
+# Outputs a generate_* method can return, all derived from one PNG render:
+# "file" writes the PNG to output_dir, "base64" inlines it, "png" returns the raw bytes
+DEFAULT_OUTPUTS = ("file", "base64")
+
 class FinancialChartGenerator:
     """Financial Chart Generator"""
     
-    def __init__(self):
+    def __init__(self, dpi: int = CHART_DPI):
+        self.dpi = dpi
         self.chart_styles = {
             'corporate': {'style': 'seaborn-v0_8-whitegrid', 'colors': ['#2E86AB', '#A23B72', '#F18F01', '#C73E1D']},
             'modern': {'style': 'seaborn-v0_8-darkgrid', 'colors': ['#00A8E8', '#007EA7', '#003459', '#00171F']},
             'classic': {'style': 'classic', 'colors': ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']}
         }
-        self.output_dir = "./charts"
+        self.output_dir = CHART_OUTPUT_DIR
         os.makedirs(self.output_dir, exist_ok=True)
         print(f"📁 Chart output directory: {self.output_dir}")
     
-    def _save_chart(self, fig, filename: str) -> str:
-        """Save chart to file"""
-        filepath = os.path.join(self.output_dir, filename)
-        fig.savefig(filepath, dpi=300, bbox_inches='tight', facecolor='white')
-        plt.close(fig)
-        print(f"💾 Chart saved: {filepath}")
-        return filepath
+    def _style_context(self, style: Optional[str]):
+        """Apply a style sheet and font settings to the figures built inside the block only,
+        instead of mutating global rcParams with plt.style.use"""
+        sheets = [self.chart_styles[style]['style']] if style else []
+        return plt.style.context(sheets + [CHART_RC])
     
-    def _fig_to_base64(self, fig) -> str:
-        """Convert chart to base64 string"""
+    def _render_outputs(self, fig, filename: str, outputs: Tuple[str, ...], result: Dict) -> Dict:
+        """Rasterize the figure once and derive every requested output from the same PNG bytes"""
         buffer = BytesIO()
-        fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        buffer.close()
-        return image_base64
+        try:
+            fig.savefig(buffer, format='png', dpi=self.dpi, bbox_inches='tight', facecolor='white')
+        finally:
+            plt.close(fig)
+        png_bytes = buffer.getvalue()
+        
+        result = {**result, "filepath": None, "size_bytes": len(png_bytes), "status": "success"}
+        if "file" in outputs:
+            filepath = os.path.join(self.output_dir, filename)
+            with open(filepath, 'wb') as f:
+                f.write(png_bytes)
+            print(f"💾 Chart saved: {filepath}")
+            result["filepath"] = filepath
+        if "base64" in outputs:
+            result["image_base64"] = base64.b64encode(png_bytes).decode()
+        if "png" in outputs:
+            result["png_bytes"] = png_bytes
+        return result
     
-    def generate_bar_chart(self, data: Dict, title: str, style: str = 'corporate') -> Dict:
+    def generate_bar_chart(self, data: Dict, title: str, style: str = 'corporate',
+                           outputs: Tuple[str, ...] = DEFAULT_OUTPUTS, filename: Optional[str] = None) -> Dict:
         """Generate bar chart"""
         try:
             print(f"📊 Generating bar chart: {title}")
-            plt.style.use(self.chart_styles[style]['style'])
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            categories = list(data.keys())
-            values = list(data.values())
-            colors = self.chart_styles[style]['colors']
-            
-            bars = ax.bar(categories, values, color=colors[:len(categories)], alpha=0.8)
-            
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width()/2., height,
-                       f'{height:.2f}', ha='center', va='bottom', fontsize=10)
-            
-            ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-            ax.set_ylabel('Value', fontsize=12)
-            ax.grid(True, alpha=0.3)
-            
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            
-            filename = f"bar_chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            filepath = self._save_chart(fig, filename)
-            image_base64 = self._fig_to_base64(fig)
-            
-            return {
-                "chart_type": "bar",
-                "title": title,
-                "filepath": filepath,
-                "image_base64": image_base64,
-                "data_points": len(data),
-                "status": "success"
-            }
-            
+            with self._style_context(style):
+                fig, ax = plt.subplots(figsize=(10, 6))
+                
+                categories = list(data.keys())
+                values = list(data.values())
+                colors = self.chart_styles[style]['colors']
+                
+                bars = ax.bar(categories, values, color=colors[:len(categories)], alpha=0.8)
+                
+                # Add value labels
+                for bar in bars:
+                    height = bar.get_height()
+                    ax.text(bar.get_x() + bar.get_width()/2., height,
+                           f'{height:.2f}', ha='center', va='bottom', fontsize=10)
+                
+                ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+                ax.set_ylabel('Value', fontsize=12)
+                ax.grid(True, alpha=0.3)
+                
+                plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+                fig.tight_layout()
+                
+                filename = filename or f"bar_chart_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+                return self._render_outputs(fig, filename, outputs, {
+                    "chart_type": "bar",
+                    "title": title,
+                    "data_points": len(data)
+                })
+                
         except Exception as e:
             logger.error(f"Bar chart generation failed: {e}")
             return {"status": "error", "message": str(e)}
     
-    def generate_line_chart(self, data: Dict, title: str, xlabel: str = 'Quarter', style: str = 'corporate') -> Dict:
+    def generate_line_chart(self, data: Dict, title: str, xlabel: str = 'Quarter', style: str = 'corporate',
+                            outputs: Tuple[str, ...] = DEFAULT_OUTPUTS, filename: Optional[str] = None) -> Dict:
         """Generate line chart (time series)"""
         try:
             print(f"📈 Generating line chart: {title}")
-            plt.style.use(self.chart_styles[style]['style'])
-            fig, ax = plt.subplots(figsize=(12, 6))
-            
-            times = list(data.keys())
-            values = list(data.values())
-            colors = self.chart_styles[style]['colors']
-            
-            ax.plot(times, values, marker='o', linewidth=2.5, color=colors[0], markersize=8)
-            ax.fill_between(times, values, alpha=0.2, color=colors[0])
-            
-            ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-            ax.set_xlabel(xlabel, fontsize=12)
-            ax.set_ylabel('Value', fontsize=12)
-            ax.grid(True, alpha=0.3)
-            
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
-            
-            filename = f"line_chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            filepath = self._save_chart(fig, filename)
-            image_base64 = self._fig_to_base64(fig)
-            
-            return {
-                "chart_type": "line",
-                "title": title,
-                "filepath": filepath,
-                "image_base64": image_base64,
-                "data_points": len(data),
-                "status": "success"
-            }
-            
+            with self._style_context(style):
+                fig, ax = plt.subplots(figsize=(12, 6))
+                
+                times = list(data.keys())
+                values = list(data.values())
+                colors = self.chart_styles[style]['colors']
+                
+                ax.plot(times, values, marker='o', linewidth=2.5, color=colors[0], markersize=8)
+                ax.fill_between(times, values, alpha=0.2, color=colors[0])
+                
+                ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+                ax.set_xlabel(xlabel, fontsize=12)
+                ax.set_ylabel('Value', fontsize=12)
+                ax.grid(True, alpha=0.3)
+                
+                plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+                fig.tight_layout()
+                
+                filename = filename or f"line_chart_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+                return self._render_outputs(fig, filename, outputs, {
+                    "chart_type": "line",
+                    "title": title,
+                    "data_points": len(data)
+                })
+                
         except Exception as e:
             logger.error(f"Line chart generation failed: {e}")
             return {"status": "error", "message": str(e)}
     
-    def generate_pie_chart(self, data: Dict, title: str, style: str = 'corporate') -> Dict:
+    def generate_pie_chart(self, data: Dict, title: str, style: str = 'corporate',
+                           outputs: Tuple[str, ...] = DEFAULT_OUTPUTS, filename: Optional[str] = None) -> Dict:
         """Generate pie chart for percentage data"""
         try:
             print(f"🥧 Generating pie chart: {title}")
-            plt.style.use(self.chart_styles[style]['style'])
-            fig, ax = plt.subplots(figsize=(8, 8))
-            
-            # Filter only percentage data
-            percentage_data = {}
-            for key, value in data.items():
-                if any(keyword in key.lower() for keyword in ['margin', 'ratio', 'roe', 'rate']):
-                    percentage_data[key] = value
-            
-            if not percentage_data:
-                # If no percentage data, use all data but convert to percentages
-                total = sum(data.values())
-                percentage_data = {k: (v/total)*100 for k, v in data.items()}
-            
-            labels = list(percentage_data.keys())
-            sizes = list(percentage_data.values())
-            colors = self.chart_styles[style]['colors']
-            
-            wedges, texts, autotexts = ax.pie(sizes, labels=labels, autopct='%1.1f%%',
-                                            colors=colors[:len(labels)], startangle=90)
-            
-            ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-            
-            # Beautify percentage text
-            for autotext in autotexts:
-                autotext.set_color('white')
-                autotext.set_fontweight('bold')
-            
-            plt.tight_layout()
-            
-            filename = f"pie_chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            filepath = self._save_chart(fig, filename)
-            image_base64 = self._fig_to_base64(fig)
-            
-            return {
-                "chart_type": "pie",
-                "title": title,
-                "filepath": filepath,
-                "image_base64": image_base64,
-                "data_points": len(percentage_data),
-                "status": "success"
-            }
-            
+            with self._style_context(style):
+                fig, ax = plt.subplots(figsize=(8, 8))
+                
+                # Filter only percentage data
+                percentage_data = {}
+                for key, value in data.items():
+                    if any(keyword in key.lower() for keyword in ['margin', 'ratio', 'roe', 'rate']):
+                        percentage_data[key] = value
+                
+                if not percentage_data:
+                    # If no percentage data, use all data but convert to percentages
+                    total = sum(data.values())
+                    percentage_data = {k: (v/total)*100 for k, v in data.items()}
+                
+                labels = list(percentage_data.keys())
+                sizes = list(percentage_data.values())
+                colors = self.chart_styles[style]['colors']
+                
+                wedges, texts, autotexts = ax.pie(sizes, labels=labels, autopct='%1.1f%%',
+                                                colors=colors[:len(labels)], startangle=90)
+                
+                ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+                
+                # Beautify percentage text
+                for autotext in autotexts:
+                    autotext.set_color('white')
+                    autotext.set_fontweight('bold')
+                
+                fig.tight_layout()
+                
+                filename = filename or f"pie_chart_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+                return self._render_outputs(fig, filename, outputs, {
+                    "chart_type": "pie",
+                    "title": title,
+                    "data_points": len(percentage_data)
+                })
+                
         except Exception as e:
             logger.error(f"Pie chart generation failed: {e}")
             return {"status": "error", "message": str(e)}
     
-    def generate_metrics_dashboard(self, metrics: Dict, company: str, year: str) -> Dict:
+    def generate_metrics_dashboard(self, metrics: Dict, company: str, year: str,
+                                   outputs: Tuple[str, ...] = DEFAULT_OUTPUTS, filename: Optional[str] = None) -> Dict:
         """Generate financial metrics dashboard with actual data"""
         try:
-            fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-            fig.suptitle(f'{company} {year} Financial Metrics Dashboard', fontsize=16, fontweight='bold')
-            
-            # 1. Profitability metrics
-            profit_metrics = {k: v for k, v in metrics.items() 
-                            if any(word in k.lower() for word in ['revenue', 'profit', 'margin'])}
-            if profit_metrics:
-                axes[0,0].bar(profit_metrics.keys(), profit_metrics.values(), color='#2E86AB')
-                axes[0,0].set_title('Profitability Metrics')
-                axes[0,0].tick_params(axis='x', rotation=45)
-                axes[0,0].grid(True, alpha=0.3)
-            
-            # 2. Growth metrics
-            growth_metrics = {k: v for k, v in metrics.items() 
-                            if any(word in k.lower() for word in ['growth', 'increase'])}
-            if not growth_metrics:
-                # If no growth metrics, use all metrics for comparison
-                growth_metrics = metrics
-            if growth_metrics:
-                axes[0,1].bar(growth_metrics.keys(), growth_metrics.values(), color='#A23B72')
-                axes[0,1].set_title('Key Metrics Comparison')
-                axes[0,1].tick_params(axis='x', rotation=45)
-                axes[0,1].grid(True, alpha=0.3)
-            
-            # 3. Financial structure metrics
-            structure_metrics = {k: v for k, v in metrics.items() 
-                               if any(word in k.lower() for word in ['debt', 'asset', 'equity'])}
-            if not structure_metrics:
-                # If no structure metrics, use the first 4 metrics
-                items = list(metrics.items())
-                structure_metrics = dict(items[:min(4, len(items))])
-            if structure_metrics:
-                axes[1,0].bar(structure_metrics.keys(), structure_metrics.values(), color='#F18F01')
-                axes[1,0].set_title('Financial Structure')
-                axes[1,0].tick_params(axis='x', rotation=45)
-                axes[1,0].grid(True, alpha=0.3)
-            
-            # 4. Operational efficiency metrics
-            efficiency_metrics = {k: v for k, v in metrics.items() 
-                                if any(word in k.lower() for word in ['roe', 'roa', 'efficiency'])}
-            if not efficiency_metrics:
-                # If no efficiency metrics, use the last 4 metrics
-                items = list(metrics.items())
-                efficiency_metrics = dict(items[-min(4, len(items)):])
-            if efficiency_metrics:
-                axes[1,1].bar(efficiency_metrics.keys(), efficiency_metrics.values(), color='#C73E1D')
-                axes[1,1].set_title('Efficiency Metrics')
-                axes[1,1].tick_params(axis='x', rotation=45)
-                axes[1,1].grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            
-            filename = f"dashboard_{company}_{year}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            filepath = self._save_chart(fig, filename)
-            image_base64 = self._fig_to_base64(fig)
-            
-            return {
-                "chart_type": "dashboard",
-                "title": f"{company} {year} Financial Dashboard",
-                "filepath": filepath,
-                "image_base64": image_base64,
-                "metrics_count": len(metrics),
-                "status": "success"
-            }
-            
+            with self._style_context(None):
+                fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+                fig.suptitle(f'{company} {year} Financial Metrics Dashboard', fontsize=16, fontweight='bold')
+                
+                # 1. Profitability metrics
+                profit_metrics = {k: v for k, v in metrics.items() 
+                                if any(word in k.lower() for word in ['revenue', 'profit', 'margin'])}
+                if profit_metrics:
+                    axes[0,0].bar(profit_metrics.keys(), profit_metrics.values(), color='#2E86AB')
+                    axes[0,0].set_title('Profitability Metrics')
+                    axes[0,0].tick_params(axis='x', rotation=45)
+                    axes[0,0].grid(True, alpha=0.3)
+                
+                # 2. Growth metrics
+                growth_metrics = {k: v for k, v in metrics.items() 
+                                if any(word in k.lower() for word in ['growth', 'increase'])}
+                if not growth_metrics:
+                    # If no growth metrics, use all metrics for comparison
+                    growth_metrics = metrics
+                if growth_metrics:
+                    axes[0,1].bar(growth_metrics.keys(), growth_metrics.values(), color='#A23B72')
+                    axes[0,1].set_title('Key Metrics Comparison')
+                    axes[0,1].tick_params(axis='x', rotation=45)
+                    axes[0,1].grid(True, alpha=0.3)
+                
+                # 3. Financial structure metrics
+                structure_metrics = {k: v for k, v in metrics.items() 
+                                   if any(word in k.lower() for word in ['debt', 'asset', 'equity'])}
+                if not structure_metrics:
+                    # If no structure metrics, use the first 4 metrics
+                    items = list(metrics.items())
+                    structure_metrics = dict(items[:min(4, len(items))])
+                if structure_metrics:
+                    axes[1,0].bar(structure_metrics.keys(), structure_metrics.values(), color='#F18F01')
+                    axes[1,0].set_title('Financial Structure')
+                    axes[1,0].tick_params(axis='x', rotation=45)
+                    axes[1,0].grid(True, alpha=0.3)
+                
+                # 4. Operational efficiency metrics
+                efficiency_metrics = {k: v for k, v in metrics.items() 
+                                    if any(word in k.lower() for word in ['roe', 'roa', 'efficiency'])}
+                if not efficiency_metrics:
+                    # If no efficiency metrics, use the last 4 metrics
+                    items = list(metrics.items())
+                    efficiency_metrics = dict(items[-min(4, len(items)):])
+                if efficiency_metrics:
+                    axes[1,1].bar(efficiency_metrics.keys(), efficiency_metrics.values(), color='#C73E1D')
+                    axes[1,1].set_title('Efficiency Metrics')
+                    axes[1,1].tick_params(axis='x', rotation=45)
+                    axes[1,1].grid(True, alpha=0.3)
+                
+                fig.tight_layout()
+                
+                filename = filename or f"dashboard_{company}_{year}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+                return self._render_outputs(fig, filename, outputs, {
+                    "chart_type": "dashboard",
+                    "title": f"{company} {year} Financial Dashboard",
+                    "metrics_count": len(metrics)
+                })
+                
         except Exception as e:
             logger.error(f"Dashboard generation failed: {e}")
             return {"status": "error", "message": str(e)}
 
-# Create global instance
-chart_generator = FinancialChartGenerator()
+    def generate_trend_chart(self, series: Dict[str, Dict[str, float]], title: str, ylabel: str = 'Value',
+                             chart_type: str = 'line', style: str = 'corporate',
+                             outputs: Tuple[str, ...] = DEFAULT_OUTPUTS, filename: Optional[str] = None) -> Dict:
+        """Generate a multi-year trend chart, one line (or bar group) per company, annotated with YoY growth
+
+        series: {company: {year: value}} as returned by chart_data.load_metric_series
+        """
+        try:
+            print(f"📈 Generating {chart_type} trend chart: {title}")
+            with self._style_context(style):
+                fig, ax = plt.subplots(figsize=(12, 6))
+
+                years = sorted({year for values in series.values() for year in values})
+                positions = {year: i for i, year in enumerate(years)}
+                colors = self.chart_styles[style]['colors']
+                width = 0.8 / max(1, len(series))
+
+                for i, (company, values) in enumerate(series.items()):
+                    color = colors[i % len(colors)]
+                    growth = chart_data.yoy_growth(values)
+                    if chart_type == 'bar':
+                        xs = [positions[year] - 0.4 + width * (i + 0.5) for year in values]
+                        ax.bar(xs, list(values.values()), width=width, color=color, alpha=0.85, label=company)
+                    else:
+                        xs = [positions[year] for year in values]
+                        ax.plot(xs, list(values.values()), marker='o', linewidth=2.5, markersize=7,
+                                color=color, label=company)
+
+                    # YoY annotations above each point that has a previous year
+                    for x, (year, value) in zip(xs, values.items()):
+                        if growth[year] is not None:
+                            ax.annotate(f"{growth[year]:+.1f}%", (x, value), textcoords='offset points',
+                                        xytext=(0, 6), ha='center', fontsize=8,
+                                        color='#2ca02c' if growth[year] >= 0 else '#d62728')
+
+                ax.set_xticks(range(len(years)))
+                ax.set_xticklabels(years)
+                ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+                ax.set_xlabel('Year', fontsize=12)
+                ax.set_ylabel(ylabel, fontsize=12)
+                ax.grid(True, alpha=0.3)
+                if len(series) > 1:
+                    ax.legend()
+                fig.tight_layout()
+
+                filename = filename or f"trend_chart_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
+                return self._render_outputs(fig, filename, outputs, {
+                    "chart_type": f"trend_{chart_type}",
+                    "title": title,
+                    "data_points": sum(len(values) for values in series.values())
+                })
+
+        except Exception as e:
+            logger.error(f"Trend chart generation failed: {e}")
+            return {"status": "error", "message": str(e)}
+
+# The global instance is created on first use (it creates ./charts and is only
+# needed for in-process rendering; the pool workers build their own)
+_chart_generator: Optional[FinancialChartGenerator] = None
+
+def get_chart_generator() -> FinancialChartGenerator:
+    global _chart_generator
+    if _chart_generator is None:
+        _chart_generator = FinancialChartGenerator()
+    return _chart_generator
+
+def __getattr__(name: str):
+    # Keeps `from visualization_agent import chart_generator` working
+    if name == "chart_generator":
+        return get_chart_generator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ==================== Chart cache ====================
+
+class ChartCache:
+    """Content-addressed chart files: the name is a hash of (method, data, chart type, style, title, dpi),
+    so a repeated request reuses the existing PNG and identical charts never pile up.
+    
+    The directory is capped at max_bytes; least recently used charts are evicted first.
+    Usage times are kept in chart_index.json next to the charts. Hits only update them in memory;
+    the index is written on put/evict and by flush() at shutdown. get/put do blocking file I/O and
+    are called from a worker thread (see ChartRenderService.render), so index updates take a lock.
+    """
+    
+    def __init__(self, directory: str = "./charts", max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "chart_index.json")
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self._entries: Dict[str, Dict] = {}
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _ordered(value):
+        """Dicts become ordered (key, value) lists so category order is part of the key:
+        the same bars in a different order are a different chart"""
+        if isinstance(value, dict):
+            return ["__dict__", [[str(k), ChartCache._ordered(v)] for k, v in value.items()]]
+        if isinstance(value, (list, tuple)):
+            return [ChartCache._ordered(v) for v in value]
+        return value
+    
+    @staticmethod
+    def key(method: str, args: Tuple, kwargs: Dict, dpi: int = CHART_DPI) -> str:
+        # Keyword arguments are named, so only their values (not their order) matter
+        named = sorted((k, ChartCache._ordered(v)) for k, v in kwargs.items() if k != "outputs")
+        payload = [method, ChartCache._ordered(args), named, dpi]
+        raw = json.dumps(payload, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:20]
+    
+    @staticmethod
+    def filename(method: str, key: str) -> str:
+        prefix = method.replace("generate_", "").replace("metrics_", "")
+        return f"{prefix}_{key}.png"
+    
+    def _load(self):
+        """Index every PNG in the directory (including charts made before the cache existed)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                meta = saved.get(entry.name, {})
+                self._entries[entry.name] = {**meta, "size": stat.st_size,
+                                             "last_used": meta.get("last_used", stat.st_mtime)}
+    
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+    
+    def flush(self):
+        """Persist usage times recorded by cache hits since the last write"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+    
+    def get(self, filename: str, outputs: Tuple[str, ...]) -> Optional[Dict]:
+        filepath = os.path.join(self.directory, filename)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(filename)
+            if entry is None or "result" not in entry or not os.path.exists(filepath):
+                self.stats["misses"] += 1
+                return None
+            entry["last_used"] = time.time()
+            self._dirty = True
+            self.stats["hits"] += 1
+            result = {**entry["result"], "filepath": filepath, "cached": True}
+        
+        if "base64" in outputs or "png" in outputs:
+            with open(filepath, "rb") as f:
+                png_bytes = f.read()
+            if "base64" in outputs:
+                result["image_base64"] = base64.b64encode(png_bytes).decode()
+            if "png" in outputs:
+                result["png_bytes"] = png_bytes
+        return result
+    
+    def put(self, filename: str, result: Dict):
+        """Record a freshly rendered chart and evict old charts beyond the size cap"""
+        meta = {k: v for k, v in result.items() if k not in ("image_base64", "png_bytes", "filepath")}
+        with self._lock:
+            self._load()
+            self._entries[filename] = {"result": meta, "size": result.get("size_bytes", 0), "last_used": time.time()}
+            self._evict(keep=filename)
+            self._save_index()
+    
+    def _evict(self, keep: str):
+        total = sum(entry["size"] for entry in self._entries.values())
+        for name, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._entries[name]
+            self.stats["evicted"] += 1
+    
+    def total_bytes(self) -> int:
+        self._load()
+        return sum(entry["size"] for entry in self._entries.values())
+
+# ==================== Rendering service ====================
+
+_worker_generator = None
+
+def _use_agg_backend():
+    """Headless backend for rendering off the main thread or in a worker process"""
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _spawn_safe_entry_point() -> bool:
+    """Spawned workers re-run the parent's __main__ file, which is only safe when its top-level
+    code sits behind `if __name__ == "__main__":`. Interactive sessions have no file and are safe."""
+    path = getattr(sys.modules.get("__main__"), "__file__", None)
+    if not path:
+        return True
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+    except (OSError, UnicodeDecodeError):
+        return False
+    return re.search(r'^if\s+__name__\s*==\s*[\'"]__main__[\'"]\s*:', source, re.MULTILINE) is not None
+
+def _init_render_worker():
+    """Process pool initializer: headless Agg backend, pyplot imported once per worker"""
+    _use_agg_backend()
+    import matplotlib.pyplot  # noqa: F401
+    global _worker_generator
+    _worker_generator = FinancialChartGenerator()
+
+def _render_job(method: str, args: Tuple, kwargs: Dict) -> Dict:
+    return getattr(_worker_generator, method)(*args, **kwargs)
+
+def _warmup_job() -> int:
+    return os.getpid()
+
+class ChartRenderService:
+    """Runs FinancialChartGenerator methods in a warm process pool so rendering never blocks
+    the event loop and several charts can render in parallel.
+    
+    Workers use spawn (safe next to the event loop and other threads), which re-runs the entry
+    script in every worker. When that script has no `if __name__ == "__main__":` guard (for example
+    one ending in a top-level `await main()`), or the pool keeps breaking, charts are rendered in a
+    thread instead, one at a time since pyplot is not thread-safe.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None, max_pool_failures: int = 2,
+                 cache: Optional[ChartCache] = None):
+        self.max_workers = max_workers if max_workers is not None else min(4, os.cpu_count() or 1)
+        self.cache = cache
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.max_pool_failures = max_pool_failures
+        self._pool_failures = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._fallback_lock = threading.Lock()
+    
+    def start(self, warm: bool = True):
+        """Create the pool; with warm=True every worker is spawned and imports matplotlib right away"""
+        if self._pool is not None or self.max_workers <= 0:
+            return
+        if not _spawn_safe_entry_point():
+            logger.warning("Entry script has no __main__ guard; spawned render workers would re-run it. "
+                           "Rendering charts in a thread instead")
+            self.max_workers = 0
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                         mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_render_worker)
+        if warm:
+            for _ in range(self.max_workers):
+                self._pool.submit(_warmup_job)
+        logger.info(f"Chart render pool started with {self.max_workers} workers")
+    
+    async def render(self, method: str, *args, **kwargs) -> Dict:
+        """Render through the cache: an identical earlier chart is returned without drawing,
+        and identical concurrent requests share one render"""
+        if self.cache is None:
+            return await self._render(method, args, kwargs)
+        
+        outputs = tuple(kwargs.get("outputs", DEFAULT_OUTPUTS))
+        filename = ChartCache.filename(method, ChartCache.key(method, args, kwargs))
+        if filename in self._inflight:
+            await asyncio.shield(self._inflight[filename])
+        cached = await asyncio.to_thread(self.cache.get, filename, outputs)
+        if cached is not None:
+            print(f"♻️ Chart cache hit: {cached['filepath']}")
+            return cached
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[filename] = future
+        try:
+            # The cache is file based, so the PNG is always written
+            result = await self._render(method, args, {**kwargs, "outputs": tuple(set(outputs) | {"file"}),
+                                                       "filename": filename})
+            if result.get("status") == "success":
+                await asyncio.to_thread(self.cache.put, filename, result)
+            return result
+        finally:
+            future.set_result(None)
+            if self._inflight.get(filename) is future:
+                del self._inflight[filename]
+    
+    async def _render(self, method: str, args: Tuple, kwargs: Dict) -> Dict:
+        self.start(warm=False)  # started lazily on the first chart; workers spawn as jobs arrive
+        if self._pool is None:
+            return await asyncio.to_thread(self._render_in_thread, method, args, kwargs)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, _render_job, method, args, kwargs)
+        except BrokenProcessPool as e:
+            logger.error(f"Chart render pool broken, rendering in-process: {e}")
+            self.shutdown()  # recreated on the next request
+            self._pool_failures += 1
+            if self._pool_failures >= self.max_pool_failures:
+                self.max_workers = 0
+            return await asyncio.to_thread(self._render_in_thread, method, args, kwargs)
+    
+    def _render_in_thread(self, method: str, args: Tuple, kwargs: Dict) -> Dict:
+        with self._fallback_lock:
+            _use_agg_backend()
+            return getattr(get_chart_generator(), method)(*args, **kwargs)
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self.cache is not None:
+            self.cache.flush()
+
+chart_renderer = ChartRenderService(
+    int(os.environ["CHART_RENDER_WORKERS"]) if "CHART_RENDER_WORKERS" in os.environ else None,
+    cache=ChartCache(CHART_OUTPUT_DIR, int(float(os.environ.get("CHART_CACHE_MAX_MB", "200")) * 1024 * 1024))
+)
 
 async def _parse_financial_data(data_summary: str) -> Dict:
     """Parse financial data from text summary with bilingual support"""
@@ -301,92 +659,112 @@ async def _parse_financial_data(data_summary: str) -> Dict:
                 except ValueError:
                     continue
         
-        # 如果还是没有数据，创建模拟数据用于测试
+        # 如果还是没有数据，按文本中提到的公司和年份直接查数据库（不再使用模拟数据）
         if not financial_data:
-            print("   ⚠️ Using mock data for testing")
-            financial_data = {
-                'Revenue': 8900,
-                'Net Profit': 800, 
-                'Gross Margin': 45,
-                'ROE': 15,
-                'Total Assets': 15000,
-                'Total Liabilities': 7000
-            }
+            financial_data = await asyncio.to_thread(_lookup_db_metrics, data_summary)
+            if financial_data:
+                print(f"   ✅ Loaded from database: {financial_data}")
         
         print(f"📋 Final parsed data: {financial_data}")
         return financial_data
         
     except Exception as e:
         print(f"❌ Data parsing exception: {e}")
-        # Return mock data to ensure test can continue
-        return {
-            'Revenue': 8900,
-            'Net Profit': 800,
-            'Gross Margin': 45,
-            'ROE': 15,
-            'Total Assets': 15000,
-            'Total Liabilities': 7000
-        }
+        return {}
+
+def _lookup_db_metrics(text: str) -> Dict:
+    companies = [c for c in chart_data.known_companies() if c in text]
+    years = re.findall(r'(?:19|20)\d{2}', text)
+    if not companies or not years:
+        return {}
+    return chart_data.load_metrics(companies[0], years[0])
+
+# The generate_chart tool only reports the file path, so base64 is never encoded for it
+TOOL_OUTPUTS = ("file",)
 
-async def _generate_specific_chart(parsed_data: Dict, chart_type: str, original_summary: str) -> Dict:
-    """Generate specific type of chart with proper data handling"""
+async def _render_trend(companies: List[str], metric: str, years: Optional[List[str]] = None,
+                        chart_type: str = "line") -> Optional[Dict]:
+    """Load {company: {year: value}} in one query and render it; None when no company has two or more years"""
+    series = await asyncio.to_thread(chart_data.load_metric_series, companies, metric, years)
+    series = {company: values for company, values in series.items() if len(values) >= 2}
+    if not series:
+        return None
+    unit = "亿元" if chart_data.METRICS[metric][2] else ""
+    first_year = min(min(values) for values in series.values())
+    last_year = max(max(values) for values in series.values())
+    title = f"{' vs '.join(series)} {metric} {first_year}-{last_year}"
+    return await chart_renderer.render(
+        "generate_trend_chart",
+        series,
+        title,
+        f"{metric} ({unit})" if unit else metric,
+        chart_type,
+        outputs=TOOL_OUTPUTS
+    )
+
+async def _generate_specific_chart(parsed_data: Dict, chart_type: str, original_summary: str,
+                                   company: Optional[str] = None, year: Optional[str] = None) -> Dict:
+    """Generate specific type of chart with proper data handling
+    
+    company/year of None are recovered from the summary text; structured inputs pass them explicitly.
+    """
     try:
-        company = "Test Company"
-        year = "2023"
-        
-        # Extract company info
-        company_match = re.search(r'(公司|Company)[：:\s]*([^\s，]+)', original_summary, re.IGNORECASE)
-        year_match = re.search(r'(\d{4})年', original_summary)
-        
-        if company_match and len(company_match.groups()) >= 2:
-            company = company_match.group(2)
-        if year_match:
-            year = year_match.group(1)
+        if company is None:
+            # Extract company info
+            company_match = re.search(r'(公司|Company)[：:\s]*([^\s，]+)', original_summary, re.IGNORECASE)
+            known = [c for c in await asyncio.to_thread(chart_data.known_companies) if c in original_summary]
+            company = company_match.group(2) if company_match else (known[0] if known else "Test Company")
+        if year is None:
+            year_match = re.search(r'(\d{4})年', original_summary)
+            year = year_match.group(1) if year_match else "2023"
+        label = " ".join(part for part in (company, str(year)) if part)
         
         chart_type_lower = chart_type.lower()
         
         if 'bar' in chart_type_lower or '柱' in chart_type_lower:
-            return chart_generator.generate_bar_chart(
+            return await chart_renderer.render(
+                "generate_bar_chart",
                 parsed_data, 
-                f"{company} {year} Key Financial Indicators", 
-                'corporate'
+                f"{label} Key Financial Indicators".strip(), 
+                'corporate',
+                outputs=TOOL_OUTPUTS
             )
             
         elif 'line' in chart_type_lower or '折线' in chart_type_lower:
-            # 创建模拟的季度数据用于折线图
-            if len(parsed_data) >= 4:
-                # 使用前4个指标创建季度数据
-                quarterly_data = {}
-                for i, (key, value) in enumerate(list(parsed_data.items())[:4]):
-                    quarterly_data[f"Q{i+1} {key}"] = value
-            else:
-                # 如果数据不足，使用现有数据
-                quarterly_data = {f"Q{i+1}": list(parsed_data.values())[i] 
-                                for i in range(min(4, len(parsed_data)))}
-            
-            return chart_generator.generate_line_chart(
-                quarterly_data,
-                f"{company} {year} Quarterly Performance",
-                'Quarter',
-                'modern'
+            # 折线图画真实的多年序列，而不是把不相关的指标改名为 Q1–Q4
+            metric = next((m for m in parsed_data if m in chart_data.METRICS), "Revenue")
+            result = await _render_trend([company], metric, chart_type="line") if company else None
+            if result is not None:
+                return result
+            print(f"   ⚠️ No multi-year {metric} series for '{company}' in the database, drawing a bar chart instead")
+            return await chart_renderer.render(
+                "generate_bar_chart",
+                parsed_data,
+                f"{label} Financial Metrics".strip(),
+                'corporate',
+                outputs=TOOL_OUTPUTS
             )
             
         elif 'pie' in chart_type_lower or '饼' in chart_type_lower:
-            return chart_generator.generate_pie_chart(
+            return await chart_renderer.render(
+                "generate_pie_chart",
                 parsed_data,
-                f"{company} {year} Financial Structure",
-                'classic'
+                f"{label} Financial Structure".strip(),
+                'classic',
+                outputs=TOOL_OUTPUTS
             )
             
         elif 'dashboard' in chart_type_lower or '仪表' in chart_type_lower:
-            return chart_generator.generate_metrics_dashboard(parsed_data, company, year)
+            return await chart_renderer.render("generate_metrics_dashboard", parsed_data, company, year, outputs=TOOL_OUTPUTS)
             
         else:
             # Default to bar chart
-            return chart_generator.generate_bar_chart(
+            return await chart_renderer.render(
+                "generate_bar_chart",
                 parsed_data,
-                f"{company} {year} Financial Metrics",
-                'corporate'
+                f"{label} Financial Metrics".strip(),
+                'corporate',
+                outputs=TOOL_OUTPUTS
             )
             
     except Exception as e:
@@ -394,19 +772,32 @@ async def _generate_specific_chart(parsed_data: Dict, chart_type: str, original_
         return {"status": "error", "message": str(e)}
 
 async def generate_chart(data_summary: str, chart_type: str) -> str:
-    """Generate financial chart - complete implementation"""
+    """Generate a financial chart (bar/line/pie/dashboard).
+    
+    data_summary can be structured, in which case exact numbers are used without text parsing:
+    a handle such as "db:比亚迪:2023", JSON {"company": "比亚迪", "year": 2023} (read from the database),
+    JSON {"metrics": {"Revenue": 6023, "Net Profit": 300}, "company": ..., "year": ...},
+    or JSON {"sql": "SELECT ..."}. Plain text like "营业收入6023亿元，净利润300亿元" is still accepted.
+    """
     print(f"\n📊 Starting {chart_type} chart generation...")
     print(f"   Input data: {data_summary}")
     
     try:
-        # Parse data summary, extract structured data
-        parsed_data = await _parse_financial_data(data_summary)
+        company = year = None
+        structured = await asyncio.to_thread(chart_data.resolve_chart_input, data_summary)
+        if structured is not None:
+            parsed_data = structured["metrics"]
+            company, year = structured.get("company") or "", structured.get("year") or ""
+            print(f"📋 Structured data ({structured.get('source')}): {parsed_data}")
+        else:
+            # Parse data summary, extract structured data
+            parsed_data = await _parse_financial_data(data_summary)
         
         if not parsed_data or len(parsed_data) < 2:
             return "❌ Cannot extract sufficient financial information from provided data for chart generation."
         
         # Call different generation methods based on chart type
-        chart_result = await _generate_specific_chart(parsed_data, chart_type, data_summary)
+        chart_result = await _generate_specific_chart(parsed_data, chart_type, data_summary, company, year)
         
         if chart_result["status"] == "success":
             response = f"""
@@ -428,3 +819,46 @@ async def generate_chart(data_summary: str, chart_type: str) -> str:
         logger.error(f"Chart generation tool execution failed: {e}")
         return f"❌ Error during chart generation: {str(e)}"
 
+
+async def generate_trend_chart(companies: str, metric: str = "Revenue", years: str = "", chart_type: str = "line") -> str:
+    """Generate a multi-year trend chart straight from the database, with YoY growth annotations.
+    
+    companies: one or more company names, e.g. "比亚迪" or "比亚迪,宁德时代"
+    metric: Revenue / Net Profit / Total Assets / Total Liabilities / R&D Expenses / Employees (中文名也可，如 营业收入)
+    years: optional range such as "2020-2024" or list "2022,2023"; empty means all available years
+    chart_type: "line" or "bar" (grouped bars per year)
+    """
+    print(f"\n📈 Starting trend chart generation: {companies} / {metric} / {years or 'all years'}")
+    
+    try:
+        company_list = [c.strip() for c in re.split(r'[,，、;；/]|\s+vs\s+', companies) if c.strip()]
+        metric_name = chart_data.normalize_metric(metric)
+        if not company_list:
+            return "❌ Please provide at least one company name."
+        if metric_name is None:
+            return f"❌ Unknown metric '{metric}'. Available: {', '.join(chart_data.METRICS)}"
+        
+        kind = "bar" if 'bar' in chart_type.lower() or '柱' in chart_type else "line"
+        chart_result = await _render_trend(company_list, metric_name, chart_data.parse_years(years), kind)
+        if chart_result is None:
+            return (f"❌ The database has fewer than two years of {metric_name} for {', '.join(company_list)}; "
+                    f"known companies: {', '.join(await asyncio.to_thread(chart_data.known_companies))}")
+        
+        if chart_result["status"] == "success":
+            return f"""
+✅✅✅ Trend chart generation successful!
+
+【Chart Information】
+• Type: {chart_result['chart_type']}
+• Title: {chart_result['title']}
+• Data Points: {chart_result.get('data_points', 'N/A')}
+• File Path: {chart_result['filepath']}
+
+💡 Values come directly from the database; labels show year-over-year growth.
+"""
+        else:
+            return f"❌ Trend chart generation failed: {chart_result.get('message', 'Unknown error')}"
+    
+    except Exception as e:
+        logger.error(f"Trend chart tool execution failed: {e}")
+        return f"❌ Error during trend chart generation: {str(e)}"
@@ -4,17 +4,328 @@ from bs4 import BeautifulSoup
 import urllib.parse
 import asyncio
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Annotated
+from collections import OrderedDict
+from difflib import SequenceMatcher
+import hashlib
+import json
+import os
+import random
 import re
+import sqlite3
+import threading
 import time
+import unicodedata
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from text_utils import char_bigrams, estimate_tokens
+
+# lxml 为可选依赖 (pip install lxml)，用于单遍快速解析，未安装时使用 BeautifulSoup
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# aiohttp 为可选依赖 (pip install aiohttp)，未安装时异步接口退回线程池 + requests
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    aiohttp = None
+    HAS_AIOHTTP = False
 
 logger = logging.getLogger(__name__)
 
+YEAR_PATTERN = re.compile(r'(?:19|20)\d{2}')
+
+class TokenBucket:
+    """令牌桶限流器（线程安全，同步/异步均可使用）
+    
+    rate 为每秒补充的令牌数，capacity 为允许的突发请求数。令牌不足时按排队顺序预支，
+    调用方等待相应时间后再发请求，使并发请求被均匀摊开。
+    被限流时 on_throttle 会暂停整个桶并将速率减半，之后每次成功请求逐步恢复（AIMD）。
+    """
+    
+    def __init__(self, rate: float = 2.0, capacity: float = 4.0, min_rate: float = 0.2):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            # _updated 在暂停期间位于未来，等待时间 = 剩余暂停时间 + 欠下的令牌补充时间
+            return max(0.0, self._updated - now) + max(0.0, -self._tokens) / self.rate
+    
+    def acquire(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    async def acquire_async(self) -> float:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+    
+    def on_throttle(self, pause: float):
+        """被限流：暂停 pause 秒、清空令牌并将速率减半"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + pause)
+            self.rate = max(self.min_rate, self.rate / 2)
+    
+    def on_success(self):
+        """请求成功：速率逐步恢复到初始值"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+
+# 每个搜索后端（按主机名区分）共享一个令牌桶，多个 agent 实例访问同一后端时共同受限
+# deep_search 抓取正文时会遇到大量不同主机，按 LRU 只保留最近使用的 MAX_RATE_LIMITERS 个令牌桶
+MAX_RATE_LIMITERS = 256
+_rate_limiters: "OrderedDict[str, TokenBucket]" = OrderedDict()
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(backend: str, rate: float = 2.0, capacity: float = 4.0) -> TokenBucket:
+    with _rate_limiters_lock:
+        if backend in _rate_limiters:
+            _rate_limiters.move_to_end(backend)
+        else:
+            _rate_limiters[backend] = TokenBucket(rate, capacity)
+            while len(_rate_limiters) > MAX_RATE_LIMITERS:
+                _rate_limiters.popitem(last=False)
+        return _rate_limiters[backend]
+
+
+class RetryableSearchError(Exception):
+    """可重试的搜索错误：429 / 5xx / 验证码拦截"""
+    
+    def __init__(self, message: str, kind: str = "server_errors", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class SearchResultCache:
+    """两级搜索结果缓存：内存 LRU + SQLite 磁盘存储
+    
+    键为归一化后的查询，值为解析后的结果列表（而不是格式化后的字符串）。
+    ttl 内视为新鲜；过期后 stale_ttl 内仍可返回旧结果并在后台刷新（stale-while-revalidate）。
+    """
+    
+    def __init__(self, db_path: str = "./local_data/search_cache.db", max_memory_items: int = 256,
+                 ttl: float = 3600.0, stale_ttl: float = 86400.0):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._memory: "OrderedDict[str, Tuple[List[Dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale_hits": 0}
+        # 数据库在第一次读写磁盘时才创建，导入模块或构造实例不会在工作目录下生成文件
+        self._db_ready = False
+    
+    def _connect(self):
+        if not self._db_ready:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if not self._db_ready:
+            conn.execute("""CREATE TABLE IF NOT EXISTS search_cache (
+                query_key TEXT PRIMARY KEY,
+                results_json TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )""")
+            conn.commit()
+            self._db_ready = True
+        return conn
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """全半角统一、小写、合并空白，使等价查询命中同一条缓存"""
+        query = unicodedata.normalize("NFKC", query).lower()
+        return re.sub(r'\s+', ' ', query).strip()
+    
+    def get(self, query: str) -> Tuple[Optional[List[Dict]], bool]:
+        """返回 (结果, 是否新鲜)；未命中或彻底过期时返回 (None, False)"""
+        key = self.normalize_query(query)
+        entry = self._memory_get(key)
+        if entry is None:
+            entry = self._disk_get(key)
+        return self._classify(entry)
+    
+    async def aget(self, query: str) -> Tuple[Optional[List[Dict]], bool]:
+        """get 的异步版本：内存未命中时在线程中读取 SQLite，不阻塞事件循环"""
+        key = self.normalize_query(query)
+        entry = self._memory_get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._disk_get, key)
+        return self._classify(entry)
+    
+    def _memory_get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+        return entry
+    
+    def _disk_get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT results_json, stored_at FROM search_cache WHERE query_key = ?",
+                               (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        entry = (json.loads(row[0]), row[1])
+        self.stats["disk_hits"] += 1
+        self._remember(key, entry)
+        return entry
+    
+    def _classify(self, entry: Optional[Tuple[List[Dict], float]]) -> Tuple[Optional[List[Dict]], bool]:
+        if entry is None:
+            self.stats["misses"] += 1
+            return None, False
+        results, stored_at = entry
+        age = time.time() - stored_at
+        if age <= self.ttl:
+            return results, True
+        if age <= self.ttl + self.stale_ttl:
+            self.stats["stale_hits"] += 1
+            return results, False
+        self.stats["misses"] += 1
+        return None, False
+    
+    def set(self, query: str, results: List[Dict]):
+        key = self.normalize_query(query)
+        stored_at = time.time()
+        self._remember(key, (results, stored_at))
+        self._disk_set(key, results, stored_at)
+    
+    async def aset(self, query: str, results: List[Dict]):
+        """set 的异步版本：内存立即更新，SQLite 写入放到线程中"""
+        key = self.normalize_query(query)
+        stored_at = time.time()
+        self._remember(key, (results, stored_at))
+        await asyncio.to_thread(self._disk_set, key, results, stored_at)
+    
+    def _disk_set(self, key: str, results: List[Dict], stored_at: float):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)",
+                         (key, json.dumps(results, ensure_ascii=False), stored_at))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _remember(self, key: str, entry: Tuple[List[Dict], float]):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+class SearchRecorder:
+    """搜索结果页录制：按归一化查询保存原始 HTML，供离线回放服务（search_fixture_server.py）使用
+    
+    目录结构: {directory}/index.json 记录 查询键 → 文件名/原始查询/录制时间，页面为同目录下的 .html 文件。
+    """
+    
+    def __init__(self, directory: str = "./local_data/search_pages"):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._load_index()
+    
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.sha1(SearchResultCache.normalize_query(query).encode("utf-8")).hexdigest()[:16]
+    
+    def _load_index(self) -> Dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save(self, query: str, html: str):
+        key = self.key(query)
+        filename = self.index.get(key, {}).get("file") or f"{key}.html"
+        with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+            f.write(html)
+        with self._lock:
+            self.index[key] = {"file": filename, "query": query, "recorded_at": time.time()}
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.index_path)
+    
+    def load(self, query: str) -> Optional[str]:
+        entry = self.index.get(self.key(query))
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, entry["file"]), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
 class BaiduSearchAgent:
     """使用百度搜索引擎的代理"""
     
-    def __init__(self):
-        self.base_url = "https://www.baidu.com/s"
+    def __init__(self,
+                 base_url: str = "https://www.baidu.com/s",
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 10.0,
+                 max_connections: int = 32,
+                 max_connections_per_host: int = 8,
+                 keepalive_timeout: float = 30.0,
+                 cache: Optional[SearchResultCache] = None,
+                 parser_backend: str = "auto",
+                 rate_limit: float = 2.0,
+                 burst: int = 4,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 8.0,
+                 result_token_budget: int = 1200,
+                 recorder: Optional[SearchRecorder] = None):
+        self.base_url = base_url
+        # 设置 recorder 后，每次成功抓取的结果页都会录制下来用于离线回放
+        self.recorder = recorder
+        # 送入 LLM 的搜索结果 token 上限
+        self.result_token_budget = result_token_budget
+        self.rate_limiter = get_rate_limiter(urlsplit(base_url).netloc or base_url, rate_limit, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "server_errors": 0,
+                      "connection_errors": 0, "fallbacks": 0}
+        # 解析后端: auto（有 lxml 用 lxml）/ lxml / bs4
+        self.parser_backend = ("lxml" if HAS_LXML else "bs4") if parser_backend == "auto" else parser_backend
+        self.cache = cache
+        self._refreshing = set()  # 正在后台刷新的查询，避免重复刷新
+        self._background_tasks: set = set()  # 持有后台刷新任务的引用，防止被垃圾回收
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
         # 更新User-Agent
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -25,32 +336,172 @@ class BaiduSearchAgent:
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        # 异步连接池：与事件循环绑定，首次使用时创建
+        self._http_session = None
+        self._http_loop = None
+    
+    def _build_params(self, query: str, num_results: int) -> Dict:
+        return {
+            "wd": query,
+            "rn": num_results,  # 结果数量
+            "ie": "utf-8",
+            "cl": 3,  # 网页类型
+        }
     
     def search_baidu(self, query: str, num_results: int = 8) -> List[Dict]:
-        """使用百度搜索并解析结果"""
+        """使用百度搜索并解析结果（限流 + 失败重试，重试耗尽后返回备用结果）"""
+        # 编码查询参数
+        params = self._build_params(query, num_results)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                logger.info(f"搜索百度: {query}")
+                self.stats["requests"] += 1
+                response = self.session.get(self.base_url, params=params,
+                                            timeout=(self.connect_timeout, self.read_timeout))
+                self._check_response(response.status_code, response.headers, str(response.url))
+                response.raise_for_status()
+                if self.recorder is not None:
+                    self.recorder.save(query, response.text)
+                
+                # 解析HTML
+                results = self._parse_html(response.text)
+                self.rate_limiter.on_success()
+                return results
+                
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    logger.error(f"百度搜索失败: {e}")
+                    break
+                logger.warning(f"百度搜索失败({e})，{delay:.1f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+        
+        # 返回模拟数据作为备用
+        self.stats["fallbacks"] += 1
+        return self._get_fallback_results(query)
+    
+    # ==================== 限流与重试 ====================
+    
+    def _check_response(self, status: int, headers, url: str):
+        """429 / 5xx / 跳转到验证码页视为可重试错误"""
+        retry_after = None
         try:
-            # 编码查询参数
-            params = {
-                "wd": query,
-                "rn": num_results,  # 结果数量
-                "ie": "utf-8",
-                "cl": 3,  # 网页类型
-            }
+            retry_after = float(headers.get("Retry-After", ""))
+        except (TypeError, ValueError):
+            pass
+        if status == 429 or "wappass.baidu.com" in url or "/captcha" in url:
+            raise RetryableSearchError(f"被限流 (HTTP {status})", kind="throttled", retry_after=retry_after)
+        if status >= 500:
+            raise RetryableSearchError(f"服务端错误 (HTTP {status})", retry_after=retry_after)
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """返回重试前的等待秒数；不可重试或次数用尽时返回 None"""
+        if isinstance(error, RetryableSearchError):
+            kind = error.kind
+        elif isinstance(error, (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)) or \
+                (HAS_AIOHTTP and isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))):
+            kind = "connection_errors"
+        else:
+            return None
+        self.stats[kind] += 1
+        if attempt >= self.max_retries:
+            return None
+        
+        # 指数退避 + 全抖动，避免并发请求同时重试；服务端给出 Retry-After 时至少等待该时长
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.backoff_max * 4))
+        if kind == "throttled":
+            # 限流对整个后端生效：暂停令牌桶，其他并发请求也一起等待
+            self.rate_limiter.on_throttle(delay)
+        self.stats["retries"] += 1
+        return delay
+    
+    def _parse_html(self, html: str) -> List[Dict]:
+        if self.parser_backend == "lxml":
+            results = self._parse_baidu_results_fast(html)
+            if results:
+                return results
+            # 页面结构不符合预期时退回完整的 BeautifulSoup 解析（含备用方法）
+        soup = BeautifulSoup(html, 'html.parser')
+        return self._parse_baidu_results_optimized(soup)
+    
+    # 摘要候选 class 关键词，按优先级排列（对应 _extract_abstract_optimized 的选择器）
+    _ABSTRACT_CLASS_KEYS = ("c-abstract", "content", "desc", "summary", "content-right", "abstract")
+    _AD_PATTERN = re.compile(r'广告|推广|\bad\b|\badvertisement\b', re.IGNORECASE)
+    
+    def _parse_baidu_results_fast(self, html: str) -> List[Dict]:
+        """基于 lxml 的单遍解析：一次 XPath 定位结果容器，每个容器只遍历一次同时取标题、链接和摘要"""
+        if not html:
+            return []
+        tree = lxml.html.fromstring(html)
+        containers = tree.xpath(
+            '//div[contains(concat(" ", normalize-space(@class), " "), " result ") or '
+            'contains(concat(" ", normalize-space(@class), " "), " c-container ")]'
+            '[not(ancestor::div[contains(concat(" ", normalize-space(@class), " "), " result ") or '
+            'contains(concat(" ", normalize-space(@class), " "), " c-container ")])]'
+        )
+        
+        results = []
+        seen_titles = set()
+        for container in containers[:10]:
+            h3 = title_anchor = first_anchor = None
+            abstract_candidates = {}
+            for elem in container.iter():
+                tag = elem.tag
+                if tag == 'h3' and h3 is None:
+                    h3 = elem
+                elif tag == 'a':
+                    if first_anchor is None:
+                        first_anchor = elem
+                    if title_anchor is None and re.search(r'title|head', elem.get('class', '')):
+                        title_anchor = elem
+                elif tag in ('div', 'span'):
+                    css = elem.get('class', '')
+                    if css:
+                        for key in self._ABSTRACT_CLASS_KEYS:
+                            if key in css and key not in abstract_candidates:
+                                abstract_candidates[key] = elem
             
-            logger.info(f"搜索百度: {query}")
-            response = self.session.get(self.base_url, params=params, timeout=15)
-            response.raise_for_status()
+            title_elem = h3 if h3 is not None else (title_anchor if title_anchor is not None else first_anchor)
+            if title_elem is None:
+                continue
+            title = self._clean_text(title_elem.text_content())
+            if not title or title in seen_titles:
+                continue
             
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-            results = self._parse_baidu_results_optimized(soup)
+            container_text = self._clean_text(container.text_content())
+            if self._AD_PATTERN.search(container_text):
+                continue
             
-            return results
+            link_elem = title_elem if title_elem.tag == 'a' else next(title_elem.iter('a'), None)
+            link = link_elem.get('href', '') if link_elem is not None else ''
+            if link.startswith('/'):
+                link = "https://www.baidu.com" + link
             
-        except Exception as e:
-            logger.error(f"百度搜索失败: {e}")
-            # 返回模拟数据作为备用
-            return self._get_fallback_results(query)
+            abstract = ""
+            for key in self._ABSTRACT_CLASS_KEYS:
+                elem = abstract_candidates.get(key)
+                if elem is not None:
+                    text = self._clean_text(elem.text_content())
+                    if len(text) > 10:
+                        abstract = text
+                        break
+            if not abstract and title in container_text:
+                rest = container_text.replace(title, '').strip()
+                abstract = rest if len(rest) > 20 else ""
+            
+            seen_titles.add(title)
+            results.append({
+                "title": title,
+                "link": link,
+                "abstract": abstract or "暂无详细摘要",
+                "source": "百度搜索"
+            })
+        
+        return results[:8]
     
     def _parse_baidu_results_optimized(self, soup: BeautifulSoup) -> List[Dict]:
         """百度结果解析"""
@@ -104,7 +555,9 @@ class BaiduSearchAgent:
             return None
             
         title = self._clean_text(title_elem.get_text())
-        link = title_elem.get('href', '')
+        # h3 本身没有 href，链接在其内部的 a 标签上
+        link_elem = title_elem if title_elem.name == 'a' else title_elem.find('a')
+        link = link_elem.get('href', '') if link_elem else ''
         
         # 处理百度跳转链接
         if link.startswith('/'):
@@ -200,9 +653,8 @@ class BaiduSearchAgent:
     
     def _is_ad(self, container) -> bool:
         """判断是否为广告"""
-        ad_indicators = ['广告', '推广', 'ad', 'advertisement']
-        container_text = container.get_text().lower()
-        return any(indicator in container_text for indicator in ad_indicators)
+        # 英文标识按单词匹配，避免 "download"、"leader" 之类的正常结果被误判
+        return bool(self._AD_PATTERN.search(container.get_text()))
     
     def _clean_abstract(self, abstract: str) -> str:
         """清理摘要文本"""
@@ -246,13 +698,15 @@ class BaiduSearchAgent:
             {
                 "title": f"关于'{query}'的搜索结果",
                 "link": "https://www.baidu.com",
-                "abstract": f"由于网络或解析问题，无法获取'{query}'的实时搜索结果。建议直接访问百度搜索查看最新信息。",
+                "abstract": f"搜索服务暂时不可用（网络异常或被限流，已重试 {self.max_retries} 次），无法获取'{query}'的实时搜索结果。请基于本地数据继续分析，或稍后再试。",
                 "source": "系统提示"
             }
         ]
     
-    def format_search_results(self, results: List[Dict], query: str = "") -> str:
-        """格式化搜索结果"""
+    def format_search_results(self, results: List[Dict], query: str = "",
+                              company: Optional[str] = None, year: Optional[str] = None,
+                              max_tokens: Optional[int] = None, max_results: int = 5) -> str:
+        """格式化搜索结果：先本地重排、去重，再在 token 预算内装入最有价值的结果"""
         if not results:
             return f"🔍🔍 未找到关于'{query}'的相关结果"
         
@@ -260,39 +714,492 @@ class BaiduSearchAgent:
         if len(results) == 1 and results[0]["source"] == "系统提示":
             return f"【搜索提示】: {results[0]['abstract']}"
         
-        formatted = f"【百度搜索: {query}】\n\n"
-        
-        for i, result in enumerate(results[:5], 1):
-            formatted += f"{i}. 📰 {result['title']}\n"
-            formatted += f"   摘要: {result['abstract']}\n"
-            formatted += f"   来源: {result['source']}\n\n"
-        
         # 添加财务搜索专用提示
         financial_keywords = ["财务", "财报", "收入", "利润", "年报", "季度报告"]
         if any(keyword in query for keyword in financial_keywords):
-            formatted += "💡💡 财务信息提示: 以上信息来自公开搜索，请以公司官方公告为准"
+            footer = "💡💡 财务信息提示: 以上信息来自公开搜索，请以公司官方公告为准"
         else:
-            formatted += "💡💡 提示: 以上信息来自百度搜索，请谨慎参考其准确性"
+            footer = "💡💡 提示: 以上信息来自百度搜索，请谨慎参考其准确性"
+        
+        formatted = f"【百度搜索: {query}】\n\n"
+        budget = (max_tokens or self.result_token_budget) - estimate_tokens(formatted + footer)
+        index = 0
+        for result in self.rank_results(results, query, company, year)[:max_results]:
+            block = self._format_result(index + 1, result)
+            if estimate_tokens(block) > budget and result.get("evidence"):
+                # 放不下时先去掉正文摘录，只保留标题和摘要
+                block = self._format_result(index + 1, {**result, "evidence": []})
+            cost = estimate_tokens(block)
+            if cost > budget:
+                continue
+            formatted += block
+            budget -= cost
+            index += 1
+        
+        return formatted + footer
+    
+    @staticmethod
+    def _format_result(index: int, result: Dict) -> str:
+        block = f"{index}. 📰 {result['title']}\n"
+        block += f"   摘要: {result['abstract']}\n"
+        # 深度搜索模式下附带的正文相关片段
+        for chunk in result.get("evidence", []):
+            block += f"   正文摘录: {chunk}\n"
+        block += f"   来源: {result['source']}\n\n"
+        return block
+    
+    def rank_results(self, results: List[Dict], query: str,
+                     company: Optional[str] = None, year: Optional[str] = None,
+                     max_hamming: int = 3) -> List[Dict]:
+        """本地重排：按与公司/年份/关键词的重合度打分，并用 simhash 去掉近似重复的结果
+        
+        搜索引擎原始排名（或 search_many 的融合得分）只作为较小的先验分。
+        """
+        years = set(YEAR_PATTERN.findall(query))
+        if year:
+            years.add(str(year))
+        terms = [t for t in re.split(r'[\s,，;；|]+', YEAR_PATTERN.sub(' ', query)) if t.strip('年 ')]
+        if company and company not in terms:
+            terms.insert(0, company)
         
-        return formatted
+        scored = []
+        for rank, result in enumerate(results):
+            if result["source"] == "系统提示":
+                continue
+            title = result["title"]
+            text = " ".join([title, result.get("abstract", ""), *result.get("evidence", [])])
+            text_grams, title_grams = char_bigrams(text), char_bigrams(title)
+            
+            term_score = 0.0
+            for term in terms:
+                grams = char_bigrams(term)
+                if grams:
+                    term_score += (len(grams & text_grams) + 0.5 * len(grams & title_grams)) / (1.5 * len(grams))
+                elif term.lower() in text.lower():
+                    term_score += 1.0
+            term_score = term_score / len(terms) if terms else 0.0
+            
+            year_score = 0.0
+            if years:
+                mentioned = set(YEAR_PATTERN.findall(text))
+                year_score = 1.0 if mentioned & years else (-0.5 if mentioned else 0.0)
+            company_score = 0.0
+            if company:
+                company_score = 1.0 if company in text else -1.0
+            
+            prior = result.get("score", 1.0 / (rank + 2))
+            score = term_score + 0.3 * year_score + 0.3 * company_score + 0.4 * prior
+            if result.get("evidence"):
+                score += 0.1
+            if result.get("abstract") == "暂无详细摘要":
+                score -= 0.1
+            scored.append((score, rank, term_score > 0 or year_score > 0, result))
+        
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        # 与查询毫不相关的结果直接丢弃（全部不相关时保留原结果，交给模型判断）
+        if any(relevant for _, _, relevant, _ in scored):
+            scored = [item for item in scored if item[2]]
+        
+        ranked, fingerprints = [], []
+        for score, _, _, result in scored:
+            fingerprint = _simhash(result["title"] + result.get("abstract", ""))
+            if any(bin(fingerprint ^ other).count("1") <= max_hamming for other in fingerprints):
+                continue
+            fingerprints.append(fingerprint)
+            ranked.append({**result, "relevance": round(score, 3)})
+        return ranked
+    
+    async def _get_http_session(self):
+        """获取（或创建）当前事件循环上的 aiohttp 连接池"""
+        loop = asyncio.get_running_loop()
+        if self._http_session is not None and self._http_loop is not loop:
+            await self._close_stale_session()
+        if self._http_session is None or self._http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(total=None, connect=self.connect_timeout, sock_read=self.read_timeout)
+            headers = dict(self.headers)
+            headers["Accept-Encoding"] = "gzip, deflate"  # br 需要额外的 Brotli 依赖
+            self._http_session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers)
+            self._http_loop = loop
+        return self._http_session
     
-    async def async_search(self, query: str) -> str:
+    async def _close_stale_session(self):
+        """事件循环已更换：关闭属于旧循环的连接池，而不是直接丢弃"""
+        session, old_loop = self._http_session, self._http_loop
+        self._http_session = None
+        if session.closed:
+            return
+        try:
+            if old_loop is not None and old_loop.is_running():
+                # 旧循环仍在其他线程运行，关闭操作交回旧循环执行
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), old_loop))
+            else:
+                logger.warning("上一个事件循环结束前未调用 aclose()，关闭遗留的搜索连接池")
+                await session.close()
+        except Exception as e:
+            logger.warning(f"关闭旧的搜索连接池失败: {e!r}")
+    
+    async def async_search_baidu(self, query: str, num_results: int = 8) -> List[Dict]:
+        """原生异步的百度搜索：复用连接池和 keep-alive 连接，不占用默认线程池"""
+        params = self._build_params(query, num_results)
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire_async()
+            try:
+                session = await self._get_http_session()
+                logger.info(f"搜索百度(async): {query}")
+                self.stats["requests"] += 1
+                async with session.get(self.base_url, params=params) as response:
+                    self._check_response(response.status, response.headers, str(response.url))
+                    response.raise_for_status()
+                    html = await response.text()
+                if self.recorder is not None:
+                    await asyncio.to_thread(self.recorder.save, query, html)
+                
+                # 解析是纯CPU操作，放到线程中避免阻塞事件循环
+                results = await asyncio.to_thread(self._parse_html, html)
+                self.rate_limiter.on_success()
+                return results
+                
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    logger.error(f"百度搜索失败: {e}")
+                    break
+                logger.warning(f"百度搜索失败({e})，{delay:.1f}s 后第 {attempt + 1} 次重试")
+                await asyncio.sleep(delay)
+        
+        self.stats["fallbacks"] += 1
+        return self._get_fallback_results(query)
+    
+    async def aclose(self):
+        """关闭异步连接池（先结束仍在进行的后台刷新）"""
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
+    
+    async def _fetch_results(self, query: str) -> List[Dict]:
+        if HAS_AIOHTTP:
+            results = await self.async_search_baidu(query)
+        else:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, self.search_baidu, query)
+        # 备用提示结果不写入缓存
+        if self.cache is not None and results and results[0]["source"] != "系统提示":
+            await self.cache.aset(query, results)
+        return results
+    
+    def _schedule_refresh(self, query: str):
+        """后台刷新过期的缓存条目；同一查询同时只有一个刷新任务"""
+        key = SearchResultCache.normalize_query(query)
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._fetch_results(query))
+        self._background_tasks.add(task)
+        
+        def _done(task: asyncio.Task):
+            self._background_tasks.discard(task)
+            self._refreshing.discard(key)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"后台刷新搜索缓存失败 {query}: {task.exception()}")
+        
+        task.add_done_callback(_done)
+    
+    async def search_results(self, query: str) -> List[Dict]:
+        """带缓存的搜索：新鲜结果直接返回；过期但仍可用的结果先返回，再在后台刷新"""
+        if self.cache is None:
+            return await self._fetch_results(query)
+        
+        results, fresh = await self.cache.aget(query)
+        if results is not None:
+            if not fresh:
+                self._schedule_refresh(query)
+            logger.info(f"搜索缓存命中({'新鲜' if fresh else '过期，后台刷新'}): {query}")
+            return results
+        return await self._fetch_results(query)
+    
+    @staticmethod
+    def _normalize_url(link: str) -> str:
+        """去掉协议、www、锚点、跟踪参数和末尾斜杠，用于结果去重"""
+        parts = urlsplit(link.strip())
+        host = parts.netloc.lower()
+        if host.startswith("www."):
+            host = host[4:]
+        query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query)
+                                 if not k.lower().startswith(("utm_", "spm", "from"))))
+        return f"{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else "")
+    
+    @staticmethod
+    def _similar_title(a: str, b: str, threshold: float = 0.85) -> bool:
+        a, b = re.sub(r'\W+', '', a.lower()), re.sub(r'\W+', '', b.lower())
+        if not a or not b:
+            return False
+        return a == b or SequenceMatcher(None, a, b).ratio() >= threshold
+    
+    async def search_many(self, queries: List[str], max_concurrency: int = 4, limit: int = 10) -> List[Dict]:
+        """并发执行多个查询，合并结果后按 URL 和标题相似度去重，返回统一排序的列表
+        
+        排序采用倒数排名融合：结果在各查询中的排名越靠前、被越多查询命中，得分越高。
+        """
+        queries = [q.strip() for q in queries if q and q.strip()]
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def run(query: str) -> List[Dict]:
+            async with semaphore:
+                return await self.search_results(query)
+        
+        result_lists = await asyncio.gather(*[run(q) for q in queries], return_exceptions=True)
+        
+        merged: List[Dict] = []
+        url_index: Dict[str, Dict] = {}
+        for query, results in zip(queries, result_lists):
+            if isinstance(results, Exception):
+                logger.error(f"查询 '{query}' 失败: {results}")
+                continue
+            for rank, result in enumerate(results):
+                if result["source"] == "系统提示":
+                    continue
+                url_key = self._normalize_url(result["link"]) if result.get("link") else None
+                existing = url_index.get(url_key) if url_key else None
+                if existing is None:
+                    existing = next((m for m in merged if self._similar_title(m["title"], result["title"])), None)
+                if existing is None:
+                    existing = {**result, "queries": [], "score": 0.0}
+                    merged.append(existing)
+                elif len(result.get("abstract", "")) > len(existing.get("abstract", "")):
+                    existing["abstract"] = result["abstract"]
+                if url_key:
+                    url_index[url_key] = existing
+                if query not in existing["queries"]:
+                    existing["queries"].append(query)
+                    existing["score"] += 1.0 / (rank + 2)
+        
+        merged.sort(key=lambda r: r["score"], reverse=True)
+        return merged[:limit]
+    
+    async def async_search(self, query: str, company: Optional[str] = None, year: Optional[str] = None) -> str:
         """异步搜索接口"""
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(None, self.search_baidu, query)
+        results = await self.search_results(query)
+        return self.format_search_results(results, query, company=company, year=year)
+    
+    # ==================== 深度搜索 ====================
+    
+    async def fetch_page_text(self, url: str, max_bytes: int = 512 * 1024, timeout: float = 8.0) -> str:
+        """抓取结果页并提取正文；超过 max_bytes 的部分直接丢弃，整体耗时不超过 timeout 秒"""
+        # 百度的 /link 跳转同样计入百度的限流额度
+        await get_rate_limiter(urlsplit(url).netloc).acquire_async()
+        if HAS_AIOHTTP:
+            raw, charset = await asyncio.wait_for(self._read_page_async(url, max_bytes), timeout)
+        else:
+            raw, charset = await asyncio.to_thread(self._read_page, url, max_bytes, timeout)
+        if not raw:
+            return ""
+        html = self._decode_html(raw, charset)
+        return await asyncio.to_thread(self._extract_main_text, html)
+    
+    async def _read_page_async(self, url: str, max_bytes: int) -> Tuple[bytes, Optional[str]]:
+        session = await self._get_http_session()
+        async with session.get(url, allow_redirects=True) as response:
+            if response.status >= 400 or "html" not in response.headers.get("Content-Type", "text/html"):
+                return b"", None
+            buffer = bytearray()
+            async for block in response.content.iter_chunked(64 * 1024):
+                buffer.extend(block)
+                if len(buffer) >= max_bytes:
+                    break
+            return bytes(buffer[:max_bytes]), response.charset
+    
+    def _read_page(self, url: str, max_bytes: int, timeout: float) -> Tuple[bytes, Optional[str]]:
+        deadline = time.monotonic() + timeout
+        with self.session.get(url, stream=True, timeout=(self.connect_timeout, self.read_timeout)) as response:
+            if response.status_code >= 400 or "html" not in response.headers.get("Content-Type", "text/html"):
+                return b"", None
+            buffer = bytearray()
+            for block in response.iter_content(64 * 1024):
+                buffer.extend(block)
+                if len(buffer) >= max_bytes or time.monotonic() > deadline:
+                    break
+            charset = requests.utils.get_encoding_from_headers(response.headers)
+            # 未声明编码时 requests 默认 ISO-8859-1，交给 meta 标签判断
+            return bytes(buffer[:max_bytes]), None if charset == "ISO-8859-1" else charset
+    
+    @staticmethod
+    def _decode_html(raw: bytes, charset: Optional[str]) -> str:
+        """按响应头或 meta 标签声明的编码解码，国内站点常见 gbk/gb2312"""
+        if not charset:
+            match = re.search(rb'<meta[^>]+charset=["\']?([\w-]+)', raw[:4096], re.IGNORECASE)
+            charset = match.group(1).decode("ascii") if match else "utf-8"
+        if charset.lower() in ("gb2312", "gbk"):
+            charset = "gb18030"
+        try:
+            return raw.decode(charset, errors="replace")
+        except LookupError:
+            return raw.decode("utf-8", errors="replace")
+    
+    _NOISE_TAGS = ("script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe")
+    _BLOCK_TAGS = ("p", "h1", "h2", "h3", "li", "td", "pre", "blockquote")
+    
+    def _extract_main_text(self, html: str, min_block_chars: int = 15) -> str:
+        """提取正文：去掉脚本/导航等噪音后，保留足够长且链接文字占比低的段落"""
+        blocks = []
+        if HAS_LXML:
+            try:
+                tree = lxml.html.fromstring(html)
+            except Exception:
+                return ""
+            for elem in tree.xpath("|".join(f"//{tag}" for tag in self._NOISE_TAGS)):
+                elem.drop_tree()
+            for elem in tree.iter(*self._BLOCK_TAGS):
+                text = self._clean_text(elem.text_content())
+                link_chars = sum(len(a.text_content()) for a in elem.iter("a"))
+                blocks.append((text, link_chars))
+            fallback = tree.text_content()
+        else:
+            soup = BeautifulSoup(html, "html.parser")
+            for elem in soup(list(self._NOISE_TAGS)):
+                elem.decompose()
+            for elem in soup.find_all(list(self._BLOCK_TAGS)):
+                text = self._clean_text(elem.get_text())
+                link_chars = sum(len(a.get_text()) for a in elem.find_all("a"))
+                blocks.append((text, link_chars))
+            fallback = soup.get_text("\n")
+        
+        seen = set()
+        paragraphs = []
+        for text, link_chars in blocks:
+            if len(text) < min_block_chars or text in seen or link_chars > len(text) * 0.5:
+                continue
+            seen.add(text)
+            paragraphs.append(text)
+        
+        # 很多站点正文直接写在 div 中，段落过少时按行取整页文本
+        if sum(len(p) for p in paragraphs) < 100:
+            lines = [self._clean_text(line) for line in fallback.splitlines()]
+            paragraphs = [line for line in lines if len(line) >= min_block_chars]
+        return "\n".join(paragraphs)
+    
+    @staticmethod
+    def _chunk_text(text: str, chunk_size: int = 300) -> List[str]:
+        """按句子切分正文，同一段落内的句子合并成不超过 chunk_size 字的片段（片段不跨段落）"""
+        chunks = []
+        for paragraph in text.split("\n"):
+            current = ""
+            for sentence in re.split(r'(?<=[。！？；!?;])', paragraph):
+                sentence = sentence.strip()[:chunk_size]
+                if not sentence:
+                    continue
+                if current and len(current) + len(sentence) > chunk_size:
+                    chunks.append(current)
+                    current = ""
+                current += sentence
+            if current:
+                chunks.append(current)
+        return chunks
+    
+    @staticmethod
+    def _relevance(text: str, query: str) -> float:
+        """查询与文本的字符二元组重合比例，含数字的片段略微加分（财务数据）"""
+        query_grams = char_bigrams(query)
+        if not query_grams:
+            return 0.0
+        score = len(query_grams & char_bigrams(text)) / len(query_grams)
+        if re.search(r'\d', text):
+            score += 0.1
+        return score
+    
+    def select_relevant_chunks(self, text: str, query: str, top_k: int = 2,
+                               min_score: float = 0.2, chunk_size: int = 300) -> List[str]:
+        scored = [(self._relevance(chunk, query), i, chunk)
+                  for i, chunk in enumerate(self._chunk_text(text, chunk_size))]
+        best = sorted((item for item in scored if item[0] >= min_score), reverse=True)[:top_k]
+        # 保持片段在原文中的顺序
+        return [chunk for _, _, chunk in sorted(best, key=lambda item: item[1])]
+    
+    async def deep_search(self, query: str, top_n: int = 3, chunks_per_page: int = 2,
+                          max_bytes: int = 512 * 1024, page_timeout: float = 8.0) -> List[Dict]:
+        """深度搜索：并发抓取前 top_n 个结果页，只保留与查询相关的正文片段（存入 evidence）"""
+        results = [dict(r) for r in await self.search_results(query)]
+        targets = [r for r in results if r.get("link") and r["source"] != "系统提示"][:top_n]
+        
+        async def enrich(result: Dict):
+            try:
+                text = await self.fetch_page_text(result["link"], max_bytes, page_timeout)
+            except Exception as e:
+                logger.warning(f"抓取正文失败 {result['link']}: {e!r}")
+                return
+            result["evidence"] = self.select_relevant_chunks(text, query, chunks_per_page)
+        
+        start = time.perf_counter()
+        await asyncio.gather(*[enrich(r) for r in targets])
+        fetched = sum(1 for r in targets if r.get("evidence"))
+        logger.info(f"深度搜索 '{query}': {fetched}/{len(targets)} 个页面提取到相关正文，耗时 {time.perf_counter() - start:.2f}s")
+        return results
+    
+    async def async_deep_search(self, query: str, top_n: int = 3) -> str:
+        results = await self.deep_search(query, top_n=top_n)
         return self.format_search_results(results, query)
 
-# 创建全局实例
-baidu_agent = BaiduSearchAgent()
+
+def _simhash(text: str) -> int:
+    """64 位 simhash（特征为字符二元组），相似文本的指纹汉明距离小"""
+    weights = [0] * 64
+    for gram in char_bigrams(text):
+        h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+# 搜索模式: live（默认，直连百度）/ record（直连并录制结果页）/ replay（连接本地回放服务，完全离线）
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "live")
+SEARCH_FIXTURE_DIR = os.environ.get("SEARCH_FIXTURE_DIR", "./local_data/search_pages")
+SEARCH_FIXTURE_URL = os.environ.get("SEARCH_FIXTURE_URL", "http://127.0.0.1:8765/s")
+
+# 创建全局实例（缓存 TTL 可通过环境变量调整，单位秒）
+# record/replay 不使用结果缓存：录制时缓存命中会跳过抓取导致漏录，回放时
+# 会读到 live 模式的真实结果，回放结果也不应写回 live 模式共用的缓存
+baidu_agent = BaiduSearchAgent(
+    base_url=SEARCH_FIXTURE_URL if SEARCH_MODE == "replay" else "https://www.baidu.com/s",
+    recorder=SearchRecorder(SEARCH_FIXTURE_DIR) if SEARCH_MODE == "record" else None,
+    cache=SearchResultCache(
+        ttl=float(os.environ.get("SEARCH_CACHE_TTL", "3600")),
+        stale_ttl=float(os.environ.get("SEARCH_CACHE_STALE_TTL", "86400"))
+    ) if SEARCH_MODE == "live" else None,
+    rate_limit=float(os.environ.get("SEARCH_RATE_LIMIT", "2")),
+    result_token_budget=int(os.environ.get("SEARCH_RESULT_TOKENS", "1200")),
+)
 
 # 适配原有接口的函数
 async def search_market_info(query: str) -> str:
     """适配原有系统的搜索函数"""
     return await baidu_agent.async_search(query)
 
+async def search_market_info_many(
+    queries: Annotated[str, "多个搜索查询，用分号或换行分隔，例如 '美团 2024 财报; 美团 竞争对手; 本地生活 行业格局'"]
+) -> str:
+    """并发执行多个搜索查询，返回合并去重后的结果"""
+    query_list = [q for q in re.split(r'[;；\n]+', queries) if q.strip()]
+    results = await baidu_agent.search_many(query_list)
+    return baidu_agent.format_search_results(results, " | ".join(query_list))
+
+async def search_market_info_deep(
+    query: Annotated[str, "搜索查询，例如 '比亚迪 2024 海外销量'"]
+) -> str:
+    """深度搜索：除标题摘要外，还抓取排名靠前的网页正文，返回与查询相关的原文片段"""
+    top_n = int(os.environ.get("SEARCH_DEEP_TOP_N", "3"))
+    return await baidu_agent.async_deep_search(query, top_n=top_n)
+
 # 专门用于财务搜索的函数
 async def search_financial_info(company: str, year: str = "") -> str:
     """搜索公司财务信息"""
     search_query = f"{company} {year}年 财务报告 年报" if year else f"{company} 最新财务数据"
-    return await baidu_agent.async_search(search_query)
+    return await baidu_agent.async_search(search_query, company=company, year=year or None)
  
\ No newline at end of file